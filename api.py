@@ -1,19 +1,24 @@
 import os
+import json
 import uuid
-import shutil
-import tempfile
-import requests
+import asyncio
 from pathlib import Path
 from urllib.parse import urlparse
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, HttpUrl
 from typing import Optional
 from celery.result import AsyncResult
 
-from tasks import celery_app, process_video_task, get_job_progress
+from tasks import (celery_app, process_video_task, process_video_distributed_task, get_job_progress,
+                   cached_result, send_webhook, plan_sidecar_key)
+from options import RENDER_BACKENDS, RENDER_PROFILES
 import s3_storage
+import job_store
+from progress import ProgressHub
+from upload_stream import receive_upload
 
 app = FastAPI(
     title="AutoCrop-Vertical API",
@@ -30,9 +35,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Local temp directory for processing
-TEMP_DIR = Path(tempfile.gettempdir()) / "autocrop"
-TEMP_DIR.mkdir(exist_ok=True)
+# Input file types accepted by /process and /process-url
+INPUT_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm')
+
+# Job statuses after which an event stream closes
+FINAL_STATUSES = ('completed', 'failed', 'revoked')
+
+# Seconds an event stream waits for progress before re-checking the job state
+SSE_HEARTBEAT_SECONDS = 15
+
+# One Redis subscription shared by all event streams of this process
+progress_hub = ProgressHub()
 
 
 class ProcessRequest(BaseModel):
@@ -56,54 +69,167 @@ class JobStatusResponse(BaseModel):
 class ProcessUrlRequest(BaseModel):
     url: HttpUrl
     webhook_url: Optional[HttpUrl] = None
+    render_backend: str = 'python'
+    render_profile: str = 'default'
+    distributed: bool = False
+
+
+def validate_render_backend(render_backend: str):
+    if render_backend not in RENDER_BACKENDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid render backend. Supported: {', '.join(RENDER_BACKENDS)}"
+        )
+
+
+def validate_render_profile(render_profile: str):
+    if render_profile not in RENDER_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid render profile. Supported: {', '.join(RENDER_PROFILES)}"
+        )
+
+
+def queue_job(job_id: str, input_s3_key: str, output_s3_key: str, webhook_url: Optional[str],
+              render_backend: str, distributed: bool, content_hash: Optional[str] = None,
+              plan_s3_key: Optional[str] = None, source_url: Optional[str] = None,
+              render_profile: str = 'default'):
+    """
+    Queues a job, either on one worker or split into chunks across workers.
+
+    The job's metadata is recorded first, so retries and deletes can find its
+    objects without probing S3. Both writes block, so handlers run this with
+    s3_storage.run_async.
+    """
+    job_store.save(job_id, {
+        'input_s3_key': input_s3_key,
+        'ext': Path(input_s3_key).suffix,
+        'output_s3_key': output_s3_key,
+        'plan_s3_key': plan_sidecar_key(output_s3_key),
+        'content_hash': content_hash,
+        'params': {'webhook_url': webhook_url, 'render_backend': render_backend, 'render_profile': render_profile,
+                   'distributed': distributed, 'source_plan_s3_key': plan_s3_key, 'source_url': source_url}
+    })
+    task = process_video_distributed_task if distributed else process_video_task
+    return task.apply_async(
+        args=[input_s3_key, output_s3_key, webhook_url],
+        kwargs={'render_backend': render_backend, 'content_hash': content_hash, 'plan_s3_key': plan_s3_key,
+                'source_url': source_url, 'render_profile': render_profile},
+        task_id=job_id
+    )
+
+
+def resolve_cached_job(job_id: str, content_hash: str, render_backend: str, webhook_url: Optional[str],
+                       distributed: bool = False, render_profile: str = 'default'):
+    """
+    Completes a job immediately if an identical input was already processed.
+
+    The job's result points at the existing output instead of a new copy.
+
+    Returns:
+        JobResponse for a completed job, or None on a cache miss
+    """
+    result = cached_result(job_id, content_hash, render_backend, render_profile)
+    if result is None:
+        return None
+
+    # The job owns no objects; its metadata points at those of the original job
+    job_store.save(job_id, {
+        'input_s3_key': result.get('input_s3_key'),
+        'ext': Path(result['input_s3_key']).suffix if result.get('input_s3_key') else None,
+        'output_s3_key': result['output_s3_key'],
+        'plan_s3_key': result.get('plan_s3_key'),
+        'content_hash': content_hash,
+        'params': {'webhook_url': webhook_url, 'render_backend': render_backend, 'render_profile': render_profile,
+                   'distributed': distributed}
+    })
+
+    if webhook_url:
+        send_webhook(webhook_url, {'job_id': job_id, 'status': 'completed', 'result': result}, result)
+    celery_app.backend.store_result(job_id, result, 'SUCCESS')
+
+    return JobResponse(
+        job_id=job_id,
+        status="completed",
+        message="Identical video already processed"
+    )
 
 
-@app.post("/process", response_model=JobResponse)
+@app.post("/process", response_model=JobResponse, openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {
+                "file": {"type": "string", "format": "binary"},
+                "webhook_url": {"type": "string"}
+            }
+        }}}
+    }
+})
 async def process_video_endpoint(
-    file: UploadFile = File(...),
-    webhook_url: Optional[str] = None
+    request: Request,
+    webhook_url: Optional[str] = None,
+    render_backend: str = 'python',
+    distributed: bool = False,
+    render_profile: str = 'default'
 ):
     """
     Upload a video for processing.
 
     Returns a job_id that can be used to check status and download the result.
-    Optionally provide a webhook_url to receive results when processing completes.
+    Optionally provide a webhook_url to receive results when processing completes,
+    and a render_backend ('python' or 'ffmpeg') to choose the frame renderer.
+    Set distributed=true to render chunks of the video on several workers at once.
+    A render_profile ('default', 'social-1080', 'draft-540' or 'archive') caps the
+    output height and sets the encoder settings.
+
+    The file is streamed straight into S3 as it arrives, without touching local disk.
     """
-    # Validate file type
-    if not file.filename.lower().endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm')):
-        raise HTTPException(status_code=400, detail="Invalid file type. Supported: mp4, mov, avi, mkv, webm")
+    validate_render_backend(render_backend)
+    validate_render_profile(render_profile)
 
     # Generate unique job ID
     job_id = str(uuid.uuid4())
 
-    # Define S3 keys
-    ext = Path(file.filename).suffix
-    input_s3_key = f"inputs/{job_id}_input{ext}"
-    output_s3_key = f"outputs/{job_id}_output.mp4"
-
-    # Save to temp file first
-    temp_input = TEMP_DIR / f"{job_id}_input{ext}"
+    def input_key_for(filename):
+        # Validate file type
+        if not filename.lower().endswith(INPUT_EXTENSIONS):
+            raise HTTPException(status_code=400, detail="Invalid file type. Supported: mp4, mov, avi, mkv, webm")
+        return f"inputs/{job_id}_input{Path(filename).suffix}"
 
     try:
-        with open(temp_input, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        received = await receive_upload(request, input_key_for)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to upload file to S3: {str(e)}")
 
-        # Upload to S3
-        if not s3_storage.upload_file(str(temp_input), input_s3_key):
-            raise HTTPException(status_code=500, detail="Failed to upload file to S3")
+    webhook_url = webhook_url or received['fields'].get('webhook_url') or None
+    content_hash = received['content_hash']
+    input_s3_key = received['key']
+    output_s3_key = f"outputs/{job_id}_output.mp4"
 
-        # Clean up temp file
-        temp_input.unlink()
+    cached_response = await s3_storage.run_async(
+        resolve_cached_job, job_id, content_hash, render_backend, webhook_url, distributed, render_profile
+    )
+    if cached_response:
+        await s3_storage.run_async(received['upload'].abort)
+        return cached_response
 
+    try:
+        await s3_storage.run_async(received['upload'].complete, received['parts'], {'sha256': content_hash})
     except Exception as e:
-        if temp_input.exists():
-            temp_input.unlink()
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+        await s3_storage.run_async(received['upload'].abort)
+        raise HTTPException(status_code=500, detail=f"Failed to upload file to S3: {str(e)}")
 
     # Queue the processing task with S3 keys
-    task = process_video_task.apply_async(
-        args=[input_s3_key, output_s3_key, webhook_url],
-        task_id=job_id
+    await s3_storage.run_async(
+        queue_job, job_id, input_s3_key, output_s3_key, webhook_url, render_backend, distributed, content_hash,
+        render_profile=render_profile
     )
 
     return JobResponse(
@@ -118,16 +244,20 @@ async def process_video_from_url(request: ProcessUrlRequest):
     """
     Process a video from a URL (e.g., S3, cloud storage).
 
-    Downloads the video from the provided URL and queues it for processing.
-    Optionally provide a webhook_url to receive results when processing completes.
+    Queues the video for processing and returns immediately; the worker downloads
+    it from the provided URL. Optionally provide a webhook_url to receive results
+    when processing completes.
     """
+    validate_render_backend(request.render_backend)
+    validate_render_profile(request.render_profile)
+
     # Parse URL to get filename and extension
     parsed_url = urlparse(str(request.url))
     url_path = parsed_url.path
 
     # Try to get extension from URL path
     ext = Path(url_path).suffix.lower()
-    if ext not in ['.mp4', '.mov', '.avi', '.mkv', '.webm']:
+    if ext not in INPUT_EXTENSIONS:
         # Default to .mp4 if we can't determine extension
         ext = '.mp4'
 
@@ -138,48 +268,22 @@ async def process_video_from_url(request: ProcessUrlRequest):
     input_s3_key = f"inputs/{job_id}_input{ext}"
     output_s3_key = f"outputs/{job_id}_output.mp4"
 
-    # Download file from URL to temp
-    temp_input = TEMP_DIR / f"{job_id}_input{ext}"
-
-    try:
-        response = requests.get(str(request.url), stream=True, timeout=300)
-        response.raise_for_status()
-
-        with open(temp_input, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        # Upload to S3
-        if not s3_storage.upload_file(str(temp_input), input_s3_key):
-            raise HTTPException(status_code=500, detail="Failed to upload file to S3")
-
-        # Clean up temp file
-        temp_input.unlink()
-
-    except requests.exceptions.RequestException as e:
-        if temp_input.exists():
-            temp_input.unlink()
-        raise HTTPException(status_code=400, detail=f"Failed to download video: {str(e)}")
-
-    # Queue the processing task
+    # The worker fetches the video, so a slow origin never holds up the API
     webhook_url = str(request.webhook_url) if request.webhook_url else None
-    task = process_video_task.apply_async(
-        args=[input_s3_key, output_s3_key, webhook_url],
-        task_id=job_id
+    await s3_storage.run_async(
+        queue_job, job_id, input_s3_key, output_s3_key, webhook_url, request.render_backend, request.distributed,
+        source_url=str(request.url), render_profile=request.render_profile
     )
 
     return JobResponse(
         job_id=job_id,
         status="queued",
-        message="Video downloaded and queued for processing"
+        message="Video queued for download and processing"
     )
 
 
-@app.get("/status/{job_id}", response_model=JobStatusResponse)
-async def get_status(job_id: str):
-    """
-    Get the status of a processing job.
-    """
+def job_status(job_id: str) -> JobStatusResponse:
+    """Reads a job's state and progress from the Celery result backend; blocking."""
     task_result = AsyncResult(job_id, app=celery_app)
 
     if task_result.state == 'PENDING':
@@ -222,24 +326,89 @@ async def get_status(job_id: str):
         )
 
 
+def job_result(job_id: str) -> tuple:
+    """Reads a job's state, and its result once it succeeded, from the Celery result backend; blocking."""
+    task_result = AsyncResult(job_id, app=celery_app)
+    state = task_result.state
+    return state, (task_result.result or {}) if state == 'SUCCESS' else None
+
+
+@app.get("/status/{job_id}", response_model=JobStatusResponse)
+async def get_status(job_id: str):
+    """
+    Get the status of a processing job.
+
+    The result backend lookups run off the event loop, so polling clients and
+    status streams never stall other requests.
+    """
+    return await s3_storage.run_async(job_status, job_id)
+
+
+def format_event(status: "JobStatusResponse") -> str:
+    """Formats a job status as a server-sent event named after the status."""
+    return f"event: {status.status}\ndata: {json.dumps(jsonable_encoder(status))}\n\n"
+
+
+@app.get("/status/{job_id}/events")
+async def stream_status(job_id: str):
+    """
+    Stream the status of a processing job as server-sent events.
+
+    Sends the current status, then every progress update published by the
+    worker, and closes once the job has completed, failed or been revoked.
+    """
+    async def events():
+        listener = progress_hub.subscribe(job_id)
+        try:
+            status = await get_status(job_id)
+            yield format_event(status)
+
+            while status.status not in FINAL_STATUSES:
+                try:
+                    update = await asyncio.wait_for(listener.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    update = None
+
+                if update is not None and 'status' not in update:
+                    status = JobStatusResponse(job_id=job_id, status="processing", progress=update)
+                else:
+                    # Idle or finished: read the stored state. The result is stored
+                    # just after the worker announces the end, so allow it a moment.
+                    status = await get_status(job_id)
+                    for _ in range(10):
+                        if update is None or status.status in FINAL_STATUSES:
+                            break
+                        await asyncio.sleep(0.2)
+                        status = await get_status(job_id)
+                yield format_event(status)
+        finally:
+            progress_hub.unsubscribe(job_id, listener)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/download/{job_id}")
 async def download_result(job_id: str):
     """
     Download the processed video via presigned S3 URL.
     """
     # Check if job is complete
-    task_result = AsyncResult(job_id, app=celery_app)
+    state, result = await s3_storage.run_async(job_result, job_id)
 
-    if task_result.state != 'SUCCESS':
+    if state != 'SUCCESS':
         raise HTTPException(
             status_code=400,
-            detail=f"Job not complete. Current status: {task_result.state}"
+            detail=f"Job not complete. Current status: {state}"
         )
 
-    # Generate presigned URL for output
-    output_s3_key = f"outputs/{job_id}_output.mp4"
+    # Generate presigned URL for output; cached jobs point at another job's output
+    output_s3_key = result.get('output_s3_key', f"outputs/{job_id}_output.mp4")
 
-    if not s3_storage.file_exists(output_s3_key):
+    if not await s3_storage.run_async(s3_storage.file_exists, output_s3_key):
         raise HTTPException(status_code=404, detail="Output file not found")
 
     # Redirect to presigned URL (1 hour expiry)
@@ -251,45 +420,74 @@ async def download_result(job_id: str):
     return RedirectResponse(url=presigned_url)
 
 
+def legacy_input_key(job_id: str) -> Optional[str]:
+    """Finds the input of a job queued before job metadata was recorded."""
+    for ext in INPUT_EXTENSIONS:
+        potential_key = f"inputs/{job_id}_input{ext}"
+        if s3_storage.file_exists(potential_key):
+            return potential_key
+    return None
+
+
 @app.post("/retry/{job_id}")
-async def retry_job(job_id: str, webhook_url: Optional[str] = None):
+async def retry_job(job_id: str, webhook_url: Optional[str] = None, render_backend: Optional[str] = None,
+                    distributed: Optional[bool] = None, render_profile: Optional[str] = None):
     """
     Retry a failed job by re-queuing it with the same input file.
+
+    Parameters that are not given are taken from the original job. A URL job
+    whose input never reached S3 fetches its source URL again, and a retried
+    re-render again renders from its source scene plan.
     """
-    # Find the input file in S3
-    input_s3_key = None
-    for ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm']:
-        potential_key = f"inputs/{job_id}_input{ext}"
-        if s3_storage.file_exists(potential_key):
-            input_s3_key = potential_key
-            break
+    metadata = await s3_storage.run_async(job_store.get, job_id)
+    if metadata:
+        input_s3_key = metadata['input_s3_key']
+        content_hash = metadata.get('content_hash')
+        params = metadata.get('params', {})
+    else:
+        input_s3_key = await s3_storage.run_async(legacy_input_key, job_id)
+        content_hash = None
+        params = {}
 
     if not input_s3_key:
         raise HTTPException(status_code=404, detail="Input file not found. Cannot retry.")
 
+    webhook_url = webhook_url or params.get('webhook_url')
+    render_backend = render_backend or params.get('render_backend', 'python')
+    render_profile = render_profile or params.get('render_profile', 'default')
+    distributed = params.get('distributed', False) if distributed is None else distributed
+    validate_render_backend(render_backend)
+    validate_render_profile(render_profile)
+
     # Generate new job ID
     new_job_id = str(uuid.uuid4())
 
-    # Copy input to new key in S3
+    # A /process-url job whose fetch failed has no input object; its worker fetches the URL again
+    source_url = params.get('source_url')
+    if source_url and await s3_storage.run_async(s3_storage.file_exists, input_s3_key):
+        source_url = None
+
+    # Inputs uploaded by /process and /process-url carry their content hash
+    if not source_url and not content_hash:
+        content_hash = (await s3_storage.run_async(s3_storage.get_tags, input_s3_key) or {}).get('sha256')
+    cached_response = await s3_storage.run_async(
+        resolve_cached_job, new_job_id, content_hash, render_backend, webhook_url, distributed, render_profile
+    )
+    if cached_response:
+        return cached_response
+
+    # Copy input to new key, server-side, so deleting either job leaves the other intact
     ext = Path(input_s3_key).suffix
     new_input_s3_key = f"inputs/{new_job_id}_input{ext}"
     output_s3_key = f"outputs/{new_job_id}_output.mp4"
 
-    # Download old input and re-upload with new key
-    temp_file = TEMP_DIR / f"{new_job_id}_temp{ext}"
-    try:
-        s3_storage.download_file(input_s3_key, str(temp_file))
-        s3_storage.upload_file(str(temp_file), new_input_s3_key)
-        temp_file.unlink()
-    except Exception as e:
-        if temp_file.exists():
-            temp_file.unlink()
-        raise HTTPException(status_code=500, detail=f"Failed to copy input file: {str(e)}")
-
-    # Queue the processing task
-    task = process_video_task.apply_async(
-        args=[new_input_s3_key, output_s3_key, webhook_url],
-        task_id=new_job_id
+    if not source_url and not await s3_storage.run_async(s3_storage.copy_file, input_s3_key, new_input_s3_key):
+        raise HTTPException(status_code=500, detail="Failed to copy input file")
+
+    # Queue the processing task; a retried re-render stays render-only
+    await s3_storage.run_async(
+        queue_job, new_job_id, new_input_s3_key, output_s3_key, webhook_url, render_backend, distributed,
+        content_hash, params.get('source_plan_s3_key'), source_url, render_profile=render_profile
     )
 
     return JobResponse(
@@ -299,22 +497,72 @@ async def retry_job(job_id: str, webhook_url: Optional[str] = None):
     )
 
 
+@app.post("/rerender/{job_id}")
+async def rerender_job(job_id: str, webhook_url: Optional[str] = None, render_backend: str = 'python',
+                       distributed: bool = False, render_profile: str = 'default'):
+    """
+    Re-render a completed job from its saved scene plan.
+
+    Scene detection and person analysis are skipped; only the render runs, for
+    example to produce the same video with another render_profile.
+    """
+    validate_render_backend(render_backend)
+    validate_render_profile(render_profile)
+
+    state, result = await s3_storage.run_async(job_result, job_id)
+    if state != 'SUCCESS':
+        raise HTTPException(
+            status_code=400,
+            detail=f"Job not complete. Current status: {state}"
+        )
+
+    input_s3_key = result.get('input_s3_key')
+    plan_s3_key = result.get('plan_s3_key')
+    if not input_s3_key or not plan_s3_key or not await s3_storage.run_async(s3_storage.file_exists, plan_s3_key):
+        raise HTTPException(status_code=404, detail="Scene plan not found. Cannot re-render.")
+
+    new_job_id = str(uuid.uuid4())
+
+    content_hash = (await s3_storage.run_async(s3_storage.get_tags, input_s3_key) or {}).get('sha256')
+    cached_response = await s3_storage.run_async(
+        resolve_cached_job, new_job_id, content_hash, render_backend, webhook_url, distributed, render_profile
+    )
+    if cached_response:
+        return cached_response
+
+    output_s3_key = f"outputs/{new_job_id}_output.mp4"
+    await s3_storage.run_async(
+        queue_job, new_job_id, input_s3_key, output_s3_key, webhook_url, render_backend, distributed, content_hash,
+        plan_s3_key, render_profile=render_profile
+    )
+
+    return JobResponse(
+        job_id=new_job_id,
+        status="queued",
+        message="Job queued for re-rendering"
+    )
+
+
 @app.delete("/job/{job_id}")
 async def delete_job(job_id: str):
     """
     Delete a job and its associated files.
     """
-    # Remove input file from S3
-    for ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm']:
-        input_key = f"inputs/{job_id}_input{ext}"
-        s3_storage.delete_file(input_key)
+    metadata = await s3_storage.run_async(job_store.get, job_id)
+    if metadata:
+        # Cached and re-rendered jobs point at another job's objects; only this job's own are removed
+        keys = [key for key in (metadata['input_s3_key'], metadata['output_s3_key'], metadata['plan_s3_key'])
+                if key and Path(key).name.startswith(f"{job_id}_")]
+    else:
+        keys = [f"inputs/{job_id}_input{ext}" for ext in INPUT_EXTENSIONS]
+        keys += [f"outputs/{job_id}_output.mp4", f"outputs/{job_id}_output.plan.json"]
 
-    # Remove output file from S3
-    output_key = f"outputs/{job_id}_output.mp4"
-    s3_storage.delete_file(output_key)
+    # Remove input, output and scene plan from S3 in one request
+    await s3_storage.run_async(s3_storage.delete_files, keys)
+    await s3_storage.run_async(job_store.delete, job_id)
 
     # Revoke task if still pending
-    celery_app.control.revoke(job_id, terminate=True)
+    await s3_storage.run_async(celery_app.control.revoke, job_id, terminate=True)
 
     return {"message": f"Job {job_id} deleted"}
 
@@ -0,0 +1,57 @@
+"""
+Measures per-scene analysis latency at different analysis resolutions.
+
+Detects the scenes of a video once, then runs the batched scene analysis for
+each ANALYSIS_SIZE given (0 = full resolution) and reports the seconds per
+scene and the share of person boxes that agree with the first size listed
+(IoU >= 0.5 in source coordinates). Models are loaded and warmed up before
+timing.
+
+Usage:
+    python -m benchmarks.analysis --video clip.mp4 [--sizes 0,1280,640]
+"""
+import time
+import argparse
+
+import processor
+from benchmarks.box_matching import agreement
+
+MATCH_IOU = 0.5
+
+
+def person_boxes(analyses):
+    """The person boxes of each scene's analysis."""
+    return [[obj['person_box'] for obj in objects] for objects in analyses]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scene analysis at different resolutions.")
+    parser.add_argument('--video', required=True, help="Video to analyze.")
+    parser.add_argument('--sizes', default='0,640', help="Comma-separated ANALYSIS_SIZE values (0 = full size).")
+    args = parser.parse_args()
+
+    scenes, _ = processor.detect_scenes(args.video)
+    width, height = processor.get_video_resolution(args.video)
+    print(f"{width}x{height}, {len(scenes)} scenes")
+    processor.warm_up_models()
+
+    reference = None
+    for size in (int(value) for value in args.sizes.split(',')):
+        processor.ANALYSIS_SIZE = size
+        start = time.perf_counter()
+        analyses = processor.analyze_scenes(args.video, scenes)
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference = analyses
+            matched = 'reference'
+        else:
+            share = agreement(person_boxes(reference), person_boxes(analyses), MATCH_IOU)
+            matched = f"{share:.1%} person boxes matched"
+        label = 'full size' if not size else f"{size} px"
+        people = sum(len(objects) for objects in analyses)
+        faces = sum(obj['face_box'] is not None for objects in analyses for obj in objects)
+        print(f"{label:<10} {seconds / len(scenes) * 1000:8.1f} ms/scene  {people} people, {faces} faces, {matched}")
+
+
+if __name__ == '__main__':
+    main()
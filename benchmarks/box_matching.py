@@ -0,0 +1,28 @@
+"""
+Box agreement shared by the benchmarks that compare detections of two runs.
+"""
+
+
+def iou(a, b):
+    """Intersection over union of two [x1, y1, x2, y2] boxes."""
+    width = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union else 0
+
+
+def agreement(reference, boxes, min_iou):
+    """
+    Fraction of boxes, over both runs, that have a counterpart in the other.
+
+    reference and boxes hold one list of boxes per frame (or scene); a box has a
+    counterpart when a box of the same frame in the other run overlaps it with
+    IoU >= min_iou.
+    """
+    matched = total = 0
+    for frame_reference, frame_boxes in zip(reference, boxes):
+        for ours, theirs in ((frame_reference, frame_boxes), (frame_boxes, frame_reference)):
+            total += len(ours)
+            matched += sum(any(iou(box, other) >= min_iou for other in theirs) for box in ours)
+    return matched / total if total else 1.0
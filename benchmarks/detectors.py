@@ -0,0 +1,122 @@
+"""
+Compares the person detector backends on a fixed set of frames.
+
+Samples frames evenly from a video (or generates a seeded synthetic set), then
+runs each backend in a fresh interpreter and reports model load time, per-batch
+latency (median and p95 after a warm-up batch), throughput and peak RSS. Boxes
+are compared with the first backend listed: a box counts as matched when a box
+of the other backend overlaps it with IoU >= 0.9.
+
+Backends are 'torch[=<weights>]' or 'onnx=<model path>', e.g. an FP32 and an
+INT8 export from `python -m detectors`.
+
+Usage:
+    python -m benchmarks.detectors [--video clip.mp4] [--frames 64] [--batch-size 16] [--threads 4]
+                                   [--backends torch,onnx=yolov8n.onnx,onnx=yolov8n_int8.onnx]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+from benchmarks.box_matching import agreement
+
+MATCH_IOU = 0.9
+
+PROBE = '''
+import json, resource, sys, time
+import numpy as np
+import detectors
+frames = list(np.load({frames_path!r}))
+start = time.perf_counter()
+if {backend!r} == 'torch':
+    detector = detectors.TorchDetector({model_path!r} or detectors.YOLO_WEIGHTS, threads={threads})
+else:
+    detector = detectors.OnnxDetector({model_path!r}, threads={threads})
+detector.detect(frames[:{batch_size}])
+load_seconds = time.perf_counter() - start
+boxes, latencies = [], []
+for i in range(0, len(frames), {batch_size}):
+    start = time.perf_counter()
+    boxes.extend(detector.detect(frames[i:i + {batch_size}]))
+    latencies.append(time.perf_counter() - start)
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'load_seconds': load_seconds, 'latencies': latencies, 'rss_mb': rss_kb / 1024,
+                  'boxes': boxes}}))
+'''
+
+
+def sample_frames(video, count, size):
+    """Frames spread evenly over a video, or seeded noise with bright blocks when no video is given."""
+    if video is None:
+        rng = np.random.default_rng(0)
+        frames = rng.integers(0, 255, (count, size[1], size[0], 3), dtype=np.uint8)
+        for frame in frames:
+            x, y = rng.integers(0, size[0] // 2), rng.integers(0, size[1] // 2)
+            frame[y:y + size[1] // 2, x:x + size[0] // 8] = 200
+        return frames
+
+    import cv2
+    cap = cv2.VideoCapture(video)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    for frame_number in np.linspace(0, max(total - 1, 0), count).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(frame_number))
+        ret, frame = cap.read()
+        if ret:
+            frames.append(frame)
+    cap.release()
+    return np.stack(frames)
+
+
+def run(backend, frames_path, batch_size, threads):
+    name, _, model_path = backend.partition('=')
+    probe = PROBE.format(frames_path=frames_path, backend=name, model_path=model_path,
+                         threads=threads, batch_size=batch_size)
+    completed = subprocess.run([sys.executable, '-c', probe], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if completed.returncode != 0:
+        print(completed.stderr)
+        sys.exit(completed.returncode)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the person detector backends.")
+    parser.add_argument('--video', default=None, help="Video to sample frames from (synthetic frames if omitted).")
+    parser.add_argument('--frames', type=int, default=64, help="Number of frames in the set.")
+    parser.add_argument('--size', default='1280x720', help="Synthetic frame size.")
+    parser.add_argument('--batch-size', type=int, default=16, help="Frames per detector call.")
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1, help="Inference threads.")
+    parser.add_argument('--backends', default='torch,onnx=yolov8n.onnx',
+                        help="Comma-separated backends: 'torch[=<weights>]' or 'onnx=<model path>'.")
+    args = parser.parse_args()
+
+    size = tuple(int(value) for value in args.size.split('x'))
+    frames = sample_frames(args.video, args.frames, size)
+    print(f"{len(frames)} frames of {frames.shape[2]}x{frames.shape[1]}, "
+          f"batches of {args.batch_size}, {args.threads} threads")
+
+    reference = None
+    with tempfile.TemporaryDirectory() as temp_dir:
+        frames_path = os.path.join(temp_dir, 'frames.npy')
+        np.save(frames_path, frames)
+        for backend in args.backends.split(','):
+            report = run(backend, frames_path, args.batch_size, args.threads)
+            latencies = np.array(report['latencies'])
+            fps = len(frames) / sum(report['latencies'])
+            if reference is None:
+                reference = report['boxes']
+                matched = 'reference'
+            else:
+                matched = f"{agreement(reference, report['boxes'], MATCH_IOU):.1%} boxes matched"
+            print(f"{backend:<32} load {report['load_seconds']:6.2f}s  batch p50 {np.median(latencies):6.3f}s "
+                  f"p95 {np.percentile(latencies, 95):6.3f}s  {fps:6.1f} fps  peak RSS {report['rss_mb']:5.0f} MB  "
+                  f"{sum(len(boxes) for boxes in report['boxes'])} boxes, {matched}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Reports the import time and memory of a module, to guard web-process startup.
+
+Imports the module in a fresh interpreter, then prints the wall time, the
+resident memory afterwards, the slowest imports (from `python -X importtime`)
+and which heavy packages got loaded. Exits non-zero when a limit is exceeded
+or a forbidden package was imported, so it can run as a CI check.
+
+Usage:
+    python -m benchmarks.import_time [--module api] [--max-seconds 3] [--max-rss-mb 300]
+                                     [--forbid torch,ultralytics,cv2]
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+HEAVY_PACKAGES = ('torch', 'ultralytics', 'cv2', 'scenedetect', 'numpy')
+
+PROBE = '''
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': seconds, 'rss_mb': rss_kb / 1024,
+                  'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure a module's import time and memory.")
+    parser.add_argument('--module', default='api', help="Module to import.")
+    parser.add_argument('--max-seconds', type=float, default=None, help="Fail above this import time.")
+    parser.add_argument('--max-rss-mb', type=float, default=None, help="Fail above this peak RSS.")
+    parser.add_argument('--forbid', default='torch,ultralytics',
+                        help="Comma-separated packages the module must not import.")
+    parser.add_argument('--top', type=int, default=10, help="Number of slowest imports to list.")
+    args = parser.parse_args()
+
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=args.module, heavy=HEAVY_PACKAGES)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if completed.returncode != 0:
+        print(completed.stderr)
+        sys.exit(completed.returncode)
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    # importtime lines: "import time: self [us] | cumulative | imported package"
+    imports = []
+    for line in completed.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            imports.append((int(fields[1]), fields[2].rstrip()))
+    imports.sort(reverse=True)
+
+    print(f"import {args.module}: {report['seconds']:.2f}s, peak RSS {report['rss_mb']:.0f} MB")
+    print(f"heavy packages loaded: {', '.join(report['loaded']) or 'none'}")
+    print("slowest imports (cumulative):")
+    for microseconds, name in imports[:args.top]:
+        print(f"  {microseconds / 1e6:7.3f}s {name}")
+
+    failures = []
+    if args.max_seconds is not None and report['seconds'] > args.max_seconds:
+        failures.append(f"import took {report['seconds']:.2f}s (limit {args.max_seconds}s)")
+    if args.max_rss_mb is not None and report['rss_mb'] > args.max_rss_mb:
+        failures.append(f"peak RSS {report['rss_mb']:.0f} MB (limit {args.max_rss_mb} MB)")
+    forbidden = [name for name in args.forbid.split(',') if name and name in report['loaded']]
+    if forbidden:
+        failures.append(f"imported {', '.join(forbidden)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares the Python frame-loop renderer with the ffmpeg filtergraph renderer.
+
+Renders the same synthetic scene plan (alternating TRACK and LETTERBOX scenes)
+with both backends and reports wall time and frames per second.
+
+Usage:
+    python -m benchmarks.render_backends [--input video.mp4] [--size 1920x1080] [--duration 30]
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from ffmpeg_render import render_scene_plan
+from processor import (build_scene_plan, get_frame_count, get_output_size, get_video_resolution,
+                       render_python)
+
+
+def make_test_clip(path, size, duration, fps=30):
+    """Generates a synthetic test clip with ffmpeg's testsrc2 source."""
+    command = [
+        'ffmpeg', '-y', '-v', 'error', '-f', 'lavfi',
+        '-i', f'testsrc2=size={size}:rate={fps}:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', path
+    ]
+    subprocess.run(command, check=True)
+
+
+def make_scene_plan(total_frames, width, height, scene_length):
+    """Builds a scenes_analysis list alternating TRACK and LETTERBOX scenes."""
+    scenes_analysis = []
+    for i, start_frame in enumerate(range(0, total_frames, scene_length)):
+        if i % 2 == 0:
+            center_x = int(width * (0.2 + 0.6 * ((i // 2) % 5) / 4))
+            strategy, target_box = 'TRACK', [center_x - 50, 0, center_x + 50, height]
+        else:
+            strategy, target_box = 'LETTERBOX', None
+        scenes_analysis.append({
+            'start_frame': start_frame,
+            'end_frame': min(start_frame + scene_length, total_frames),
+            'analysis': [],
+            'strategy': strategy,
+            'target_box': target_box
+        })
+    return scenes_analysis
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the python and ffmpeg render backends.")
+    parser.add_argument('--input', type=str, help="Input video. A synthetic clip is generated if omitted.")
+    parser.add_argument('--size', type=str, default='1920x1080', help="Synthetic clip resolution.")
+    parser.add_argument('--duration', type=int, default=30, help="Synthetic clip duration in seconds.")
+    parser.add_argument('--scene-length', type=int, default=90, help="Frames per scene in the test plan.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_video = args.input
+        if not input_video:
+            input_video = os.path.join(work_dir, 'input.mp4')
+            make_test_clip(input_video, args.size, args.duration)
+
+        width, height = get_video_resolution(input_video)
+        total_frames = get_frame_count(input_video)
+        output_size = get_output_size(width, height)
+        scenes_analysis = make_scene_plan(total_frames, width, height, args.scene_length)
+        fps = 30
+
+        print(f"Input: {width}x{height}, {total_frames} frames, {len(scenes_analysis)} scenes")
+
+        start = time.time()
+        render_python(input_video, os.path.join(work_dir, 'python.mp4'), scenes_analysis, fps, output_size)
+        python_time = time.time() - start
+        print(f"python: {python_time:.2f}s ({total_frames / python_time:.1f} fps)")
+
+        start = time.time()
+        render_scene_plan(input_video, os.path.join(work_dir, 'ffmpeg.mp4'),
+                          build_scene_plan(scenes_analysis, width, height), (width, height), output_size)
+        ffmpeg_time = time.time() - start
+        print(f"ffmpeg: {ffmpeg_time:.2f}s ({total_frames / ffmpeg_time:.1f} fps)")
+
+        print(f"speedup: {python_time / ffmpeg_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
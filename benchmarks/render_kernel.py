@@ -0,0 +1,150 @@
+"""
+Compares the Python render kernel with the previous per-frame renderer.
+
+Renders synthetic frames with the TRACK and LETTERBOX strategies and reports
+frames per second and the memory allocated per frame, as the peak of
+transient allocations traced by tracemalloc (NumPy and OpenCV output arrays
+included) in units of one bgr24 output frame. Each frame is written to a pipe
+drained by `cat`, standing in for the encoder: the previous renderer copied
+frames with tobytes(), the kernel passes a memoryview of its pooled buffer.
+The kernel runs on bgr24 frames and on yuv420p planes.
+
+With --video, also renders that video end to end (decode, render, encode)
+with a fixed TRACK or LETTERBOX plan in both pixel formats and reports the
+frames per second.
+
+Usage:
+    python -m benchmarks.render_kernel [--size 1920x1080] [--frames 300] [--video clip.mp4]
+"""
+import os
+import time
+import tempfile
+import argparse
+import subprocess
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import processor
+from options import PIXEL_FORMATS
+
+
+def previous_render_frame(frame, scene_data, original_width, original_height, output_width, output_height):
+    """The renderer before RenderKernel: fresh arrays for every step, crop box recomputed per frame."""
+    if scene_data['strategy'] == 'TRACK':
+        crop_box = processor.calculate_crop_box(scene_data['target_box'], original_width, original_height)
+        processed_frame = frame[crop_box[1]:crop_box[3], crop_box[0]:crop_box[2]]
+        return cv2.resize(processed_frame, (output_width, output_height))
+
+    bg_scale = output_height / original_height
+    bg_width = int(original_width * bg_scale)
+    bg_frame = cv2.resize(frame, (bg_width, output_height))
+    x_offset = (bg_width - output_width) // 2
+    bg_frame = bg_frame[:, x_offset:x_offset + output_width]
+    small = cv2.resize(bg_frame, (output_width // 4, output_height // 4))
+    blurred_small = cv2.GaussianBlur(small, (25, 25), 0)
+    blurred_bg = cv2.resize(blurred_small, (output_width, output_height))
+
+    scale_factor = output_width / original_width
+    scaled_height = int(original_height * scale_factor)
+    scaled_frame = cv2.resize(frame, (output_width, scaled_height))
+
+    output_frame = blurred_bg.copy()
+    y_offset = (output_height - scaled_height) // 2
+    output_frame[y_offset:y_offset + scaled_height, :] = scaled_frame
+    return output_frame
+
+
+def measure(render, frames):
+    """Returns (frames per second, peak transient bytes per frame) of a render-and-hand-off callable."""
+    render(frames[0])
+    start = time.perf_counter()
+    for frame in frames:
+        render(frame)
+    fps = len(frames) / (time.perf_counter() - start)
+
+    tracemalloc.start()
+    peak = 0
+    for frame in frames[:50]:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        render(frame)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return fps, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Python render kernel.")
+    parser.add_argument('--size', default='1920x1080', help="Source frame size.")
+    parser.add_argument('--frames', type=int, default=300, help="Frames rendered per measurement.")
+    parser.add_argument('--video', default=None, help="Video to also render end to end in each pixel format.")
+    args = parser.parse_args()
+
+    width, height = (int(value) for value in args.size.split('x'))
+    output_width, output_height = processor.get_output_size(width, height)
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(8)]
+    yuv_frames = [processor.frame_buffer(width, height, 'yuv420p') for _ in range(8)]
+    for frame in yuv_frames:
+        frame[:] = rng.integers(0, 255, frame.shape, dtype=np.uint8)
+    frames = [frames[i % len(frames)] for i in range(args.frames)]
+    yuv_frames = [yuv_frames[i % len(yuv_frames)] for i in range(args.frames)]
+    frame_bytes = output_width * output_height * 3
+
+    kernel = processor.RenderKernel((width, height), (output_width, output_height))
+    yuv_kernel = processor.RenderKernel((width, height), (output_width, output_height), 'yuv420p')
+    sink = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    print(f"{width}x{height} -> {output_width}x{output_height}, {args.frames} frames")
+
+    for strategy in ('TRACK', 'LETTERBOX'):
+        scene_data = {'strategy': strategy, 'target_box': [width // 3, 0, width // 3 + 200, height]}
+        crop_box = processor.SceneCrops(width, height).crop_box(scene_data, 0)
+
+        def previous(frame):
+            output_frame = previous_render_frame(frame, scene_data, width, height, output_width, output_height)
+            sink.stdin.write(output_frame.tobytes())
+
+        def current(frame, kernel=kernel):
+            output_frame = kernel.render(frame, scene_data, crop_box)
+            sink.stdin.write(output_frame.data)
+            kernel.release(output_frame)
+
+        for label, render, inputs in (('previous', previous, frames), ('kernel', current, frames),
+                                      ('yuv420p', lambda frame: current(frame, yuv_kernel), yuv_frames)):
+            fps, peak = measure(render, inputs)
+            print(f"{strategy:<10} {label:<9} {fps:8.1f} fps  {peak / frame_bytes:5.2f} output frames allocated per frame")
+
+    sink.stdin.close()
+    sink.wait()
+
+    if args.video:
+        render_video(args.video)
+
+
+def render_video(video):
+    """Renders a whole video with render_python in each pixel format, one fixed strategy at a time."""
+    width, height = processor.get_video_resolution(video)
+    total_frames = processor.get_frame_count(video)
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    output_size = processor.get_output_size(width, height)
+    print(f"{video}: {width}x{height}, {total_frames} frames, decode + render + encode")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_path = os.path.join(temp_dir, 'output.mp4')
+        for strategy in ('TRACK', 'LETTERBOX'):
+            scenes = [{'start_frame': 0, 'end_frame': total_frames, 'strategy': strategy,
+                       'target_box': [width // 3, 0, width // 3 + 200, height]}]
+            for pixel_format in PIXEL_FORMATS:
+                start = time.perf_counter()
+                processor.render_python(video, output_path, scenes, fps, output_size, include_audio=False,
+                                        pixel_format=pixel_format)
+                seconds = time.perf_counter() - start
+                print(f"{strategy:<10} {pixel_format:<9} {total_frames / seconds:8.1f} fps")
+
+
+if __name__ == '__main__':
+    main()
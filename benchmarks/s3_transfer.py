@@ -0,0 +1,69 @@
+"""
+Measures S3 file upload and download throughput for different transfer settings.
+
+Writes a synthetic file, then uploads and downloads it once per combination of
+part size and concurrency, reporting MB/s and latency (time to the first bytes
+moved) from s3_storage's transfer metrics. boto3's default TransferConfig is
+included as a baseline. Point S3_ENDPOINT_URL at a local S3 stand-in (e.g.
+MinIO) to keep the data local, and raise S3_MAX_POOL_CONNECTIONS above the
+largest concurrency tried. Uploaded objects are deleted afterwards.
+
+Usage:
+    python -m benchmarks.s3_transfer [--size-mb 4096] [--part-sizes-mb 8,16,64] [--concurrency 4,10,32]
+"""
+import os
+import argparse
+import tempfile
+from boto3.s3.transfer import TransferConfig
+
+import s3_storage
+
+BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def write_file(path, size):
+    block = os.urandom(BLOCK_SIZE)
+    with open(path, 'wb') as f:
+        written = 0
+        while written < size:
+            f.write(block[:min(BLOCK_SIZE, size - written)])
+            written += BLOCK_SIZE
+
+
+def run(label, config, local_path, download_path, s3_key):
+    s3_storage.TRANSFER_CONFIG = config
+    upload, download = {}, {}
+    s3_storage.upload_file(local_path, s3_key, metrics=upload)
+    s3_storage.download_file(s3_key, download_path, metrics=download)
+    s3_storage.delete_file(s3_key)
+    for name, metrics in (('upload', upload), ('download', download)):
+        status = '' if metrics['ok'] else '  FAILED'
+        print(f"{label:<24} {name:<9} {metrics['mb_per_s']:>8} MB/s {metrics['seconds']:>8.2f}s "
+              f"latency {metrics['latency']}s{status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark S3 file transfers.")
+    parser.add_argument('--size-mb', type=int, default=4096, help="Size of the synthetic file.")
+    parser.add_argument('--part-sizes-mb', default='8,16,64', help="Comma-separated part sizes to try.")
+    parser.add_argument('--concurrency', default='4,10,32', help="Comma-separated concurrency levels to try.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        local_path = os.path.join(temp_dir, 'source.bin')
+        download_path = os.path.join(temp_dir, 'download.bin')
+        write_file(local_path, args.size_mb * 1024 * 1024)
+        s3_key = 'benchmarks/s3_transfer.bin'
+
+        print(f"{args.size_mb} MB file, connection pool of {s3_storage.S3_MAX_POOL_CONNECTIONS}")
+        run('boto3 defaults', TransferConfig(), local_path, download_path, s3_key)
+        for part_size_mb in (int(value) for value in args.part_sizes_mb.split(',')):
+            for concurrency in (int(value) for value in args.concurrency.split(',')):
+                part_size = part_size_mb * 1024 * 1024
+                config = TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                                        max_concurrency=concurrency)
+                run(f"{part_size_mb} MB x {concurrency}", config, local_path, download_path, s3_key)
+
+
+if __name__ == '__main__':
+    main()
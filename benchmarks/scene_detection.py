@@ -0,0 +1,103 @@
+"""
+Compares the scene detection backends.
+
+Generates a synthetic cut-heavy clip (scenes of 20-90 frames, each a moving
+gradient in its own colors over light noise), or takes a video, and runs every
+backend on it. Reports wall time, speedup over ContentDetector, and how well
+the cut points match ContentDetector's and, on synthetic clips, the true cuts:
+a cut is matched when the other list has one within --tolerance frames.
+
+Usage:
+    python -m benchmarks.scene_detection [--video clip.mp4] [--size 1280x720] [--scenes 60] [--tolerance 2]
+"""
+import os
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+from options import SCENE_DETECTORS
+from scene_detection import detect_scenes
+
+
+def make_cut_clip(path, size, scene_count, fps=30, seed=0):
+    """Encodes a synthetic clip with a hard cut between every scene; returns the cut frame numbers."""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    command = [
+        'ffmpeg', '-y', '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}',
+        '-r', str(fps), '-i', '-', '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', path
+    ]
+    encoder = subprocess.Popen(command, stdin=subprocess.PIPE)
+    ramp = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+
+    cuts = []
+    frame_number = 0
+    for scene in range(scene_count):
+        if scene:
+            cuts.append(frame_number)
+        start_color, end_color = rng.uniform(0, 255, (2, 3)).astype(np.float32)
+        speed = rng.uniform(-8, 8)
+        for i in range(int(rng.integers(20, 91))):
+            gradient = start_color + (end_color - start_color) * np.roll(ramp, int(speed * i), axis=1)
+            frame = np.broadcast_to(gradient, (height, width, 3)) + rng.normal(0, 4, (height, width, 1))
+            encoder.stdin.write(np.clip(frame, 0, 255).astype(np.uint8).tobytes())
+            frame_number += 1
+
+    encoder.stdin.close()
+    if encoder.wait() != 0:
+        raise RuntimeError("FFmpeg failed to encode the synthetic clip")
+    return cuts
+
+
+def cut_points(scenes):
+    return [start for start, _ in scenes[1:]]
+
+
+def matched(cuts, reference, tolerance):
+    """Share of `cuts` with a reference cut within `tolerance` frames."""
+    if not cuts:
+        return 1.0
+    reference = np.asarray(reference)
+    if not len(reference):
+        return 0.0
+    return sum(np.abs(reference - cut).min() <= tolerance for cut in cuts) / len(cuts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scene detection backends.")
+    parser.add_argument('--video', default=None, help="Video to detect scenes in (synthetic clip if omitted).")
+    parser.add_argument('--size', default='1280x720', help="Synthetic clip size.")
+    parser.add_argument('--scenes', type=int, default=60, help="Scenes in the synthetic clip.")
+    parser.add_argument('--tolerance', type=int, default=2, help="Frames two cuts may differ by and still match.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video, truth = args.video, None
+        if video is None:
+            video = os.path.join(temp_dir, 'cuts.mp4')
+            truth = make_cut_clip(video, tuple(int(value) for value in args.size.split('x')), args.scenes)
+            print(f"synthetic clip: {args.size}, {args.scenes} scenes, {len(truth)} cuts")
+
+        reference = reference_seconds = None
+        for backend in SCENE_DETECTORS:
+            start = time.perf_counter()
+            scenes, _ = detect_scenes(video, backend)
+            seconds = time.perf_counter() - start
+            cuts = cut_points(scenes)
+            if reference is None:
+                reference, reference_seconds = cuts, seconds
+                agreement = 'reference'
+            else:
+                agreement = (f"precision {matched(cuts, reference, args.tolerance):6.1%}  "
+                             f"recall {matched(reference, cuts, args.tolerance):6.1%} vs content")
+            line = f"{backend:<10} {seconds:7.2f}s  {reference_seconds / seconds:5.1f}x  {len(cuts):4d} cuts  {agreement}"
+            if truth is not None:
+                line += (f"  | precision {matched(cuts, truth, args.tolerance):6.1%}  "
+                         f"recall {matched(truth, cuts, args.tolerance):6.1%} vs true cuts")
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
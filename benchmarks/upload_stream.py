@@ -0,0 +1,80 @@
+"""
+Measures throughput and peak memory of the streaming /process upload path.
+
+Feeds a synthetic multipart/form-data body through receive_upload into S3 and
+reports MB/s and the peak Python heap while the upload runs. Point
+S3_ENDPOINT_URL at a local S3 stand-in (e.g. MinIO) to keep the data local.
+The uploaded object is deleted afterwards.
+
+Usage:
+    python -m benchmarks.upload_stream [--size-mb 1024] [--part-size-mb 16] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+import s3_storage
+from upload_stream import receive_upload
+
+BOUNDARY = 'benchmarkboundary'
+CHUNK_SIZE = 64 * 1024
+
+
+class SyntheticRequest:
+    """Minimal stand-in for a Starlette request streaming a generated upload."""
+
+    def __init__(self, size):
+        self.size = size
+        self.headers = {'content-type': f'multipart/form-data; boundary={BOUNDARY}'}
+
+    async def stream(self):
+        yield (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="benchmark.mp4"\r\n'
+               f'Content-Type: video/mp4\r\n\r\n').encode()
+        block = os.urandom(CHUNK_SIZE)
+        sent = 0
+        while sent < self.size:
+            chunk = block[:min(CHUNK_SIZE, self.size - sent)]
+            sent += len(chunk)
+            yield chunk
+        yield f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+async def run(size, part_size, concurrency):
+    received = await receive_upload(SyntheticRequest(size), lambda filename: 'benchmarks/upload_stream.mp4',
+                                    part_size=part_size, concurrency=concurrency)
+    received['upload'].complete(received['parts'])
+    return received
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming multipart upload to S3.")
+    parser.add_argument('--size-mb', type=int, default=1024, help="Size of the synthetic upload.")
+    parser.add_argument('--part-size-mb', type=int, default=s3_storage.S3_PART_SIZE // (1024 * 1024),
+                        help="S3 multipart part size.")
+    parser.add_argument('--concurrency', type=int, default=s3_storage.S3_UPLOAD_CONCURRENCY,
+                        help="Parts uploaded concurrently.")
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    part_size = args.part_size_mb * 1024 * 1024
+
+    tracemalloc.start()
+    start = time.time()
+    received = asyncio.run(run(size, part_size, args.concurrency))
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    s3_storage.delete_file(received['key'])
+
+    print(f"Uploaded {args.size_mb} MB in {len(received['parts'])} parts "
+          f"({args.part_size_mb} MB, {args.concurrency} concurrent)")
+    print(f"time: {elapsed:.2f}s ({args.size_mb / elapsed:.1f} MB/s)")
+    print(f"peak heap: {peak / (1024 * 1024):.1f} MB "
+          f"(bound ~{(args.concurrency + 1) * args.part_size_mb} MB of part buffers)")
+
+
+if __name__ == '__main__':
+    main()
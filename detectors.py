@@ -0,0 +1,441 @@
+import os
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+from options import DETECTOR_BACKENDS, FACE_DETECTORS
+
+# Person detector used for scene analysis: 'torch' runs yolov8n through
+# ultralytics/PyTorch, 'onnx' runs an exported copy with ONNX Runtime on CPU
+DETECTOR_BACKEND = os.getenv('DETECTOR_BACKEND', 'torch')
+
+# Weights of each backend; ONNX_MODEL_PATH may point at an INT8 model from export_onnx
+YOLO_WEIGHTS = os.getenv('YOLO_WEIGHTS', 'yolov8n.pt')
+ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', 'yolov8n.onnx')
+
+# Prediction settings, matching ultralytics' predict defaults
+DETECTOR_IMAGE_SIZE = 640
+DETECTOR_CONF = 0.25
+DETECTOR_IOU = 0.7
+DETECTOR_MAX_DET = 300
+PERSON_CLASS = 0
+
+# Shift between classes' boxes so one NMS pass never suppresses across classes
+CLASS_OFFSET = 7680
+
+# Face detector run once over each frame with people in it: 'yunet' is OpenCV's
+# YuNet DNN, 'haar' the frontal-face cascade shipped with OpenCV
+FACE_DETECTOR = os.getenv('FACE_DETECTOR', 'yunet')
+
+# YuNet model from the OpenCV model zoo, fetched at build time (python -m detectors
+# --face-model) or on first use when missing. Downloads come from a pinned
+# opencv_zoo commit and must match FACE_MODEL_SHA256 before they are kept; without
+# the model or a pin, FACE_DETECTOR=yunet falls back to the Haar cascade.
+FACE_MODEL_PATH = os.getenv('FACE_MODEL_PATH', 'face_detection_yunet_2023mar.onnx')
+FACE_MODEL_COMMIT = os.getenv('FACE_MODEL_COMMIT', '')
+FACE_MODEL_SHA256 = os.getenv('FACE_MODEL_SHA256', '')
+FACE_MODEL_URL = ('https://github.com/opencv/opencv_zoo/raw/{commit}/models/'
+                  'face_detection_yunet/face_detection_yunet_2023mar.onnx')
+
+FACE_SCORE_THRESHOLD = 0.9
+FACE_MIN_SIZE = 30
+
+# Share of a face's area that must lie inside a person box for the face to belong to that person
+FACE_CONTAINMENT = 0.8
+
+
+class PersonDetector(ABC):
+    """
+    Finds people in frames.
+
+    detect() takes a list of BGR frames and returns, per frame, a list of
+    integer [x1, y1, x2, y2] person boxes in the frame's pixel coordinates.
+    """
+
+    @abstractmethod
+    def detect(self, frames: list) -> list:
+        """Returns one list of person boxes per frame."""
+
+    def set_threads(self, threads: int):
+        """Caps the threads used for inference in this process."""
+
+
+class TorchDetector(PersonDetector):
+    """yolov8n through ultralytics on PyTorch."""
+
+    def __init__(self, weights: str = YOLO_WEIGHTS, threads: int = None):
+        from ultralytics import YOLO
+        if threads:
+            self.set_threads(threads)
+        self.model = YOLO(weights)
+
+    def detect(self, frames):
+        results = self.model(frames, verbose=False, conf=DETECTOR_CONF, iou=DETECTOR_IOU, max_det=DETECTOR_MAX_DET)
+        return [
+            [[int(i) for i in box.xyxy[0]] for box in result.boxes if box.cls[0] == PERSON_CLASS]
+            for result in results
+        ]
+
+    def set_threads(self, threads):
+        import torch
+        torch.set_num_threads(threads)
+
+
+class OnnxDetector(PersonDetector):
+    """
+    An exported yolov8n run with ONNX Runtime on CPU.
+
+    Pre- and post-processing mirror ultralytics: letterboxing (to the minimum
+    stride-aligned rectangle when the model has dynamic input sizes), per-class
+    NMS, and boxes scaled back to the frame, so the person boxes match the
+    torch backend up to numeric differences.
+
+    The session is created in the process that first runs it, so a copy made
+    before a fork is rebuilt in each child rather than used across the fork.
+    """
+
+    def __init__(self, model_path: str = ONNX_MODEL_PATH, threads: int = None, stride: int = 32):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found: {model_path} (create it with detectors.export_onnx)")
+        self.model_path = model_path
+        self.threads = threads
+        self.stride = stride
+        self.session = None
+        self.pid = None
+
+    def _session(self):
+        if self.session is None or self.pid != os.getpid():
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            if self.threads:
+                options.intra_op_num_threads = self.threads
+                options.inter_op_num_threads = 1
+            self.session = onnxruntime.InferenceSession(self.model_path, options,
+                                                        providers=['CPUExecutionProvider'])
+            self.pid = os.getpid()
+            model_input = self.session.get_inputs()[0]
+            self.input_name = model_input.name
+            batch, _, height, width = model_input.shape
+            self.fixed_batch = batch if isinstance(batch, int) else None
+            self.fixed_size = (height, width) if isinstance(height, int) and isinstance(width, int) else None
+        return self.session
+
+    def set_threads(self, threads):
+        self.threads = threads
+        self.session = None
+
+    def _letterbox(self, frame, new_shape, auto):
+        height, width = frame.shape[:2]
+        ratio = min(new_shape[0] / height, new_shape[1] / width)
+        new_unpad = round(width * ratio), round(height * ratio)
+        dw, dh = new_shape[1] - new_unpad[0], new_shape[0] - new_unpad[1]
+        if auto:
+            dw, dh = dw % self.stride, dh % self.stride
+        dw, dh = dw / 2, dh / 2
+        if (width, height) != new_unpad:
+            frame = cv2.resize(frame, new_unpad, interpolation=cv2.INTER_LINEAR)
+        top, bottom = round(dh - 0.1), round(dh + 0.1)
+        left, right = round(dw - 0.1), round(dw + 0.1)
+        return cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+    def _person_boxes(self, prediction, input_shape, frame_shape):
+        # prediction: (4 + classes, anchors) of center-x, center-y, width, height and class scores
+        scores = prediction[4:]
+        best = scores.argmax(0)
+        confidence = scores[best, np.arange(scores.shape[1])]
+        keep = confidence > DETECTOR_CONF
+        if not keep.any():
+            return []
+
+        # NMS runs per class and max_det applies across classes, as in ultralytics,
+        # before everything but people is dropped
+        cx, cy, w, h = prediction[:4, keep]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        offsets = best[keep, None] * CLASS_OFFSET
+        kept = _nms(boxes + offsets, confidence[keep], DETECTOR_IOU)[:DETECTOR_MAX_DET]
+        boxes = boxes[kept[best[keep][kept] == PERSON_CLASS]]
+        if not len(boxes):
+            return []
+
+        # Undo the letterbox with ultralytics.utils.ops.scale_boxes' arithmetic: the
+        # pad comes from the unrounded scaled frame and both axes divide by the gain
+        frame_height, frame_width = frame_shape
+        gain = min(input_shape[0] / frame_height, input_shape[1] / frame_width)
+        pad_x = round((input_shape[1] - frame_width * gain) / 2 - 0.1)
+        pad_y = round((input_shape[0] - frame_height * gain) / 2 - 0.1)
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / gain).clip(0, frame_width)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / gain).clip(0, frame_height)
+        return [[int(i) for i in box] for box in boxes]
+
+    def detect(self, frames):
+        if not frames:
+            return []
+        session = self._session()
+        same_shapes = len({frame.shape for frame in frames}) == 1
+        new_shape = self.fixed_size or (DETECTOR_IMAGE_SIZE, DETECTOR_IMAGE_SIZE)
+        images = [self._letterbox(frame, new_shape, auto=same_shapes and self.fixed_size is None) for frame in frames]
+
+        # BGR HWC uint8 -> RGB CHW float in [0, 1]
+        batch = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32) / 255
+        if self.fixed_batch == 1 or not same_shapes:
+            predictions = [session.run(None, {self.input_name: batch[i:i + 1]})[0][0] for i in range(len(frames))]
+        else:
+            predictions = session.run(None, {self.input_name: batch})[0]
+
+        return [self._person_boxes(prediction, image.shape[:2], frame.shape[:2])
+                for prediction, image, frame in zip(predictions, images, frames)]
+
+
+def _nms(boxes, scores, iou_threshold):
+    """Greedy non-maximum suppression; returns the indices kept, highest score first."""
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    kept = []
+    while order.size:
+        i = order[0]
+        kept.append(i)
+        rest = order[1:]
+        width = (np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0])).clip(0)
+        height = (np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1])).clip(0)
+        intersection = width * height
+        iou = intersection / (areas[i] + areas[rest] - intersection + 1e-7)
+        order = rest[iou <= iou_threshold]
+    return np.array(kept, dtype=int)
+
+
+class FaceDetector(ABC):
+    """
+    Finds faces in whole frames.
+
+    detect() takes a list of BGR frames and returns, per frame, an (N, 4)
+    integer array of [x1, y1, x2, y2] face boxes and an (N,) array of scores.
+    Frames downscaled for analysis pass their per-axis `scales` back to source
+    pixels, so FACE_MIN_SIZE keeps applying at source resolution.
+    """
+
+    @abstractmethod
+    def detect(self, frames: list, scales: list = None) -> list:
+        """Returns one (boxes, scores) pair per frame."""
+
+
+class YuNetFaceDetector(FaceDetector):
+    """OpenCV's YuNet face detector, a small CNN run through cv2.dnn."""
+
+    def __init__(self, model_path: str = FACE_MODEL_PATH):
+        if not os.path.exists(model_path):
+            download_face_model(model_path)
+        self.model = cv2.FaceDetectorYN.create(model_path, '', (320, 320), FACE_SCORE_THRESHOLD)
+        self.input_size = None
+
+    def detect(self, frames, scales=None):
+        detections = []
+        for frame, (scale_x, scale_y) in zip(frames, scales or [(1.0, 1.0)] * len(frames)):
+            input_size = frame.shape[1], frame.shape[0]
+            if input_size != self.input_size:
+                self.model.setInputSize(input_size)
+                self.input_size = input_size
+            _, faces = self.model.detect(frame)
+            if faces is None:
+                faces = np.zeros((0, 15), dtype=np.float32)
+            # rows: x, y, width, height, five landmarks, score
+            faces = faces[(faces[:, 2] * scale_x >= FACE_MIN_SIZE) & (faces[:, 3] * scale_y >= FACE_MIN_SIZE)]
+            boxes = faces[:, :4].astype(int)
+            boxes[:, 2:] += boxes[:, :2]
+            boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, frame.shape[1])
+            boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, frame.shape[0])
+            detections.append((boxes, faces[:, 14]))
+        return detections
+
+
+class HaarFaceDetector(FaceDetector):
+    """OpenCV's frontal-face Haar cascade; scores are the cascade's level weights."""
+
+    def __init__(self):
+        self.model = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    def detect(self, frames, scales=None):
+        detections = []
+        for frame, (scale_x, scale_y) in zip(frames, scales or [(1.0, 1.0)] * len(frames)):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            min_size = (max(1, round(FACE_MIN_SIZE / scale_x)), max(1, round(FACE_MIN_SIZE / scale_y)))
+            faces, _, weights = self.model.detectMultiScale3(gray, scaleFactor=1.1, minNeighbors=5, minSize=min_size,
+                                                             outputRejectLevels=True)
+            boxes = np.array(faces, dtype=int).reshape(-1, 4)
+            boxes[:, 2:] += boxes[:, :2]
+            detections.append((boxes, np.array(weights, dtype=float).reshape(-1)))
+        return detections
+
+
+def assign_faces(person_boxes, face_boxes, face_scores) -> list:
+    """
+    Picks each person's face: the highest-scoring face lying mostly inside the person box.
+
+    Returns a [x1, y1, x2, y2] face box, or None, per person box.
+    """
+    if not len(person_boxes):
+        return []
+    if not len(face_boxes):
+        return [None] * len(person_boxes)
+
+    people = np.asarray(person_boxes)[:, None]
+    faces = np.asarray(face_boxes)[None]
+    width = (np.minimum(people[..., 2], faces[..., 2]) - np.maximum(people[..., 0], faces[..., 0])).clip(0)
+    height = (np.minimum(people[..., 3], faces[..., 3]) - np.maximum(people[..., 1], faces[..., 1])).clip(0)
+    face_areas = (faces[..., 2] - faces[..., 0]) * (faces[..., 3] - faces[..., 1])
+    contained = width * height >= FACE_CONTAINMENT * face_areas
+
+    best = np.where(contained, np.asarray(face_scores)[None], -np.inf).argmax(1)
+    has_face = contained[np.arange(len(best)), best]
+    return [face_boxes[j].tolist() if found else None for j, found in zip(best, has_face)]
+
+
+def download_face_model(path: str = FACE_MODEL_PATH, commit: str = FACE_MODEL_COMMIT,
+                        sha256: str = FACE_MODEL_SHA256) -> str:
+    """Downloads the YuNet model from the pinned opencv_zoo commit, verifying its SHA-256."""
+    if not commit or not sha256:
+        raise RuntimeError("FACE_MODEL_COMMIT and FACE_MODEL_SHA256 must be set to download the YuNet model "
+                           f"(or provide {path}, or use FACE_DETECTOR=haar)")
+    _download(FACE_MODEL_URL.format(commit=commit), path, sha256)
+    return path
+
+
+def _download(url, path, sha256):
+    """
+    Downloads url to path, keeping the file only if its SHA-256 matches.
+
+    The data goes to a temporary file unique to this process, in path's
+    directory, which is renamed over path once verified, so concurrent workers
+    never see or clobber each other's partial downloads.
+    """
+    import hashlib
+    import tempfile
+    import requests
+    print(f"Downloading {url} to {path}")
+    digest = hashlib.sha256()
+    fd, part_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.part',
+                                     dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f, requests.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                digest.update(chunk)
+                f.write(chunk)
+        if digest.hexdigest() != sha256.lower():
+            raise RuntimeError(f"Checksum mismatch for {url}: expected {sha256}, got {digest.hexdigest()}")
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+
+def face_detector_backend(backend: str = FACE_DETECTOR) -> str:
+    """
+    Returns the face detector backend that will actually run for a configured one.
+
+    'yunet' falls back to 'haar' when the model file is missing and no pinned
+    download (FACE_MODEL_COMMIT and FACE_MODEL_SHA256) is configured, so a
+    default deployment can still analyze videos.
+    """
+    if backend == 'yunet' and not os.path.exists(FACE_MODEL_PATH) and not (FACE_MODEL_COMMIT and FACE_MODEL_SHA256):
+        return 'haar'
+    return backend
+
+
+def create_face_detector(backend: str = FACE_DETECTOR) -> FaceDetector:
+    """Builds the face detector for a backend name from options.FACE_DETECTORS (see face_detector_backend)."""
+    effective = face_detector_backend(backend)
+    if effective != backend:
+        print(f"YuNet model {FACE_MODEL_PATH} is missing and FACE_MODEL_COMMIT/FACE_MODEL_SHA256 are not set; "
+              f"using the {effective} face detector")
+        backend = effective
+    if backend == 'yunet':
+        return YuNetFaceDetector()
+    if backend == 'haar':
+        return HaarFaceDetector()
+    raise ValueError(f"Unknown face detector: {backend} (expected one of {', '.join(FACE_DETECTORS)})")
+
+
+def create_detector(backend: str = DETECTOR_BACKEND, threads: int = None) -> PersonDetector:
+    """Builds the person detector for a backend name from options.DETECTOR_BACKENDS."""
+    if backend == 'torch':
+        return TorchDetector(threads=threads)
+    if backend == 'onnx':
+        return OnnxDetector(threads=threads)
+    raise ValueError(f"Unknown detector backend: {backend} (expected one of {', '.join(DETECTOR_BACKENDS)})")
+
+
+def export_onnx(weights: str = YOLO_WEIGHTS, output_path: str = ONNX_MODEL_PATH, int8: bool = False,
+                calibration_video: str = None, calibration_frames: int = 64) -> str:
+    """
+    Exports yolov8n weights to ONNX for the onnx backend, optionally quantized to INT8.
+
+    INT8 models are statically quantized (QDQ, per-channel weights) with
+    activation ranges calibrated on frames sampled evenly from
+    calibration_video, which should look like the footage being cropped.
+    Weight-only dynamic quantization is not offered: ONNX Runtime runs its
+    integer convolutions slower than the float model on CPU. The export uses
+    dynamic input sizes, so inference runs on the same stride-aligned
+    rectangles as the torch backend.
+
+    Returns:
+        path of the written model
+    """
+    if int8 and not calibration_video:
+        raise ValueError("INT8 export needs a calibration video")
+
+    from ultralytics import YOLO
+    exported = YOLO(weights).export(format='onnx', dynamic=True, imgsz=DETECTOR_IMAGE_SIZE)
+    if not int8:
+        os.replace(exported, output_path)
+        return output_path
+
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    inputs = []
+    letterbox = OnnxDetector(exported)
+    cap = cv2.VideoCapture(calibration_video)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    for frame_number in np.linspace(0, max(total - 1, 0), calibration_frames).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(frame_number))
+        ret, frame = cap.read()
+        if ret:
+            image = letterbox._letterbox(frame, (DETECTOR_IMAGE_SIZE, DETECTOR_IMAGE_SIZE), auto=True)
+            inputs.append(image[None, ..., ::-1].transpose(0, 3, 1, 2).astype(np.float32) / 255)
+    cap.release()
+    if not inputs:
+        raise ValueError(f"No frames decoded from {calibration_video}")
+
+    class CalibrationFrames(CalibrationDataReader):
+        def __init__(self):
+            self.remaining = iter(inputs)
+
+        def get_next(self):
+            batch = next(self.remaining, None)
+            return None if batch is None else {'images': batch}
+
+    prepared = f"{os.path.splitext(exported)[0]}_prepared.onnx"
+    quant_pre_process(exported, prepared, skip_symbolic_shape=True)
+    quantize_static(prepared, output_path, CalibrationFrames(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    for path in (exported, prepared):
+        if os.path.exists(path):
+            os.remove(path)
+    return output_path
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Export the person detector for the onnx backend.")
+    parser.add_argument('--face-model', action='store_true',
+                        help="Download the YuNet face model to FACE_MODEL_PATH instead.")
+    parser.add_argument('--weights', default=YOLO_WEIGHTS, help="ultralytics weights to export.")
+    parser.add_argument('--output', default=ONNX_MODEL_PATH, help="Path of the ONNX model to write.")
+    parser.add_argument('--int8', action='store_true', help="Quantize the model to INT8.")
+    parser.add_argument('--calibration-video', default=None,
+                        help="Video to calibrate INT8 activation ranges on (required with --int8).")
+    args = parser.parse_args()
+    if args.face_model:
+        print(download_face_model())
+    else:
+        print(export_onnx(args.weights, args.output, args.int8, args.calibration_video))
@@ -0,0 +1,387 @@
+import os
+import bisect
+import subprocess
+import threading
+from collections import deque
+from options import RENDER_PROFILES
+
+# Encoder settings shared with the raw-pipe encoder in processor.py; the render
+# profile adds its preset, crf, tune and threads (see x264_output_args)
+X264_OUTPUT_ARGS = [
+    '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-profile:v', 'high', '-level', '4.0'
+]
+
+# Audio codecs that can be stream-copied into an MP4 container; others are transcoded to AAC
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'alac', 'ac3', 'eac3'}
+
+# Crop path nodes per window of the piecewise-linear crop expression. ffmpeg only
+# evaluates the window holding the current frame, so long paths stay cheap per frame.
+PATH_WINDOW_NODES = 32
+
+# Box blur applied to the quarter-resolution letterbox background. Two passes of
+# radius 5 approximate the 25x25 GaussianBlur used by the Python renderer.
+LETTERBOX_BLUR = 'boxblur=luma_radius=5:luma_power=2:chroma_radius=2:chroma_power=2'
+
+
+def drain_stderr(process, max_chunks=64):
+    """
+    Reads a process's stderr continuously on a background thread.
+
+    Without this a chatty ffmpeg can fill the stderr pipe and block while we are
+    still writing frames to its stdin. Only the last `max_chunks` reads are kept.
+
+    Returns:
+        function that waits for the reader to finish and returns the captured text
+    """
+    chunks = deque(maxlen=max_chunks)
+
+    def read():
+        for chunk in iter(lambda: process.stderr.read(4096), b''):
+            chunks.append(chunk)
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+
+    def result():
+        thread.join()
+        return b''.join(chunks).decode(errors='replace')
+
+    return result
+
+
+def x264_output_args(render_profile='default'):
+    """Returns the H.264 output arguments of a render profile from options.RENDER_PROFILES."""
+    profile = RENDER_PROFILES[render_profile]
+    args = [*X264_OUTPUT_ARGS, '-preset', profile['preset'], '-crf', str(profile['crf'])]
+    if profile['tune']:
+        args += ['-tune', profile['tune']]
+    if profile['threads']:
+        args += ['-threads', str(profile['threads'])]
+    return args
+
+
+def get_audio_codec(video_path):
+    """Returns the codec name of the first audio stream, or None if the file has no audio."""
+    command = [
+        'ffprobe', '-v', 'error', '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name', '-of', 'csv=p=0', video_path
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFprobe failed: {result.stderr.decode()}")
+    return result.stdout.decode().strip() or None
+
+
+def audio_output_args(audio_source, input_index):
+    """
+    Returns ffmpeg output arguments that mux the first audio stream of an input.
+
+    The stream is copied when MP4 can hold it and transcoded to AAC otherwise.
+    Sources without audio produce a video-only output.
+    """
+    if audio_source is None:
+        return ['-an']
+    codec = get_audio_codec(audio_source)
+    if codec is None:
+        return ['-an']
+    return ['-map', f'{input_index}:a:0', '-c:a', 'copy' if codec in MP4_AUDIO_CODECS else 'aac']
+
+
+def mp4_output_args(faststart=True):
+    """
+    Returns the ffmpeg MP4 muxer arguments of an encode.
+
+    faststart moves the index to the front for progressive playback, at the
+    cost of rewriting the file once more; chunks that are only concatenated
+    later leave it off.
+    """
+    return ['-movflags', '+faststart'] if faststart else []
+
+
+def _step_expression(values):
+    """
+    Builds a piecewise-constant expression of the frame number `n`.
+
+    `values` is a list of (start_frame, value) pairs in frame order. The result is
+    written as a flat sum of steps rather than nested if() calls, because ffmpeg's
+    expression parser caps nesting depth at around 100 levels.
+    """
+    terms = [str(values[0][1])]
+    previous = values[0][1]
+    for start_frame, value in values[1:]:
+        if value != previous:
+            terms.append(f"{value - previous:+d}*gte(n,{start_frame})")
+            previous = value
+    return ''.join(terms)
+
+
+def _path_terms(nodes):
+    """The flat sum of a piecewise-linear path over `nodes`, starting from the first node's value."""
+    terms = [str(nodes[0][1])]
+    for (frame, value, ramp), (next_frame, next_value, _) in zip(nodes, nodes[1:]):
+        change = next_value - value
+        if not change:
+            continue
+        if ramp and next_frame > frame:
+            length = next_frame - frame
+            terms.append(f"{change:+d}*clip(n{-frame:+d},0,{length})/{length}")
+        else:
+            terms.append(f"{change:+d}*gte(n,{next_frame})")
+    return ''.join(terms)
+
+
+def _path_expression(nodes, window=PATH_WINDOW_NODES):
+    """
+    Builds a piecewise-linear expression of the frame number `n`, truncated to an integer.
+
+    `nodes` is a list of (frame, value, ramp) triples in frame order. The value
+    moves linearly to the next node's value when ramp is set and jumps there at
+    the next node's frame otherwise. Like _step_expression it is a flat sum, and
+    each completed ramp adds exactly its integer change.
+
+    Paths longer than `window` nodes are split into windows of consecutive nodes,
+    each restarting from its first node's value and guarded by if(), which ffmpeg
+    evaluates lazily: a frame costs one window's terms plus one comparison per
+    window instead of a term per node of the whole path.
+    """
+    if len(nodes) <= window + 1:
+        return f"trunc({_path_terms(nodes)})"
+    windows = []
+    starts = list(range(0, len(nodes) - 1, window))
+    for i, start in enumerate(starts):
+        window_nodes = nodes[start:start + window + 1]
+        conditions = []
+        if i > 0:
+            conditions.append(f"gte(n,{window_nodes[0][0]})")
+        if i < len(starts) - 1:
+            conditions.append(f"lt(n,{window_nodes[-1][0]})")
+        windows.append(f"if({'*'.join(conditions)},{_path_terms(window_nodes)},0)")
+    return f"trunc({'+'.join(windows)})"
+
+
+def build_filtergraph(scene_plan, input_size, output_size, rebase_timestamps=False, source_size=None):
+    """
+    Compiles a scene plan into a single ffmpeg filtergraph.
+
+    Args:
+        scene_plan: list of (start_frame, strategy, crop) tuples in frame order,
+            where crop is the (x1, y1, x2, y2) source rectangle for TRACK scenes
+            and a list of (frame, rectangle) path nodes for TRACK_DYNAMIC scenes,
+            between which the crop moves linearly
+        input_size: (width, height) of the frames the plan's crops refer to
+        output_size: (width, height) of the vertical output
+        rebase_timestamps: restart timestamps at zero, for renders that begin
+            with an input seek
+        source_size: (width, height) of the source video when it differs from
+            input_size; frames are scaled to input_size before anything else
+
+    Returns:
+        filtergraph string reading [0:v] and writing [v]
+    """
+    original_width, original_height = input_size
+    output_width, output_height = output_size
+
+    # (frame, crop box, ramp to the next node) for every crop change of tracked scenes
+    track_nodes = []
+    for start, strategy, crop in scene_plan:
+        if strategy == 'TRACK':
+            track_nodes.append((start, crop, False))
+        elif strategy == 'TRACK_DYNAMIC':
+            track_nodes.extend((frame, box, i < len(crop) - 1) for i, (frame, box) in enumerate(crop))
+    letterbox_flags = [(start, 1 if strategy == 'LETTERBOX' else 0) for start, strategy, _ in scene_plan]
+
+    filters = []
+
+    if track_nodes:
+        crop_width = track_nodes[0][1][2] - track_nodes[0][1][0]
+        if output_height == original_height and output_width <= original_width:
+            # Native-height output: crop at the output width and skip scaling entirely
+            crop_width = output_width
+            nodes = [(frame, min(box[0], original_width - crop_width), ramp) for frame, box, ramp in track_nodes]
+            scale = ''
+        else:
+            nodes = [(frame, box[0], ramp) for frame, box, ramp in track_nodes]
+            scale = f",scale={output_width}:{output_height}:flags=bilinear"
+        if any(ramp for _, _, ramp in nodes):
+            crop_x = _path_expression(nodes)
+        else:
+            crop_x = _step_expression([(frame, x) for frame, x, _ in nodes])
+        # Crop x only matters on TRACK frames, so LETTERBOX scenes keep the previous value
+        track_chain = f"crop=w={crop_width}:h={original_height}:x='{crop_x}':y=0:exact=1{scale}"
+
+    has_letterbox = any(flag for _, flag in letterbox_flags)
+    if has_letterbox:
+        # Foreground: the whole source scaled to the output width. Its height and
+        # offset are kept even so the yuv420p strips stack without chroma shifts.
+        scaled_height = int(original_height * output_width / original_width) // 2 * 2
+        y_offset = (output_height - scaled_height) // 4 * 2
+        # Background: center crop of the source covering the output aspect ratio,
+        # blurred at quarter resolution and scaled back up
+        bg_scale = output_height / original_height
+        bg_crop_width = min(original_width, int(round(output_width / bg_scale)))
+        bg_crop_x = (original_width - bg_crop_width) // 2
+        bottom_height = output_height - y_offset - scaled_height
+        if y_offset <= 0 and bottom_height <= 0:
+            # Sources at 9:16 or narrower: the foreground alone covers the output,
+            # centered vertically when it is taller
+            letterbox_filters = [
+                "[bgsrc]nullsink",
+                f"[fgsrc]scale={output_width}:{scaled_height}:flags=bilinear,"
+                f"crop=w={output_width}:h={output_height}:x=0:y={(scaled_height - output_height) // 4 * 2}"
+            ]
+        else:
+            # Strips are stacked with vstack rather than overlay, which would force a
+            # conversion to yuva420p on every frame. ffmpeg rejects empty crops, so a
+            # strip without rows is left out of the stack.
+            strips = [(label, height, y) for label, height, y in
+                      (('top', y_offset, 0), ('bottom', bottom_height, y_offset + scaled_height)) if height > 0]
+            if len(strips) == 2:
+                split = ",split=2[bgtop][bgbottom]"
+            else:
+                split = f"[bg{strips[0][0]}]"
+            labels = {label for label, _, _ in strips}
+            stack = [label for label in ('top', 'fg', 'bottom') if label == 'fg' or label in labels]
+            letterbox_filters = [
+                f"[bgsrc]crop=w={bg_crop_width}:h={original_height}:x={bg_crop_x}:y=0,"
+                f"scale={output_width // 4}:{output_height // 4}:flags=bilinear,{LETTERBOX_BLUR}{{enable}},"
+                f"scale={output_width}:{output_height}:flags=bilinear{split}",
+                *(f"[bg{label}]crop=w={output_width}:h={height}:x=0:y={y}[{label}]" for label, height, y in strips),
+                f"[fgsrc]scale={output_width}:{scaled_height}:flags=bilinear[fg]",
+                ''.join(f"[{label}]" for label in stack) + f"vstack=inputs={len(stack)}",
+            ]
+
+    if not track_nodes:
+        filters.append("[0:v]split=2[bgsrc][fgsrc]")
+        filters.extend(f.format(enable='') for f in letterbox_filters)
+        filters[-1] += ",setsar=1,format=yuv420p[v]"
+    elif not has_letterbox:
+        filters.append(f"[0:v]{track_chain},setsar=1,format=yuv420p[v]")
+    else:
+        # Both branches see every frame and stay in lockstep, so neither ever queues
+        # frames. The background blur is skipped on TRACK frames, and blend with zero
+        # opacity copies the LETTERBOX result over LETTERBOX frames only.
+        enable = f":enable='{_step_expression(letterbox_flags)}'"
+        filters.append("[0:v]split=3[tsrc][bgsrc][fgsrc]")
+        filters.append(f"[tsrc]{track_chain}[track]")
+        filters.extend(f.format(enable=enable) for f in letterbox_filters)
+        filters[-1] += "[lb]"
+        filters.append(f"[track][lb]blend=all_mode=normal:all_opacity=0{enable},setsar=1,format=yuv420p[v]")
+
+    if source_size is not None and tuple(source_size) != tuple(input_size):
+        filters[0] = filters[0].replace('[0:v]', f'[0:v]scale={original_width}:{original_height}:flags=area,', 1)
+    if rebase_timestamps:
+        filters[0] = filters[0].replace('[0:v]', '[0:v]setpts=PTS-STARTPTS,', 1)
+
+    return ';\n'.join(filters)
+
+
+def clip_scene_plan(scene_plan, start_frame, end_frame=None):
+    """
+    Trims a scene plan to [start_frame, end_frame) and rebases it so that start_frame becomes frame 0.
+
+    Scenes outside the range are dropped, and so are the crop path nodes of
+    TRACK_DYNAMIC scenes beyond the nodes that bracket the range.
+    """
+    clipped = []
+    for i, (scene_start, strategy, crop_box) in enumerate(scene_plan):
+        next_start = scene_plan[i + 1][0] if i + 1 < len(scene_plan) else None
+        if next_start is not None and next_start <= start_frame:
+            continue
+        if end_frame is not None and scene_start >= end_frame and clipped:
+            break
+        if strategy == 'TRACK_DYNAMIC':
+            frames = [frame for frame, _ in crop_box]
+            first = max(bisect.bisect_right(frames, start_frame) - 1, 0)
+            last = len(frames) if end_frame is None else bisect.bisect_left(frames, end_frame) + 1
+            crop_box = [(frame - start_frame, box) for frame, box in crop_box[first:last]]
+        clipped.append((max(scene_start - start_frame, 0), strategy, crop_box))
+    return clipped
+
+
+def render_scene_plan(input_video, output_path, scene_plan, input_size, output_size,
+                      total_frames=0, progress_callback=None, include_audio=True, frame_range=None, fps=None,
+                      source_size=None, render_profile='default'):
+    """
+    Renders a scene plan entirely inside ffmpeg, without a Python frame loop.
+
+    ffmpeg decodes the input, applies the compiled filtergraph and encodes the
+    result with its own threading. The source audio is muxed in the same pass
+    unless include_audio is False.
+
+    frame_range=(start_frame, end_frame) renders only that part of the video,
+    using an accurate input seek; it requires the source fps. Such chunks skip
+    faststart, as only the joined output needs it.
+
+    A source_size other than input_size scales the frames down to input_size
+    first, and render_profile picks the encoder settings.
+    """
+    seek_args = []
+    limit_args = []
+    if frame_range:
+        start_frame, end_frame = frame_range
+        scene_plan = clip_scene_plan(scene_plan, start_frame, end_frame)
+        if start_frame > 0:
+            # Seek half a frame early so float rounding can never skip the first frame
+            seek_args = ['-ss', f"{(start_frame - 0.5) / fps:.6f}"]
+        if end_frame is not None:
+            limit_args = ['-frames:v', str(end_frame - start_frame)]
+
+    graph_path = f"{os.path.splitext(output_path)[0]}_filtergraph.txt"
+    with open(graph_path, 'w') as f:
+        f.write(build_filtergraph(scene_plan, input_size, output_size, rebase_timestamps=bool(seek_args),
+                                  source_size=source_size))
+
+    command = [
+        'ffmpeg', '-y', '-v', 'error', '-nostats', '-progress', 'pipe:1',
+        *seek_args, '-i', input_video, '-filter_complex_script', graph_path,
+        '-map', '[v]', *limit_args, *x264_output_args(render_profile),
+        *audio_output_args(input_video if include_audio else None, 0),
+        *mp4_output_args(faststart=not frame_range), output_path
+    ]
+
+    try:
+        ffmpeg_process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        read_stderr = drain_stderr(ffmpeg_process)
+        for line in ffmpeg_process.stdout:
+            key, _, value = line.decode().strip().partition('=')
+            if progress_callback and key == 'frame' and total_frames:
+                frame_number = int(value)
+                progress_callback(3, min(int(frame_number / total_frames * 100), 100),
+                                  f"Processed {frame_number}/{total_frames} frames")
+        ffmpeg_process.wait()
+        stderr_output = read_stderr()
+    finally:
+        if os.path.exists(graph_path):
+            os.remove(graph_path)
+
+    if ffmpeg_process.returncode != 0:
+        raise RuntimeError(f"FFmpeg filtergraph render failed: {stderr_output}")
+
+
+def concat_chunks(chunk_paths, output_path, audio_source=None):
+    """
+    Joins separately encoded video chunks with the concat demuxer, without re-encoding.
+
+    The first audio stream of audio_source is muxed in during the same pass.
+    """
+    list_path = f"{os.path.splitext(output_path)[0]}_chunks.txt"
+    with open(list_path, 'w') as f:
+        for chunk_path in chunk_paths:
+            escaped = os.path.abspath(chunk_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    audio_input = ['-i', audio_source] if audio_source else []
+    command = [
+        'ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, *audio_input,
+        '-map', '0:v', '-c:v', 'copy', *audio_output_args(audio_source, 1),
+        *mp4_output_args(), output_path
+    ]
+
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Chunk concatenation failed: {result.stderr.decode()}")
@@ -0,0 +1,51 @@
+import os
+import json
+import redis
+from redis_clients import get_client
+
+# Redis holding job metadata; defaults to the Celery result backend
+JOB_STORE_URL = os.getenv('JOB_STORE_URL', os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0'))
+
+# Seconds a job's metadata is kept (0 keeps it until the job is deleted)
+JOB_METADATA_TTL = int(os.getenv('JOB_METADATA_TTL', str(30 * 24 * 3600)))
+
+KEY_PREFIX = 'autocrop:job:'
+
+
+def save(job_id: str, metadata: dict) -> bool:
+    """Records a job's S3 objects and parameters, replacing any earlier record."""
+    try:
+        get_client(JOB_STORE_URL).set(f"{KEY_PREFIX}{job_id}", json.dumps(metadata), ex=JOB_METADATA_TTL or None)
+        return True
+    except redis.RedisError as e:
+        print(f"Error writing job metadata: {e}")
+        return False
+
+
+def get(job_id: str) -> dict:
+    """Returns a job's metadata, or None for unknown jobs."""
+    try:
+        payload = get_client(JOB_STORE_URL).get(f"{KEY_PREFIX}{job_id}")
+    except redis.RedisError as e:
+        print(f"Error reading job metadata: {e}")
+        return None
+    return json.loads(payload) if payload else None
+
+
+def update(job_id: str, **fields) -> bool:
+    """Sets fields on an existing job's metadata; unknown jobs are left alone."""
+    metadata = get(job_id)
+    if metadata is None:
+        return False
+    metadata.update(fields)
+    return save(job_id, metadata)
+
+
+def delete(job_id: str) -> bool:
+    """Removes a job's metadata."""
+    try:
+        get_client(JOB_STORE_URL).delete(f"{KEY_PREFIX}{job_id}")
+        return True
+    except redis.RedisError as e:
+        print(f"Error deleting job metadata: {e}")
+        return False
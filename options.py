@@ -0,0 +1,35 @@
+# Job options shared by the API and the workers. This module must stay free of
+# heavy imports, since the API validates requests against it.
+
+# Frame renderers selectable per job: a Python/OpenCV loop piping raw frames to
+# ffmpeg, or a filtergraph compiled from the scene plan and run entirely in ffmpeg
+RENDER_BACKENDS = ('python', 'ffmpeg')
+
+# Render profiles selectable per job. max_height caps the output height (None
+# keeps the source height); taller sources are scaled down as they are decoded,
+# before any crop math. preset/crf/tune are the x264 settings of the encode and
+# threads its thread count (0 = ffmpeg's default).
+RENDER_PROFILES = {
+    'default': {'max_height': None, 'preset': 'fast', 'crf': 23, 'tune': None, 'threads': 0},
+    'social-1080': {'max_height': 1920, 'preset': 'medium', 'crf': 21, 'tune': None, 'threads': 0},
+    'draft-540': {'max_height': 960, 'preset': 'veryfast', 'crf': 28, 'tune': 'fastdecode', 'threads': 2},
+    'archive': {'max_height': None, 'preset': 'slow', 'crf': 18, 'tune': 'film', 'threads': 0},
+}
+
+# Raw frame formats of the Python renderer: BGR frames decoded by OpenCV, or the
+# yuv420p planes ffmpeg decodes to natively, which skip two color conversions and
+# halve the bytes piped per frame
+PIXEL_FORMATS = ('bgr24', 'yuv420p')
+
+# Scene detectors (SCENE_DETECTOR) run before analysis: PySceneDetect's
+# ContentDetector, the scene scores of ffmpeg's select filter, or color histogram
+# differences of downscaled, frame-skipped frames computed in NumPy
+SCENE_DETECTORS = ('content', 'ffmpeg', 'histogram')
+
+# Person detectors selectable per worker (DETECTOR_BACKEND): yolov8n on PyTorch
+# through ultralytics, or the same model exported to ONNX and run with ONNX Runtime
+DETECTOR_BACKENDS = ('torch', 'onnx')
+
+# Face detectors (FACE_DETECTOR), run once per analyzed frame: OpenCV's YuNet
+# CNN, or the Haar cascade bundled with OpenCV
+FACE_DETECTORS = ('yunet', 'haar')
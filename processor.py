@@ -1,72 +1,382 @@
 import time
+import json
 import cv2
 import subprocess
 import os
+import bisect
+import queue
+import shutil
+import tempfile
+import threading
 import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-from scenedetect import VideoManager, SceneManager
 from scenedetect.detectors import ContentDetector
-from ultralytics import YOLO
+from scenedetect.scene_manager import compute_downscale_factor
+from ffmpeg_render import (audio_output_args, concat_chunks, drain_stderr, mp4_output_args, render_scene_plan,
+                           x264_output_args)
+from options import PIXEL_FORMATS, RENDER_BACKENDS, RENDER_PROFILES, SCENE_DETECTORS
+from scene_detection import SCENE_DETECTOR, detect_scenes
+from detectors import DETECTOR_BACKEND, FACE_DETECTOR, assign_faces, create_detector, create_face_detector
 
 # --- Constants ---
 ASPECT_RATIO = 9 / 16
 
-# Load models once
-model = YOLO('yolov8n.pt')
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# Frames held back in single-pass mode while a scene's crop decision is pending,
+# capped so the held frames fit in SINGLE_PASS_BUFFER_MB. At least
+# SINGLE_PASS_MIN_LOOKAHEAD frames are always held, since cuts can be reported
+# up to min_scene_len (15) frames late.
+SINGLE_PASS_LOOKAHEAD = int(os.getenv('SINGLE_PASS_LOOKAHEAD', '300'))
+SINGLE_PASS_BUFFER_BYTES = int(os.getenv('SINGLE_PASS_BUFFER_MB', '512')) * 1024 * 1024
+SINGLE_PASS_MIN_LOOKAHEAD = 30
 
+# Python render pipeline: transform worker threads, and the size of each bounded
+# queue between decoder, workers and encoder writer
+RENDER_WORKERS = max(1, min(4, os.cpu_count() or 1))
+RENDER_QUEUE_FRAMES = 8
 
-def analyze_scene_content(video_path, scene_start_time, scene_end_time):
+# Chunked rendering never splits the video into chunks shorter than this
+CHUNK_MIN_FRAMES = 300
+
+# Person detection batching: frames per model call and a cap on buffered frame data
+ANALYSIS_BATCH_SIZE = 16
+ANALYSIS_BATCH_MAX_BYTES = 512 * 1024 * 1024
+
+# Longest side, in pixels, of the frame copies people and faces are detected on;
+# larger frames are downscaled as they are read (0 analyzes full resolution)
+ANALYSIS_SIZE = int(os.getenv('ANALYSIS_SIZE', '640'))
+
+# Dynamic tracking (opt-in): TRACK scenes are re-detected on sparse keyframes, and
+# scenes whose subject moves become TRACK_DYNAMIC with a smoothed crop path
+DYNAMIC_TRACKING = os.getenv('DYNAMIC_TRACKING', 'false').lower() == 'true'
+
+# Keyframe spacing in seconds: starts at TRACK_INTERVAL, halves when the subject
+# moves more than TRACK_FAST_MOTION crop widths between keyframes and doubles when
+# it moves less than TRACK_SLOW_MOTION, staying within the min/max bounds
+TRACK_INTERVAL = 0.5
+TRACK_MIN_INTERVAL = 0.1
+TRACK_MAX_INTERVAL = 2.0
+TRACK_FAST_MOTION = 0.2
+TRACK_SLOW_MOTION = 0.05
+
+# Keyframes detected per model call while tracking; the spacing adapts between batches
+TRACK_BATCH_SIZE = 8
+
+# Seconds of the moving average applied to the crop center, the spacing of the
+# stored crop path nodes, and the travel (in crop widths) below which a scene
+# keeps a static crop
+TRACK_SMOOTHING = 1.0
+TRACK_PATH_STEP = 0.2
+TRACK_MIN_TRAVEL = 0.1
+
+# Format version of saved scene plans; bump when the plan layout changes.
+# Version 2 added TRACK_DYNAMIC scenes; older plans still load.
+PLAN_VERSION = 2
+
+_models = {}
+_models_lock = threading.Lock()
+_thread_count = None
+
+
+def load_models():
+    """
+    Returns the person and face detectors, loading them once on first use.
+
+    The detector backend (and with it torch or onnxruntime) is imported here
+    rather than at module level, so importing this module stays cheap until a
+    video is actually analyzed.
+    """
+    with _models_lock:
+        if not _models:
+            # Published together, so a failed load is retried on the next call
+            person = create_detector(DETECTOR_BACKEND, threads=_thread_count)
+            face = create_face_detector(FACE_DETECTOR)
+            _models.update(person=person, face=face)
+    return _models['person'], _models['face']
+
+
+def warm_up_models(frame_size=(640, 640)) -> float:
+    """
+    Loads the models and runs one inference on a blank frame.
+
+    The first inference also prepares the detector (layer fusion, kernel
+    selection), so a worker that warms up before forking hands the finished
+    model to its children. Returns the seconds taken.
+    """
+    start = time.time()
+    analyze_frames([np.zeros((frame_size[1], frame_size[0], 3), dtype=np.uint8)])
+    return time.time() - start
+
+
+def gpu_available() -> bool:
+    """Whether the torch detector can see a CUDA device (imports torch, without initializing CUDA)."""
+    if DETECTOR_BACKEND != 'torch':
+        return False
+    import torch
+    return torch.cuda.is_available()
+
+
+def set_thread_count(threads: int):
+    """Caps the threads OpenCV and the person detector use in this process, including one loaded later."""
+    global _thread_count
+    _thread_count = threads
+    cv2.setNumThreads(threads)
+    if 'person' in _models:
+        _models['person'].set_threads(threads)
+
+
+def analyze_frames(frames, scales=None):
+    """
+    Detects people and faces in a list of BGR frames.
+
+    People are found with one batched model call and faces with one pass over
+    each frame that has people; every person then gets the best face inside
+    their box. `scales` are the per-frame factors of frames downscaled by
+    analysis_frame, so the minimum face size still refers to source pixels.
+    Boxes stay in the given frames' coordinates.
+    """
+    if not frames:
+        return []
+    detector, face_detector = load_models()
+    person_boxes = detector.detect(frames)
+    scales = scales or [(1.0, 1.0)] * len(frames)
+    with_people = [i for i, boxes in enumerate(person_boxes) if boxes]
+    faces = iter(face_detector.detect([frames[i] for i in with_people], [scales[i] for i in with_people]))
+
+    analysis = []
+    for boxes in person_boxes:
+        face_boxes = assign_faces(boxes, *next(faces)) if boxes else []
+        analysis.append([{'person_box': box, 'face_box': face} for box, face in zip(boxes, face_boxes)])
+    return analysis
+
+
+def analysis_frame(frame):
+    """
+    Returns a copy of a frame downscaled for analysis, and the per-axis factors mapping it back.
+
+    Frames whose longest side is within ANALYSIS_SIZE are returned unchanged.
+    """
+    height, width = frame.shape[:2]
+    if not ANALYSIS_SIZE or max(width, height) <= ANALYSIS_SIZE:
+        return frame, (1.0, 1.0)
+    ratio = ANALYSIS_SIZE / max(width, height)
+    analysis_width, analysis_height = max(1, round(width * ratio)), max(1, round(height * ratio))
+    small = cv2.resize(frame, (analysis_width, analysis_height), interpolation=cv2.INTER_AREA)
+    return small, (width / analysis_width, height / analysis_height)
+
+
+def scale_analysis(detected_objects, scale):
+    """Maps the boxes of an analysis made on a downscaled frame back to source coordinates."""
+    if scale == (1.0, 1.0):
+        return detected_objects
+
+    def rescale(box):
+        if box is None:
+            return None
+        x1, y1, x2, y2 = box
+        return [int(x1 * scale[0]), int(y1 * scale[1]), int(x2 * scale[0]), int(y2 * scale[1])]
+
+    return [{'person_box': rescale(obj['person_box']), 'face_box': rescale(obj['face_box'])}
+            for obj in detected_objects]
+
+
+def analyze_frame(frame):
+    """Detects people and faces in a single BGR frame, on a copy downscaled to ANALYSIS_SIZE."""
+    small, scale = analysis_frame(frame)
+    return scale_analysis(analyze_frames([small], [scale])[0], scale)
+
+
+def analyze_scene_content(video_path, start_frame, end_frame):
     """Analyzes the middle frame of a scene to detect people and faces."""
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         return []
 
-    start_frame = scene_start_time.get_frames()
-    end_frame = scene_end_time.get_frames()
     middle_frame_number = int(start_frame + (end_frame - start_frame) / 2)
 
     cap.set(cv2.CAP_PROP_POS_FRAMES, middle_frame_number)
     ret, frame = cap.read()
+    cap.release()
     if not ret:
-        cap.release()
         return []
 
-    results = model([frame], verbose=False)
-    detected_objects = []
+    return analyze_frame(frame)
+
+
+def analyze_scenes(video_path, scenes, batch_size=ANALYSIS_BATCH_SIZE, max_batch_bytes=ANALYSIS_BATCH_MAX_BYTES,
+                   progress_callback=None):
+    """
+    Analyzes the middle frame of every scene, running person detection in batches.
+
+    Middle frames are sampled exactly as in `analyze_scene_content`, downscaled to
+    ANALYSIS_SIZE straight after decoding, and collected into chunks that are
+    flushed to the model once `batch_size` frames or `max_batch_bytes` of frame
+    data have been gathered. Boxes are returned in source coordinates.
+
+    Returns:
+        list with one detection list per scene, in scene order
+    """
+    analyses = [[] for _ in scenes]
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return analyses
+
+    pending_indices = []
+    pending_frames = []
+    pending_scales = []
+    pending_bytes = 0
+    analyzed = 0
 
-    for result in results:
-        boxes = result.boxes
-        for box in boxes:
-            if box.cls[0] == 0:
-                x1, y1, x2, y2 = [int(i) for i in box.xyxy[0]]
-                person_box = [x1, y1, x2, y2]
+    def flush():
+        nonlocal pending_bytes, analyzed
+        detections = analyze_frames(pending_frames, pending_scales)
+        for scene_index, detected_objects, scale in zip(pending_indices, detections, pending_scales):
+            analyses[scene_index] = scale_analysis(detected_objects, scale)
+        analyzed += len(pending_frames)
+        pending_indices.clear()
+        pending_frames.clear()
+        pending_scales.clear()
+        pending_bytes = 0
+        if progress_callback:
+            progress_callback(2, int(analyzed / len(scenes) * 100), f"Analyzed {analyzed}/{len(scenes)} scenes")
 
-                person_roi_gray = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
-                faces = face_cascade.detectMultiScale(person_roi_gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+    for i, (start_frame, end_frame) in enumerate(scenes):
+        middle_frame_number = int(start_frame + (end_frame - start_frame) / 2)
 
-                face_box = None
-                if len(faces) > 0:
-                    fx, fy, fw, fh = faces[0]
-                    face_box = [x1 + fx, y1 + fy, x1 + fx + fw, y1 + fy + fh]
+        cap.set(cv2.CAP_PROP_POS_FRAMES, middle_frame_number)
+        ret, frame = cap.read()
+        if not ret:
+            analyzed += 1
+            continue
+        frame, scale = analysis_frame(frame)
 
-                detected_objects.append({'person_box': person_box, 'face_box': face_box})
+        if pending_frames and pending_bytes + frame.nbytes > max_batch_bytes:
+            flush()
+        pending_indices.append(i)
+        pending_frames.append(frame)
+        pending_scales.append(scale)
+        pending_bytes += frame.nbytes
+        if len(pending_frames) >= batch_size:
+            flush()
 
+    if pending_frames:
+        flush()
     cap.release()
-    return detected_objects
+    return analyses
 
 
-def detect_scenes(video_path):
-    video_manager = VideoManager([video_path])
-    scene_manager = SceneManager()
-    scene_manager.add_detector(ContentDetector())
-    video_manager.set_downscale_factor()
-    video_manager.start()
-    scene_manager.detect_scenes(frame_source=video_manager)
-    scene_list = scene_manager.get_scene_list()
-    fps = video_manager.get_framerate()
-    video_manager.release()
-    return scene_list, fps
+def track_scenes(video_path, scenes_analysis, fps, frame_width, frame_height, progress_callback=None,
+                 batch_size=TRACK_BATCH_SIZE, max_batch_bytes=ANALYSIS_BATCH_MAX_BYTES):
+    """
+    Follows the subject of every TRACK scene on sparse keyframes.
+
+    Each TRACK scene is decoded once. Keyframes are downscaled to ANALYSIS_SIZE
+    as they are read and detected in batches of `batch_size` (or
+    `max_batch_bytes` of frame data); after each batch the keyframe spacing
+    adapts to how far the subject moved between its keyframes (see
+    TRACK_INTERVAL). Keyframe targets are chosen with the same rules as the
+    scene's middle frame. Scenes whose smoothed crop path travels at least
+    TRACK_MIN_TRAVEL crop widths become TRACK_DYNAMIC with a 'crop_path';
+    the others keep their static crop. Updates scenes_analysis in place.
+
+    Returns:
+        number of keyframes analyzed
+    """
+    crop_width = int(frame_height * ASPECT_RATIO)
+    min_interval = max(1, int(round(TRACK_MIN_INTERVAL * fps)))
+    max_interval = max(min_interval, int(round(TRACK_MAX_INTERVAL * fps)))
+    track_indices = [i for i, scene_data in enumerate(scenes_analysis) if scene_data['strategy'] == 'TRACK']
+    keyframes = 0
+
+    pending_numbers = []
+    pending_frames = []
+    pending_scales = []
+    pending_bytes = 0
+    samples = {}
+    interval = previous_center = None
+
+    def flush():
+        nonlocal pending_bytes, keyframes, interval, previous_center
+        detections = analyze_frames(pending_frames, pending_scales)
+        for frame_number, detected_objects, scale in zip(pending_numbers, detections, pending_scales):
+            strategy, target = decide_cropping_strategy(scale_analysis(detected_objects, scale), frame_height)
+            if strategy != 'TRACK':
+                continue
+            center = (target[0] + target[2]) / 2
+            samples[frame_number] = center
+            if previous_center is not None:
+                moved = abs(center - previous_center) / crop_width
+                if moved > TRACK_FAST_MOTION:
+                    interval = max(min_interval, interval // 2)
+                elif moved < TRACK_SLOW_MOTION:
+                    interval = min(max_interval, interval * 2)
+            previous_center = center
+        keyframes += len(pending_frames)
+        pending_numbers.clear()
+        pending_frames.clear()
+        pending_scales.clear()
+        pending_bytes = 0
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return keyframes
+    position = None
+    try:
+        for done, index in enumerate(track_indices):
+            scene_data = scenes_analysis[index]
+            start_frame, end_frame = scene_data['start_frame'], scene_data['end_frame']
+            if end_frame - start_frame < 2 * min_interval:
+                continue
+            if position != start_frame:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+            target = scene_data['target_box']
+            middle_frame = int(start_frame + (end_frame - start_frame) / 2)
+            samples = {middle_frame: (target[0] + target[2]) / 2}
+            previous_center = None
+            interval = max(min_interval, min(max_interval, int(round(TRACK_INTERVAL * fps))))
+            next_keyframe = start_frame
+            position = None
+            for frame_number in range(start_frame, end_frame):
+                if frame_number != next_keyframe:
+                    if not cap.grab():
+                        break
+                    continue
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame, scale = analysis_frame(frame)
+
+                if pending_frames and pending_bytes + frame.nbytes > max_batch_bytes:
+                    flush()
+                pending_numbers.append(frame_number)
+                pending_frames.append(frame)
+                pending_scales.append(scale)
+                pending_bytes += frame.nbytes
+                if len(pending_frames) >= batch_size:
+                    flush()
+                # Always land a keyframe on the scene's last frame
+                next_keyframe = min(frame_number + interval, end_frame - 1)
+            else:
+                position = end_frame
+            if pending_frames:
+                flush()
+
+            sample_frames = sorted(samples)
+            crop_path = smooth_crop_path(sample_frames, [samples[f] for f in sample_frames], start_frame, end_frame,
+                                         frame_width, frame_height, fps)
+            travel = max(x1 for _, x1 in crop_path) - min(x1 for _, x1 in crop_path)
+            if travel >= TRACK_MIN_TRAVEL * crop_width:
+                scene_data['strategy'] = 'TRACK_DYNAMIC'
+                scene_data['crop_path'] = crop_path
+
+            if progress_callback:
+                progress_callback(2, int((done + 1) / len(track_indices) * 100),
+                                  f"Tracked {done + 1}/{len(track_indices)} scenes")
+    finally:
+        cap.release()
+    return keyframes
 
 
 def get_enclosing_box(boxes):
@@ -113,6 +423,52 @@ def calculate_crop_box(target_box, frame_width, frame_height):
     return x1, y1, x2, y2
 
 
+def smooth_crop_path(sample_frames, sample_centers, start_frame, end_frame, frame_width, frame_height, fps):
+    """
+    Turns subject centers sampled on keyframes into a smoothed crop path for a scene.
+
+    The centers are interpolated to every frame of [start_frame, end_frame),
+    smoothed with a TRACK_SMOOTHING moving average and converted to crop x
+    positions, all as whole-scene array operations.
+
+    Returns:
+        [[frame, x1], ...] nodes every TRACK_PATH_STEP seconds and on the last frame;
+        the crop moves linearly between nodes
+    """
+    crop_width = int(frame_height * ASPECT_RATIO)
+    frames = np.arange(start_frame, end_frame)
+    centers = np.interp(frames, sample_frames, sample_centers)
+
+    window = min(max(1, int(round(TRACK_SMOOTHING * fps))), len(frames))
+    if window > 1:
+        padded = np.pad(centers, (window // 2, window - 1 - window // 2), mode='edge')
+        centers = np.convolve(padded, np.ones(window) / window, mode='valid')
+
+    positions = np.clip(centers - crop_width / 2, 0, frame_width - crop_width).astype(int)
+    step = max(1, int(round(TRACK_PATH_STEP * fps)))
+    nodes = np.unique(np.append(np.arange(0, len(frames), step), len(frames) - 1))
+    return [[int(start_frame + i), int(positions[i])] for i in nodes]
+
+
+def crop_path_positions(crop_path, start_frame, end_frame):
+    """
+    Returns the crop x of every frame in [start_frame, end_frame) along a crop path.
+
+    Evaluates the same piecewise-linear function, in the same arithmetic order,
+    as the crop expression ffmpeg_render builds from the path, so both renderers
+    crop identically.
+    """
+    nodes = np.array(crop_path, dtype=float).reshape(-1, 2)
+    frames = np.arange(start_frame, end_frame)
+    if len(nodes) == 1:
+        return np.full(len(frames), int(nodes[0, 1]))
+    segment = np.clip(np.searchsorted(nodes[:, 0], frames, side='right') - 1, 0, len(nodes) - 2)
+    segment_start, segment_end = nodes[segment, 0], nodes[segment + 1, 0]
+    change = nodes[segment + 1, 1] - nodes[segment, 1]
+    progress = np.clip(frames - segment_start, 0, segment_end - segment_start)
+    return np.trunc(nodes[segment, 1] + change * progress / (segment_end - segment_start)).astype(int)
+
+
 def get_video_resolution(video_path):
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
@@ -123,35 +479,766 @@ def get_video_resolution(video_path):
     return width, height
 
 
-def process_video(input_video: str, output_video: str, progress_callback=None) -> dict:
+def get_frame_count(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file {video_path}")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return total_frames
+
+
+def get_output_size(original_width, original_height):
+    """Returns the (width, height) of the vertical output for a source resolution."""
+    output_height = original_height
+    output_width = int(output_height * ASPECT_RATIO)
+    if output_width % 2 != 0:
+        output_width += 1
+    return output_width, output_height
+
+
+def scaled_input_size(width, height, max_height=None):
     """
-    Process a video from horizontal to vertical format.
+    Returns the (width, height) a source is rendered at so its output is at most max_height tall.
 
-    Args:
-        input_video: Path to input video file
-        output_video: Path to output video file
-        progress_callback: Optional callback function(step, progress, message)
+    The output is as tall as the frames it is cropped from, so taller sources are
+    scaled down, keeping their aspect ratio and even dimensions.
+    """
+    if not max_height or height <= max_height:
+        return width, height
+    return int(round(width * max_height / height / 2)) * 2, max_height // 2 * 2
+
+
+def scale_plan(plan, input_size):
+    """
+    Returns a copy of a plan with its crop geometry mapped to frames of input_size.
+
+    Target boxes and crop paths are scaled from the plan's own input_size, and
+    the output size follows the new frame height. Detections are left as they are.
+    """
+    if tuple(plan['input_size']) == tuple(input_size):
+        return plan
+    width, height = input_size
+    scale_x, scale_y = width / plan['input_size'][0], height / plan['input_size'][1]
+    crop_width = int(height * ASPECT_RATIO)
+
+    scenes = []
+    for scene_data in plan['scenes']:
+        scene_data = dict(scene_data)
+        if scene_data.get('target_box'):
+            scene_data['target_box'] = [int(round(value * scale))
+                                        for value, scale in zip(scene_data['target_box'], (scale_x, scale_y) * 2)]
+        if scene_data.get('crop_path'):
+            scene_data['crop_path'] = [[frame, min(max(int(round(x1 * scale_x)), 0), width - crop_width)]
+                                       for frame, x1 in scene_data['crop_path']]
+        scenes.append(scene_data)
+
+    return {**plan, 'input_size': [width, height], 'output_size': list(get_output_size(width, height)),
+            'scenes': scenes}
+
+
+def frame_buffer(width, height, pixel_format):
+    """Allocates one raw frame: an HxWx3 array for bgr24, or a flat array of the three planes for yuv420p."""
+    if pixel_format == 'bgr24':
+        return np.empty((height, width, 3), dtype=np.uint8)
+    chroma_width, chroma_height = (width + 1) // 2, (height + 1) // 2
+    return np.empty(width * height + 2 * chroma_width * chroma_height, dtype=np.uint8)
+
+
+def frame_planes(frame, width, height, pixel_format):
+    """Views of the planes of a raw frame: (bgr,) for bgr24, (y, u, v) for yuv420p."""
+    if pixel_format == 'bgr24':
+        return (frame,)
+    chroma_width, chroma_height = (width + 1) // 2, (height + 1) // 2
+    luma, chroma = width * height, chroma_width * chroma_height
+    return (frame[:luma].reshape(height, width),
+            frame[luma:luma + chroma].reshape(chroma_height, chroma_width),
+            frame[luma + chroma:].reshape(chroma_height, chroma_width))
+
+
+def frame_to_bgr(frame, width, height, pixel_format, size=None):
+    """Returns a raw frame as a BGR image for analysis, resized to `size` if given."""
+    if pixel_format == 'bgr24':
+        return frame if size is None else cv2.resize(frame, size)
+    # OpenCV's I420 conversion needs even dimensions
+    target_width, target_height = size or (width, height)
+    target_width, target_height = target_width - target_width % 2, target_height - target_height % 2
+    if (target_width, target_height) == (width, height):
+        i420 = frame
+    else:
+        i420 = frame_buffer(target_width, target_height, pixel_format)
+        for plane, resized in zip(frame_planes(frame, width, height, pixel_format),
+                                  frame_planes(i420, target_width, target_height, pixel_format)):
+            cv2.resize(plane, (resized.shape[1], resized.shape[0]), dst=resized)
+    return cv2.cvtColor(i420.reshape(target_height * 3 // 2, target_width), cv2.COLOR_YUV2BGR_I420)
+
+
+class RenderKernel:
+    """
+    Renders TRACK and LETTERBOX frames into reusable buffers.
+
+    The letterbox geometry and the remap tables that upscale the blurred
+    background into the strips above and below the foreground are computed
+    once per video. The background is cropped and blurred straight at quarter
+    resolution, each thread keeps its own scratch buffers, and output frames
+    come from a pool that callers return them to with release(), so a frame
+    renders without allocating once the pool is warm.
+
+    Frames are raw bgr24 or yuv420p frames (see frame_planes). Each plane is
+    rendered on its own; the half-size chroma planes of yuv420p use the same
+    geometry halved.
+    """
+
+    def __init__(self, input_size, output_size, pixel_format='bgr24'):
+        self.input_width, self.input_height = input_size
+        self.output_width, self.output_height = output_size
+        self.pixel_format = pixel_format
+        output_width, output_height = output_size
+
+        # Foreground: the whole source scaled to the output width, centered vertically
+        scaled_height = int(self.input_height * output_width / self.input_width)
+        y_offset = (output_height - scaled_height) // 2
+
+        # Background: the source columns that cover the output once scaled to its height
+        bg_scale = output_height / self.input_height
+        bg_width = int(self.input_width * bg_scale)
+        bg_x = max(0, round((bg_width - output_width) // 2 / bg_scale))
+        bg_columns = (bg_x, min(self.input_width, bg_x + round(output_width / bg_scale)))
+
+        divisors = (1,) if pixel_format == 'bgr24' else (1, 2, 2)
+        self.planes = [self._plane(divisor, y_offset, scaled_height, bg_columns) for divisor in divisors]
+        self.scratch = threading.local()
+        self.free = queue.SimpleQueue()
+
+    def _plane(self, divisor, y_offset, scaled_height, bg_columns):
+        """Letterbox geometry of a plane `divisor` times smaller than the frame in both directions."""
+        def scaled(value):
+            return -(-value // divisor)
+
+        output_width, output_height = scaled(self.output_width), scaled(self.output_height)
+        foreground = slice(y_offset // divisor, scaled(y_offset + scaled_height))
+        small_size = (max(1, output_width // 4), max(1, output_height // 4))
+
+        # Remap tables from the quarter-resolution background to the rows the foreground leaves uncovered
+        strips = []
+        for rows in (range(0, max(0, foreground.start)), range(foreground.stop, output_height)):
+            if len(rows):
+                map_x, map_y = np.meshgrid(
+                    (np.arange(output_width, dtype=np.float32) + 0.5) * small_size[0] / output_width - 0.5,
+                    (np.asarray(rows, dtype=np.float32) + 0.5) * small_size[1] / output_height - 0.5)
+                strips.append((slice(rows.start, rows.stop), *cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)))
+
+        return {
+            'divisor': divisor,
+            'foreground': foreground,
+            'bg_columns': slice(bg_columns[0] // divisor, scaled(bg_columns[1])),
+            'small_size': small_size,
+            'blur_size': (25 // divisor) | 1,
+            'strips': strips
+        }
+
+    def acquire(self):
+        """Returns an output frame buffer from the pool, allocating one if it is empty."""
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            return frame_buffer(self.output_width, self.output_height, self.pixel_format)
+
+    def release(self, output_frame):
+        """Returns a buffer from render() to the pool once its contents were written."""
+        self.free.put(output_frame)
+
+    def render(self, frame, scene_data, crop_box=None, out=None):
+        """
+        Applies a scene's strategy to one raw frame, writing into `out` (or a pooled buffer).
+
+        crop_box is the frame's crop for TRACK and TRACK_DYNAMIC scenes (see SceneCrops).
+        """
+        if out is None:
+            out = self.acquire()
+        sources = frame_planes(frame, self.input_width, self.input_height, self.pixel_format)
+        targets = frame_planes(out, self.output_width, self.output_height, self.pixel_format)
+
+        if scene_data['strategy'] in ('TRACK', 'TRACK_DYNAMIC'):
+            if crop_box is None:
+                crop_box = calculate_crop_box(scene_data['target_box'], self.input_width, self.input_height)
+            x1, y1, x2, y2 = crop_box
+            for plane, source, target in zip(self.planes, sources, targets):
+                divisor = plane['divisor']
+                crop = source[y1 // divisor:-(-y2 // divisor), x1 // divisor:-(-x2 // divisor)]
+                cv2.resize(crop, (target.shape[1], target.shape[0]), dst=target)
+            return out
+
+        # LETTERBOX: blurred background strips around the sharp, scaled source
+        scratch = self.scratch.__dict__
+        for index, (plane, source, target) in enumerate(zip(self.planes, sources, targets)):
+            if plane['strips']:
+                if index not in scratch:
+                    small_width, small_height = plane['small_size']
+                    scratch[index] = (np.empty((small_height, small_width, *source.shape[2:]), dtype=np.uint8),
+                                      np.empty((small_height, small_width, *source.shape[2:]), dtype=np.uint8))
+                small, blurred = scratch[index]
+                cv2.resize(source[:, plane['bg_columns']], plane['small_size'], dst=small)
+                cv2.GaussianBlur(small, (plane['blur_size'], plane['blur_size']), 0, dst=blurred)
+                for rows, map_xy, map_weights in plane['strips']:
+                    cv2.remap(blurred, map_xy, map_weights, cv2.INTER_LINEAR, dst=target[rows],
+                              borderMode=cv2.BORDER_REPLICATE)
+            foreground = target[plane['foreground']]
+            cv2.resize(source, (foreground.shape[1], foreground.shape[0]), dst=foreground)
+        return out
+
+
+class SceneCrops:
+    """
+    Per-frame crop boxes of tracked scenes, computed once per scene.
+
+    A TRACK scene's box is calculated when the scene is first seen and a
+    TRACK_DYNAMIC scene's path is evaluated for all its frames at once, so a
+    frame's crop is a lookup.
+    """
+
+    def __init__(self, frame_width, frame_height):
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.crop_width = int(frame_height * ASPECT_RATIO)
+        self.scene = None
+        self.crops = None
+
+    def crop_box(self, scene_data, frame_number):
+        """Returns the (x1, y1, x2, y2) crop of one frame, or None for LETTERBOX scenes."""
+        if scene_data is not self.scene:
+            self.scene = scene_data
+            if scene_data['strategy'] == 'TRACK':
+                self.crops = calculate_crop_box(scene_data['target_box'], self.frame_width, self.frame_height)
+            elif scene_data['strategy'] == 'TRACK_DYNAMIC':
+                self.crops = crop_path_positions(scene_data['crop_path'], scene_data['start_frame'],
+                                                 scene_data['end_frame'])
+            else:
+                self.crops = None
+
+        if scene_data['strategy'] != 'TRACK_DYNAMIC':
+            return self.crops
+        x1 = int(self.crops[min(max(frame_number - scene_data['start_frame'], 0), len(self.crops) - 1)])
+        return x1, 0, x1 + self.crop_width, self.frame_height
+
+
+def start_encoder(output_path, width, height, fps, audio_source=None, pixel_format='bgr24',
+                  render_profile='default', faststart=True):
+    """
+    Starts an ffmpeg process that encodes raw frames (bgr24 or yuv420p) from stdin to H.264.
+
+    When audio_source is given, its first audio stream is muxed into the output
+    during the same encode. render_profile picks the x264 settings; faststart
+    is left off for chunks that are joined later.
+    """
+    audio_input = ['-i', audio_source] if audio_source else []
+    command = [
+        'ffmpeg', '-y', '-f', 'rawvideo', '-vcodec', 'rawvideo',
+        '-s', f'{width}x{height}', '-pix_fmt', pixel_format,
+        '-r', str(fps), '-i', '-', *audio_input,
+        '-map', '0:v', *x264_output_args(render_profile), *audio_output_args(audio_source, 1),
+        *mp4_output_args(faststart), output_path
+    ]
+    return subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+class FrameReader:
+    """
+    Decodes a video to raw frames in any pixel format with an ffmpeg process.
+
+    cv2.VideoCapture always converts to BGR; this reads the decoder's own
+    yuv420p planes instead. It mirrors the isOpened/read/release subset of
+    VideoCapture the render loops use, and read() returns frame_buffer arrays.
+    With scale, ffmpeg scales the frames to width x height as it decodes them.
+    """
+
+    def __init__(self, video_path, width, height, pixel_format, start_frame=0, fps=None, scale=False):
+        self.width, self.height, self.pixel_format = width, height, pixel_format
+        # Seek half a frame early so float rounding can never skip the first frame
+        seek_args = ['-ss', f"{(start_frame - 0.5) / fps:.6f}"] if start_frame > 0 else []
+        scale_args = ['-vf', f'scale={width}:{height}:flags=area'] if scale else []
+        command = [
+            'ffmpeg', '-v', 'error', '-nostdin', *seek_args, '-i', video_path, '-map', '0:v:0', *scale_args,
+            '-fps_mode', 'passthrough', '-f', 'rawvideo', '-pix_fmt', pixel_format, '-'
+        ]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.read_stderr = drain_stderr(self.process)
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        """Returns (True, frame), or (False, None) at the end of the video."""
+        frame = frame_buffer(self.width, self.height, self.pixel_format)
+        view = memoryview(frame).cast('B')
+        filled = 0
+        while filled < len(view):
+            count = self.process.stdout.readinto(view[filled:])
+            if not count:
+                self.opened = False
+                if self.process.wait() != 0:
+                    raise IOError(f"FFmpeg decoding failed: {self.read_stderr()}")
+                return False, None
+            filled += count
+        return True, frame
+
+    def release(self):
+        self.opened = False
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.stdout.close()
+        self.process.wait()
+        self.read_stderr()
+
+
+def open_frame_source(video_path, frame_size, pixel_format='bgr24', start_frame=0, fps=None, source_size=None):
+    """
+    Opens a video for reading raw frames of frame_size in pixel_format, positioned at start_frame.
+
+    Full-size bgr24 frames are decoded by cv2.VideoCapture. Other formats, and
+    sources whose source_size differs from frame_size, are read from a
+    FrameReader that decodes and scales in one ffmpeg pass; it needs the
+    source fps to seek.
+    """
+    scale = source_size is not None and tuple(source_size) != tuple(frame_size)
+    if pixel_format == 'bgr24' and not scale:
+        cap = cv2.VideoCapture(video_path)
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        return cap
+    return FrameReader(video_path, *frame_size, pixel_format, start_frame, fps, scale)
+
+
+def _put(q, item, stop):
+    """Puts an item on a bounded queue, giving up once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    """Gets an item from a queue, returning None once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def render_python(input_video, output_path, scenes_analysis, fps, output_size, progress_callback=None,
+                  include_audio=True, workers=RENDER_WORKERS, queue_frames=RENDER_QUEUE_FRAMES, frame_range=None,
+                  pixel_format='bgr24', input_size=None, render_profile='default'):
+    """
+    Renders a scene plan by transforming frames in Python and piping them to ffmpeg.
+
+    Decoding, transforming and writing to the encoder run concurrently: a decoder
+    thread feeds a pool of transform workers, and a writer thread consumes their
+    results in frame order. Every hand-off is a bounded queue, so at most about
+    2 * queue_frames + workers frames are held in memory. The source audio is
+    muxed during the encode unless include_audio is False.
+
+    frame_range=(start_frame, end_frame) renders only that part of the video;
+    end_frame=None reads to the end of the input.
+
+    pixel_format is the raw frame format decoded, transformed and piped to the
+    encoder: 'bgr24' through OpenCV, or 'yuv420p' read from ffmpeg, which skips
+    the conversions to and from BGR and pipes half the bytes.
+
+    input_size is the frame size the scene plan's crops refer to, the source
+    resolution by default; smaller sizes are scaled to as frames are decoded.
+    render_profile picks the encoder settings.
 
     Returns:
-        dict with processing results
+        total frame count reported by the container
     """
-    start_time = time.time()
+    output_width, output_height = output_size
+    source_size = get_video_resolution(input_video)
+    original_width, original_height = input_size or source_size
+    kernel = RenderKernel((original_width, original_height), output_size, pixel_format)
+    ffmpeg_process = start_encoder(output_path, output_width, output_height, fps,
+                                   input_video if include_audio else None, pixel_format, render_profile,
+                                   faststart=frame_range is None)
+    read_stderr = drain_stderr(ffmpeg_process)
+
+    total_frames = get_frame_count(input_video)
+    start_frame, end_frame = frame_range or (0, None)
+    cap = open_frame_source(input_video, (original_width, original_height), pixel_format, start_frame, fps,
+                            source_size)
+    range_frames = (end_frame if end_frame is not None else total_frames) - start_frame
+
+    decoded = queue.Queue(maxsize=queue_frames)
+    transformed = queue.Queue(maxsize=queue_frames)
+    stop = threading.Event()
+    errors = []
+
+    def decode():
+        frame_number = start_frame
+        scene_starts = [scene_data['start_frame'] for scene_data in scenes_analysis]
+        current_scene_index = max(bisect.bisect_right(scene_starts, start_frame) - 1, 0)
+        scene_crops = SceneCrops(original_width, original_height)
+        try:
+            while cap.isOpened() and not stop.is_set():
+                if end_frame is not None and frame_number >= end_frame:
+                    break
+                ret, frame = cap.read()
+                if not ret:
+                    break
+
+                if current_scene_index < len(scenes_analysis) - 1 and \
+                   frame_number >= scenes_analysis[current_scene_index + 1]['start_frame']:
+                    current_scene_index += 1
+
+                scene_data = scenes_analysis[current_scene_index]
+                crop_box = scene_crops.crop_box(scene_data, frame_number)
+                if not _put(decoded, (frame, scene_data, crop_box), stop):
+                    break
+                frame_number += 1
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(decoded, None, stop)
+
+    def write():
+        frame_number = 0
+        try:
+            while True:
+                future = _get(transformed, stop)
+                if future is None:
+                    break
+                output_frame = future.result()
+                ffmpeg_process.stdin.write(output_frame.data)
+                kernel.release(output_frame)
+                frame_number += 1
+
+                if progress_callback and frame_number % 100 == 0:
+                    progress_callback(3, int(frame_number / range_frames * 100), f"Processed {frame_number}/{range_frames} frames")
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    decoder = threading.Thread(target=decode, daemon=True)
+    writer = threading.Thread(target=write, daemon=True)
+    decoder.start()
+    writer.start()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            item = _get(decoded, stop)
+            if item is None:
+                break
+            frame, scene_data, crop_box = item
+            future = executor.submit(kernel.render, frame, scene_data, crop_box)
+            if not _put(transformed, future, stop):
+                break
+        _put(transformed, None, stop)
+        writer.join()
+        stop.set()
+
+    decoder.join()
+    cap.release()
+
+    try:
+        ffmpeg_process.stdin.close()
+    except BrokenPipeError:
+        pass
+    ffmpeg_process.wait()
+    stderr_output = read_stderr()
+
+    if ffmpeg_process.returncode != 0:
+        raise RuntimeError(f"FFmpeg frame processing failed: {stderr_output}")
+    if errors:
+        raise errors[0]
+
+    return total_frames
 
-    # Define temporary file paths
-    base_name = os.path.splitext(output_video)[0]
-    temp_video_output = f"{base_name}_temp_video.mp4"
-    temp_audio_output = f"{base_name}_temp_audio.aac"
 
-    # Clean up previous temp files
-    for f in [temp_video_output, temp_audio_output, output_video]:
-        if os.path.exists(f):
-            os.remove(f)
+def build_scene_plan(scenes_analysis, original_width, original_height):
+    """
+    Reduces scenes_analysis to (start_frame, strategy, crop) tuples for the ffmpeg renderer.
+
+    crop is the (x1, y1, x2, y2) box of a TRACK scene, or the [(frame, box), ...]
+    path nodes of a TRACK_DYNAMIC scene.
+    """
+    crop_width = int(original_height * ASPECT_RATIO)
+    scene_plan = []
+    for scene_data in scenes_analysis:
+        crop_box = None
+        if scene_data['strategy'] == 'TRACK':
+            crop_box = calculate_crop_box(scene_data['target_box'], original_width, original_height)
+        elif scene_data['strategy'] == 'TRACK_DYNAMIC':
+            crop_box = [(frame, (x1, 0, x1 + crop_width, original_height)) for frame, x1 in scene_data['crop_path']]
+        scene_plan.append((scene_data['start_frame'], scene_data['strategy'], crop_box))
+    return scene_plan
+
+
+def available_cores():
+    """Returns the number of CPU cores this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def partition_frames(scenes_analysis, total_frames, chunks):
+    """
+    Splits [0, total_frames) into up to `chunks` contiguous frame ranges of similar length.
+
+    Boundaries snap to the nearest scene cut when one lies within a tenth of a
+    chunk length, so most chunks start on a natural keyframe. Chunks are never
+    shorter than CHUNK_MIN_FRAMES. The last range ends at None (end of input).
+    """
+    chunks = max(1, min(chunks, total_frames // CHUNK_MIN_FRAMES))
+    chunk_length = total_frames / chunks
+    scene_starts = [scene_data['start_frame'] for scene_data in scenes_analysis[1:]]
+
+    boundaries = [0]
+    for i in range(1, chunks):
+        target = int(i * chunk_length)
+        nearest = min(scene_starts, key=lambda start: abs(start - target), default=target)
+        boundary = nearest if abs(nearest - target) <= chunk_length / 10 else target
+        if boundary - boundaries[-1] >= CHUNK_MIN_FRAMES and total_frames - boundary >= CHUNK_MIN_FRAMES:
+            boundaries.append(boundary)
+
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:] + [None])]
+
+
+def render_frame_range(input_video, output_path, scenes_analysis, fps, input_size, output_size, frame_range,
+                       frame_count=0, render_backend='python', progress_callback=None, workers=RENDER_WORKERS,
+                       pixel_format='bgr24', render_profile='default'):
+    """Renders one video-only frame range of the scene plan with the chosen backend (pixel_format: python only)."""
+    if render_backend == 'ffmpeg':
+        render_scene_plan(input_video, output_path, build_scene_plan(scenes_analysis, *input_size),
+                          input_size, output_size, frame_count, progress_callback,
+                          include_audio=False, frame_range=frame_range, fps=fps,
+                          source_size=get_video_resolution(input_video), render_profile=render_profile)
+    else:
+        render_python(input_video, output_path, scenes_analysis, fps, output_size, progress_callback,
+                      include_audio=False, workers=workers, frame_range=frame_range, pixel_format=pixel_format,
+                      input_size=input_size, render_profile=render_profile)
+
+
+def render_chunked(input_video, output_path, scenes_analysis, fps, input_size, output_size, chunks,
+                   render_backend='python', progress_callback=None, pixel_format='bgr24', render_profile='default'):
+    """
+    Renders frame-range chunks of the scene plan concurrently and joins them losslessly.
+
+    Each chunk seeks to its own start in the input and is encoded by its own
+    ffmpeg process, so N chunks keep N encoders busy. The chunks are joined with
+    ffmpeg's concat demuxer while the source audio is muxed in.
+
+    Returns:
+        total frame count reported by the container
+    """
+    total_frames = get_frame_count(input_video)
+    frame_ranges = partition_frames(scenes_analysis, total_frames, chunks)
+    chunk_dir = tempfile.mkdtemp(prefix='chunks_', dir=os.path.dirname(os.path.abspath(output_path)))
+    chunk_paths = [os.path.join(chunk_dir, f"chunk_{i:04d}.mp4") for i in range(len(frame_ranges))]
+
+    chunk_progress = [0] * len(frame_ranges)
+    chunk_frames = [(end if end is not None else total_frames) - start for start, end in frame_ranges]
+    progress_lock = threading.Lock()
+
+    def chunk_callback(index):
+        def callback(step, progress, message):
+            with progress_lock:
+                chunk_progress[index] = progress
+                overall = sum(p * n for p, n in zip(chunk_progress, chunk_frames)) / max(total_frames, 1)
+            if progress_callback:
+                progress_callback(3, int(overall), f"Rendering {len(frame_ranges)} chunks: {int(overall)}%")
+        return callback
+
+    def render_chunk(index):
+        render_frame_range(input_video, chunk_paths[index], scenes_analysis, fps, input_size, output_size,
+                           frame_ranges[index], chunk_frames[index], render_backend, chunk_callback(index),
+                           workers=max(1, RENDER_WORKERS // len(frame_ranges)), pixel_format=pixel_format,
+                           render_profile=render_profile)
+
+    try:
+        # Encoding happens in the ffmpeg child processes; threads only drive them
+        with ThreadPoolExecutor(max_workers=len(frame_ranges)) as executor:
+            for future in [executor.submit(render_chunk, i) for i in range(len(frame_ranges))]:
+                future.result()
+        concat_chunks(chunk_paths, output_path, input_video)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    return total_frames
+
+
+def single_pass_render(input_video, output_path, progress_callback=None, lookahead=SINGLE_PASS_LOOKAHEAD,
+                       pixel_format='bgr24', input_size=None, render_profile='default',
+                       max_buffer_bytes=SINGLE_PASS_BUFFER_BYTES):
+    """
+    Detects scenes, analyzes them and renders the output from a single decode.
+
+    Decoded frames are held in a lookahead buffer until the scene they belong to
+    has a crop decision. A scene is decided when its closing cut is detected, using
+    its middle frame as in the multi-pass path. Scenes longer than the lookahead are
+    decided from the middle of their first `lookahead` frames instead. The lookahead
+    is shortened to fit `max_buffer_bytes` of decoded frames, but never below
+    SINGLE_PASS_MIN_LOOKAHEAD frames. The source audio is muxed during the encode.
+    With a yuv420p pixel_format only the downscaled scene detection frames and the
+    analyzed frames are converted to BGR.
+
+    An input_size smaller than the source scales frames as they are decoded, so
+    scene detection, analysis and rendering all run on the smaller frames and the
+    returned scenes refer to them. render_profile picks the encoder settings.
+
+    Returns:
+        (scenes_analysis, fps, total_frames, output_size, timings)
+    """
+    timings = {'decode': 0.0, 'scene_detection': 0.0, 'analysis': 0.0, 'render': 0.0}
+
+    cap = cv2.VideoCapture(input_video)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file {input_video}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    source_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    original_width, original_height = input_size or source_size
+    output_width, output_height = get_output_size(original_width, original_height)
+    if pixel_format != 'bgr24' or (original_width, original_height) != source_size:
+        cap.release()
+        cap = open_frame_source(input_video, (original_width, original_height), pixel_format,
+                                source_size=source_size)
+
+    detector = ContentDetector()
+    frame_bytes = frame_buffer(original_width, original_height, pixel_format).nbytes
+    lookahead = max(min(lookahead, max_buffer_bytes // frame_bytes), SINGLE_PASS_MIN_LOOKAHEAD)
+    downscale_factor = compute_downscale_factor(original_width)
+    detect_size = None
+    if downscale_factor > 1:
+        detect_size = (int(original_width / downscale_factor), int(original_height / downscale_factor))
+
+    kernel = RenderKernel((original_width, original_height), (output_width, output_height), pixel_format)
+    scene_crops = SceneCrops(original_width, original_height)
+    output_frame = kernel.acquire()
+
+    ffmpeg_process = start_encoder(output_path, output_width, output_height, fps, input_video, pixel_format,
+                                   render_profile)
+    read_stderr = drain_stderr(ffmpeg_process)
+
+    buffer = deque()
+    scenes_analysis = []
+    scene = {'start_frame': 0, 'end_frame': None, 'analysis': None, 'strategy': None, 'target_box': None}
+
+    def decide(scene, end_frame):
+        middle_frame_number = int(scene['start_frame'] + (end_frame - scene['start_frame']) / 2)
+        frame = buffer[middle_frame_number - buffer[0][0]][1]
+        t = time.time()
+        analysis = analyze_frame(frame_to_bgr(frame, original_width, original_height, pixel_format))
+        scene['analysis'] = analysis
+        scene['strategy'], scene['target_box'] = decide_cropping_strategy(analysis, original_height)
+        timings['analysis'] += time.time() - t
+
+    def flush(until_frame):
+        t = time.time()
+        while buffer and buffer[0][0] < until_frame:
+            frame_number, frame = buffer.popleft()
+            kernel.render(frame, scene, scene_crops.crop_box(scene, frame_number), out=output_frame)
+            ffmpeg_process.stdin.write(output_frame.data)
+        timings['render'] += time.time() - t
+
+    def close_scene(cut_frame):
+        nonlocal scene
+        if scene['strategy'] is None:
+            decide(scene, cut_frame)
+        flush(cut_frame)
+        scene['end_frame'] = cut_frame
+        scenes_analysis.append(scene)
+        scene = {'start_frame': cut_frame, 'end_frame': None, 'analysis': None, 'strategy': None, 'target_box': None}
+
+    frame_number = 0
+    try:
+        while True:
+            t = time.time()
+            ret, frame = cap.read()
+            timings['decode'] += time.time() - t
+            if not ret:
+                break
+
+            buffer.append((frame_number, frame))
+
+            t = time.time()
+            detect_frame = frame_to_bgr(frame, original_width, original_height, pixel_format, detect_size)
+            cuts = detector.process_frame(frame_number, detect_frame)
+            timings['scene_detection'] += time.time() - t
+
+            for cut_frame in sorted(cuts):
+                # A cut behind frames already written is moved to the oldest buffered frame
+                cut_frame = max(cut_frame, buffer[0][0])
+                if cut_frame > scene['start_frame']:
+                    close_scene(cut_frame)
+
+            if len(buffer) > lookahead:
+                if scene['strategy'] is None:
+                    decide(scene, frame_number + 1)
+                flush(frame_number + 1 - lookahead)
+
+            frame_number += 1
+
+            if progress_callback and frame_number % 100 == 0:
+                progress_callback(3, int(frame_number / max(total_frames, 1) * 100),
+                                  f"Processed {frame_number}/{total_frames} frames, {len(scenes_analysis)} scenes")
+
+        t = time.time()
+        for cut_frame in sorted(detector.post_process(frame_number)):
+            cut_frame = max(cut_frame, buffer[0][0]) if buffer else cut_frame
+            if scene['start_frame'] < cut_frame < frame_number:
+                close_scene(cut_frame)
+        timings['scene_detection'] += time.time() - t
+
+        if frame_number > scene['start_frame']:
+            close_scene(frame_number)
+    finally:
+        cap.release()
+        try:
+            ffmpeg_process.stdin.close()
+        except BrokenPipeError:
+            pass
+        ffmpeg_process.wait()
+        stderr_output = read_stderr()
+
+    if ffmpeg_process.returncode != 0:
+        raise RuntimeError(f"FFmpeg frame processing failed: {stderr_output}")
+
+    if not scenes_analysis:
+        raise ValueError("No frames decoded from video")
+    timings['analysis_per_scene'] = timings['analysis'] / len(scenes_analysis)
+
+    return scenes_analysis, fps, frame_number, (output_width, output_height), timings
+
+
+def plan_video(input_video, progress_callback=None, timings=None, scene_detector=SCENE_DETECTOR):
+    """
+    Runs scene detection and analysis (steps 1-2) and decides a crop strategy per scene.
+
+    Args:
+        input_video: Path or URL of the input video
+        progress_callback: Optional callback function(step, progress, message)
+        timings: Optional dict that receives the stage durations in seconds
+        scene_detector: Scene detection backend from options.SCENE_DETECTORS
+
+    Returns:
+        JSON-serializable plan dict with fps, input_size, output_size and scenes
+    """
+    if timings is None:
+        timings = {}
 
     # Step 1: Detect scenes
     if progress_callback:
         progress_callback(1, 0, "Detecting scenes...")
 
-    scenes, fps = detect_scenes(input_video)
+    stage_start = time.time()
+    scenes, fps = detect_scenes(input_video, scene_detector)
+    timings['scene_detection'] = time.time() - stage_start
 
     if not scenes:
         raise ValueError("No scenes detected in video")
@@ -163,143 +1250,177 @@ def process_video(input_video: str, output_video: str, progress_callback=None) -
     if progress_callback:
         progress_callback(2, 0, "Analyzing scene content...")
 
+    stage_start = time.time()
     original_width, original_height = get_video_resolution(input_video)
 
-    OUTPUT_HEIGHT = original_height
-    OUTPUT_WIDTH = int(OUTPUT_HEIGHT * ASPECT_RATIO)
-    if OUTPUT_WIDTH % 2 != 0:
-        OUTPUT_WIDTH += 1
+    analyses = analyze_scenes(input_video, scenes, progress_callback=progress_callback)
 
     scenes_analysis = []
-    for i, (start_time_sc, end_time_sc) in enumerate(scenes):
-        analysis = analyze_scene_content(input_video, start_time_sc, end_time_sc)
+    for (start_frame, end_frame), analysis in zip(scenes, analyses):
         strategy, target_box = decide_cropping_strategy(analysis, original_height)
         scenes_analysis.append({
-            'start_frame': start_time_sc.get_frames(),
-            'end_frame': end_time_sc.get_frames(),
+            'start_frame': start_frame,
+            'end_frame': end_frame,
             'analysis': analysis,
             'strategy': strategy,
             'target_box': target_box
         })
-        if progress_callback:
-            progress_callback(2, int((i + 1) / len(scenes) * 100), f"Analyzed {i + 1}/{len(scenes)} scenes")
+    timings['analysis'] = time.time() - stage_start
+    timings['analysis_per_scene'] = timings['analysis'] / len(scenes)
 
-    # Step 3: Process video frames
-    if progress_callback:
-        progress_callback(3, 0, "Processing video frames...")
+    if DYNAMIC_TRACKING:
+        stage_start = time.time()
+        track_scenes(input_video, scenes_analysis, fps, original_width, original_height, progress_callback)
+        timings['tracking'] = time.time() - stage_start
 
-    command = [
-        'ffmpeg', '-y', '-f', 'rawvideo', '-vcodec', 'rawvideo',
-        '-s', f'{OUTPUT_WIDTH}x{OUTPUT_HEIGHT}', '-pix_fmt', 'bgr24',
-        '-r', str(fps), '-i', '-', '-c:v', 'libx264',
-        '-pix_fmt', 'yuv420p', '-profile:v', 'high', '-level', '4.0',
-        '-preset', 'fast', '-crf', '23', '-an', temp_video_output
-    ]
+    return {
+        'version': PLAN_VERSION,
+        'fps': fps,
+        'input_size': [original_width, original_height],
+        'output_size': list(get_output_size(original_width, original_height)),
+        'scenes': scenes_analysis
+    }
 
-    ffmpeg_process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
 
-    cap = cv2.VideoCapture(input_video)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+def save_plan(plan, plan_path):
+    """Writes a scene plan as compact JSON."""
+    with open(plan_path, 'w') as f:
+        json.dump(plan, f, separators=(',', ':'))
 
-    frame_number = 0
-    current_scene_index = 0
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        if current_scene_index < len(scenes_analysis) - 1 and \
-           frame_number >= scenes_analysis[current_scene_index + 1]['start_frame']:
-            current_scene_index += 1
-
-        scene_data = scenes_analysis[current_scene_index]
-        strategy = scene_data['strategy']
-        target_box = scene_data['target_box']
-
-        if strategy == 'TRACK':
-            crop_box = calculate_crop_box(target_box, original_width, original_height)
-            processed_frame = frame[crop_box[1]:crop_box[3], crop_box[0]:crop_box[2]]
-            output_frame = cv2.resize(processed_frame, (OUTPUT_WIDTH, OUTPUT_HEIGHT))
-        else:  # LETTERBOX
-            # Create blurred background that fills the frame
-            bg_scale = OUTPUT_HEIGHT / original_height
-            bg_width = int(original_width * bg_scale)
-            bg_frame = cv2.resize(frame, (bg_width, OUTPUT_HEIGHT))
-            # Center crop to output width
-            x_offset = (bg_width - OUTPUT_WIDTH) // 2
-            bg_frame = bg_frame[:, x_offset:x_offset + OUTPUT_WIDTH]
-            # Apply blur (downscale, blur, upscale for performance)
-            small = cv2.resize(bg_frame, (OUTPUT_WIDTH // 4, OUTPUT_HEIGHT // 4))
-            blurred_small = cv2.GaussianBlur(small, (25, 25), 0)
-            blurred_bg = cv2.resize(blurred_small, (OUTPUT_WIDTH, OUTPUT_HEIGHT))
-
-            # Scale the main content
-            scale_factor = OUTPUT_WIDTH / original_width
-            scaled_height = int(original_height * scale_factor)
-            scaled_frame = cv2.resize(frame, (OUTPUT_WIDTH, scaled_height))
-
-            # Composite: blurred background + sharp foreground
-            output_frame = blurred_bg.copy()
-            y_offset = (OUTPUT_HEIGHT - scaled_height) // 2
-            output_frame[y_offset:y_offset + scaled_height, :] = scaled_frame
-
-        ffmpeg_process.stdin.write(output_frame.tobytes())
-        frame_number += 1
-
-        if progress_callback and frame_number % 100 == 0:
-            progress_callback(3, int(frame_number / total_frames * 100), f"Processed {frame_number}/{total_frames} frames")
-
-    ffmpeg_process.stdin.close()
-    stderr_output = ffmpeg_process.stderr.read().decode()
-    ffmpeg_process.wait()
-    cap.release()
+def load_plan(plan_path):
+    """Reads a scene plan written by save_plan, rejecting plan versions newer than PLAN_VERSION."""
+    with open(plan_path) as f:
+        plan = json.load(f)
+    if plan.get('version') not in range(1, PLAN_VERSION + 1):
+        raise ValueError(f"Unsupported plan version: {plan.get('version')} (expected at most {PLAN_VERSION})")
+    return plan
 
-    if ffmpeg_process.returncode != 0:
-        raise RuntimeError(f"FFmpeg frame processing failed: {stderr_output}")
 
-    # Step 4: Extract audio
-    if progress_callback:
-        progress_callback(4, 0, "Extracting audio...")
+def is_single_pass(single_pass: bool, render_backend: str, chunks: int) -> bool:
+    """Whether process_video renders in a single decode pass with these settings (and no plan)."""
+    return single_pass and render_backend == 'python' and chunks == 1
 
-    audio_extract_command = [
-        'ffmpeg', '-y', '-i', input_video, '-vn', '-acodec', 'copy', temp_audio_output
-    ]
-    result = subprocess.run(audio_extract_command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
 
-    if result.returncode != 0:
-        raise RuntimeError(f"Audio extraction failed: {result.stderr.decode()}")
+def process_video(input_video: str, output_video: str, progress_callback=None, single_pass: bool = False,
+                  render_backend: str = 'python', chunks: int = 1, plan: dict = None, plan_output: str = None,
+                  pixel_format: str = 'bgr24', scene_detector: str = SCENE_DETECTOR,
+                  render_profile: str = 'default') -> dict:
+    """
+    Process a video from horizontal to vertical format.
 
-    if progress_callback:
-        progress_callback(4, 100, "Audio extracted")
+    Args:
+        input_video: Path or URL of the input video
+        output_video: Path to output video file
+        progress_callback: Optional callback function(step, progress, message)
+        single_pass: Decode the input once, detecting scenes, analyzing them and
+            rendering from the same frames instead of decoding it three times.
+            Only applies to the python render backend without chunking.
+        render_backend: 'python' to transform frames with OpenCV and pipe them to
+            ffmpeg, or 'ffmpeg' to render the whole scene plan as one filtergraph
+        chunks: Number of frame-range chunks to render and encode in parallel.
+            1 renders serially, 0 uses one chunk per available core.
+        plan: Scene plan from an earlier run (see load_plan). Steps 1-2 are
+            skipped and only the render runs.
+        plan_output: Optional path to save the scene plan to, for later re-renders
+        pixel_format: Raw frame format of the python render backend: 'bgr24', or
+            'yuv420p' to decode, crop, scale and encode the planes natively
+        scene_detector: Scene detection backend of step 1: 'content'
+            (PySceneDetect), 'ffmpeg' (select filter scene scores) or 'histogram'
+            (NumPy histogram differences). Single-pass renders always use
+            ContentDetector on the frames they decode.
+        render_profile: Name from options.RENDER_PROFILES, setting the maximum
+            output height and the encoder settings. Taller sources are scaled
+            down as they are decoded, so every later stage handles fewer pixels.
 
-    # Step 5: Merge video and audio
-    if progress_callback:
-        progress_callback(5, 0, "Merging video and audio...")
+    Returns:
+        dict with processing results
+    """
+    if render_backend not in RENDER_BACKENDS:
+        raise ValueError(f"Unknown render backend: {render_backend}")
+    if pixel_format not in PIXEL_FORMATS:
+        raise ValueError(f"Unknown pixel format: {pixel_format}")
+    if scene_detector not in SCENE_DETECTORS:
+        raise ValueError(f"Unknown scene detector: {scene_detector}")
+    if render_profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile: {render_profile}")
 
-    merge_command = [
-        'ffmpeg', '-y', '-i', temp_video_output, '-i', temp_audio_output,
-        '-c:v', 'copy', '-c:a', 'aac', '-movflags', '+faststart', output_video
-    ]
-    result = subprocess.run(merge_command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    start_time = time.time()
 
-    if result.returncode != 0:
-        raise RuntimeError(f"Final merge failed: {result.stderr.decode()}")
+    if os.path.exists(output_video):
+        os.remove(output_video)
 
-    if progress_callback:
-        progress_callback(5, 100, "Complete")
+    if chunks == 0:
+        chunks = available_cores()
 
-    # Clean up temp files
-    for f in [temp_video_output, temp_audio_output]:
-        if os.path.exists(f):
-            os.remove(f)
+    source_size = get_video_resolution(input_video)
+    input_size = scaled_input_size(*source_size, RENDER_PROFILES[render_profile]['max_height'])
+
+    if plan is None and is_single_pass(single_pass, render_backend, chunks):
+        # Steps 1-3: Detect, analyze and render from one decode
+        if progress_callback:
+            progress_callback(1, 0, "Detecting scenes and processing frames in a single pass...")
+
+        scenes_analysis, fps, total_frames, output_size, timings = single_pass_render(
+            input_video, output_video, progress_callback, pixel_format=pixel_format, input_size=input_size,
+            render_profile=render_profile
+        )
+        OUTPUT_WIDTH, OUTPUT_HEIGHT = output_size
+        scenes_detected = len(scenes_analysis)
+        plan = {
+            'version': PLAN_VERSION,
+            'fps': fps,
+            'input_size': list(input_size),
+            'output_size': list(output_size),
+            'scenes': scenes_analysis
+        }
+    else:
+        timings = {}
+
+        # Steps 1-2: Detect and analyze scenes, unless re-rendering an existing plan
+        if plan is None:
+            plan = plan_video(input_video, progress_callback, timings, scene_detector)
+        # The crops are recomputed for the profile's frame size; the saved plan keeps its own
+        render_plan = scale_plan(plan, input_size)
+        scenes_analysis, fps = render_plan['scenes'], render_plan['fps']
+        original_width, original_height = render_plan['input_size']
+        OUTPUT_WIDTH, OUTPUT_HEIGHT = render_plan['output_size']
+        scenes_detected = len(scenes_analysis)
+
+        # Step 3: Process video frames, muxing the source audio in the same encode
+        if progress_callback:
+            progress_callback(3, 0, "Processing video frames...")
+
+        stage_start = time.time()
+        if chunks > 1:
+            total_frames = render_chunked(input_video, output_video, scenes_analysis, fps,
+                                          (original_width, original_height), (OUTPUT_WIDTH, OUTPUT_HEIGHT),
+                                          chunks, render_backend, progress_callback, pixel_format, render_profile)
+        elif render_backend == 'ffmpeg':
+            total_frames = get_frame_count(input_video)
+            render_scene_plan(input_video, output_video, build_scene_plan(scenes_analysis, original_width, original_height),
+                              (original_width, original_height), (OUTPUT_WIDTH, OUTPUT_HEIGHT),
+                              total_frames, progress_callback, source_size=source_size, render_profile=render_profile)
+        else:
+            total_frames = render_python(input_video, output_video, scenes_analysis, fps,
+                                         (OUTPUT_WIDTH, OUTPUT_HEIGHT), progress_callback, pixel_format=pixel_format,
+                                         input_size=(original_width, original_height), render_profile=render_profile)
+        timings['render'] = time.time() - stage_start
+
+    if plan_output:
+        save_plan(plan, plan_output)
+
+    if progress_callback:
+        progress_callback(3, 100, "Complete")
 
     end_time = time.time()
 
     return {
         'output_file': output_video,
-        'scenes_detected': len(scenes),
+        'scenes_detected': scenes_detected,
         'total_frames': total_frames,
         'processing_time': end_time - start_time,
-        'output_resolution': f"{OUTPUT_WIDTH}x{OUTPUT_HEIGHT}"
+        'output_resolution': f"{OUTPUT_WIDTH}x{OUTPUT_HEIGHT}",
+        'render_profile': render_profile,
+        'timings': {stage: round(seconds, 3) for stage, seconds in timings.items()}
     }
@@ -0,0 +1,174 @@
+import os
+import time
+import json
+import asyncio
+import redis
+import redis.asyncio
+from redis_clients import get_client
+
+# Redis shared by workers (publishing) and the API (reading and streaming)
+PROGRESS_REDIS_URL = os.getenv('PROGRESS_REDIS_URL', os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0'))
+
+# Minimum seconds between published updates within one step
+PROGRESS_MIN_INTERVAL = float(os.getenv('PROGRESS_MIN_INTERVAL', '0.5'))
+
+# Seconds a job's progress is kept without updates, e.g. after a worker crash
+PROGRESS_TTL = 24 * 3600
+
+KEY_PREFIX = 'autocrop:progress:'
+CHANNEL_PREFIX = 'autocrop:progress-events:'
+
+
+def publish(job_id: str, update: dict):
+    """Stores a job's latest progress and announces it to stream listeners."""
+    payload = json.dumps(update)
+    try:
+        pipeline = get_client(PROGRESS_REDIS_URL).pipeline()
+        pipeline.set(f"{KEY_PREFIX}{job_id}", payload, ex=PROGRESS_TTL)
+        pipeline.publish(f"{CHANNEL_PREFIX}{job_id}", payload)
+        pipeline.execute()
+    except redis.RedisError as e:
+        print(f"Error publishing progress: {e}")
+
+
+def get(job_id: str) -> dict:
+    """Returns a job's latest published progress, or an empty dict."""
+    try:
+        payload = get_client(PROGRESS_REDIS_URL).get(f"{KEY_PREFIX}{job_id}")
+    except redis.RedisError as e:
+        print(f"Error reading progress: {e}")
+        return {}
+    return json.loads(payload) if payload else {}
+
+
+def finish(job_id: str, status: str):
+    """Clears a job's progress and announces that it ended, so streams can close."""
+    try:
+        pipeline = get_client(PROGRESS_REDIS_URL).pipeline()
+        pipeline.delete(f"{KEY_PREFIX}{job_id}", f"{KEY_PREFIX}{job_id}:chunks", f"{KEY_PREFIX}{job_id}:chunk-frames")
+        pipeline.publish(f"{CHANNEL_PREFIX}{job_id}", json.dumps({'status': status}))
+        pipeline.execute()
+    except redis.RedisError as e:
+        print(f"Error publishing progress: {e}")
+
+
+def callback(job_id: str, total_steps: int = 4, min_interval: float = PROGRESS_MIN_INTERVAL):
+    """
+    Returns a progress callback(step, progress, message) that publishes to Redis.
+
+    Updates within a step are throttled to one per min_interval seconds; the first
+    update of each step and its completion are always published.
+    """
+    last = {'step': None, 'time': 0.0}
+
+    def report(step, progress, message):
+        now = time.monotonic()
+        if step == last['step'] and progress < 100 and now - last['time'] < min_interval:
+            return
+        last['step'] = step
+        last['time'] = now
+        publish(job_id, {'step': step, 'progress': progress, 'message': message, 'total_steps': total_steps})
+
+    return report
+
+
+def start_chunks(job_id: str, chunk_frames: list):
+    """Records the frame counts of a distributed job's chunks for progress aggregation."""
+    try:
+        pipeline = get_client(PROGRESS_REDIS_URL).pipeline()
+        pipeline.set(f"{KEY_PREFIX}{job_id}:chunk-frames", json.dumps(chunk_frames), ex=PROGRESS_TTL)
+        pipeline.delete(f"{KEY_PREFIX}{job_id}:chunks")
+        pipeline.execute()
+    except redis.RedisError as e:
+        print(f"Error publishing progress: {e}")
+
+
+def chunk_callback(job_id: str, index: int, min_interval: float = PROGRESS_MIN_INTERVAL):
+    """
+    Returns a progress callback for one chunk of a distributed job.
+
+    Each update records the chunk's own progress and publishes the job's overall
+    progress, weighted by the number of frames in each chunk.
+    """
+    last = {'time': 0.0}
+
+    def report(step, progress, message):
+        now = time.monotonic()
+        if progress < 100 and now - last['time'] < min_interval:
+            return
+        last['time'] = now
+        try:
+            pipeline = get_client(PROGRESS_REDIS_URL).pipeline()
+            pipeline.hset(f"{KEY_PREFIX}{job_id}:chunks", str(index), progress)
+            pipeline.expire(f"{KEY_PREFIX}{job_id}:chunks", PROGRESS_TTL)
+            pipeline.hgetall(f"{KEY_PREFIX}{job_id}:chunks")
+            pipeline.get(f"{KEY_PREFIX}{job_id}:chunk-frames")
+            _, _, chunk_progress, chunk_frames = pipeline.execute()
+        except redis.RedisError as e:
+            print(f"Error publishing progress: {e}")
+            return
+        if not chunk_frames:
+            return
+
+        chunk_frames = json.loads(chunk_frames)
+        chunk_progress = {int(i): int(p) for i, p in chunk_progress.items()}
+        completed = sum(1 for p in chunk_progress.values() if p >= 100)
+        rendered = sum(frames * chunk_progress.get(i, 0) / 100 for i, frames in enumerate(chunk_frames))
+        overall = int(rendered / max(sum(chunk_frames), 1) * 100)
+        publish(job_id, {
+            'step': 3,
+            'progress': overall,
+            'message': f"Rendered {completed}/{len(chunk_frames)} chunks: {overall}%",
+            'total_steps': 4,
+            'chunks_completed': completed,
+            'chunks_total': len(chunk_frames)
+        })
+
+    return report
+
+
+class ProgressHub:
+    """
+    Fans progress messages from a single Redis subscription out to local listeners.
+
+    One pattern subscription per API process serves every open stream, so the
+    number of Redis connections does not grow with the number of clients.
+    """
+
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self.listeners = {}
+        self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                client = redis.asyncio.Redis.from_url(PROGRESS_REDIS_URL)
+                pubsub = client.pubsub()
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message['type'] != 'pmessage':
+                        continue
+                    job_id = message['channel'].decode()[len(CHANNEL_PREFIX):]
+                    for listener in self.listeners.get(job_id, ()):
+                        if listener.full():
+                            # Only the latest progress matters to a slow client
+                            listener.get_nowait()
+                        listener.put_nowait(json.loads(message['data']))
+            except redis.RedisError as e:
+                print(f"Progress subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        """Returns a queue that receives the job's progress updates."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        listener = asyncio.Queue(maxsize=self.queue_size)
+        self.listeners.setdefault(job_id, set()).add(listener)
+        return listener
+
+    def unsubscribe(self, job_id: str, listener: asyncio.Queue):
+        listeners = self.listeners.get(job_id, set())
+        listeners.discard(listener)
+        if not listeners:
+            self.listeners.pop(job_id, None)
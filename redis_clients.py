@@ -0,0 +1,18 @@
+import threading
+import redis
+
+# Clients are thread-safe and pool their connections, so one per URL is shared
+# by every module and thread of a process
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url: str) -> redis.Redis:
+    """Returns the shared Redis client for a URL, connecting on first use."""
+    client = _clients.get(url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(url)
+            if client is None:
+                client = _clients[url] = redis.Redis.from_url(url)
+    return client
@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import redis
+from redis_clients import get_client
+import s3_storage
+
+# Redis holding the content-hash index; defaults to the Celery result backend
+RESULT_CACHE_URL = os.getenv('RESULT_CACHE_URL', os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0'))
+
+# Seconds an entry lives after its last hit (0 disables the cache)
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', str(7 * 24 * 3600)))
+
+# Bump when a pipeline change alters the output, so older results are not reused
+CACHE_VERSION = 1
+
+# Digest of the output-affecting settings of the workers, published by them for
+# the lookups the API makes before queueing a job
+SETTINGS_KEY = 'autocrop:result:settings'
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def new_hasher():
+    """Returns the hash object used for content addressing, for hashing while streaming."""
+    return hashlib.sha256()
+
+
+def file_hash(path: str) -> str:
+    """Hashes a local file in fixed-size chunks."""
+    hasher = new_hasher()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def settings_digest(settings: dict) -> str:
+    """Returns a short digest of the worker settings that affect a job's output."""
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def publish_settings(digest: str) -> bool:
+    """Records a worker's settings digest as the one the API looks results up under."""
+    try:
+        get_client(RESULT_CACHE_URL).set(SETTINGS_KEY, digest)
+        return True
+    except redis.RedisError as e:
+        print(f"Error publishing result cache settings: {e}")
+        return False
+
+
+def published_settings() -> str:
+    """Returns the settings digest last published by a worker, or None."""
+    try:
+        digest = get_client(RESULT_CACHE_URL).get(SETTINGS_KEY)
+    except redis.RedisError as e:
+        print(f"Error reading result cache settings: {e}")
+        return None
+    return digest.decode() if digest is not None else None
+
+
+def cache_key(content_hash: str, render_backend: str, render_profile: str, digest: str) -> str:
+    """Returns the index key for an input, the parameters and the worker settings that affect its output."""
+    return f"autocrop:result:v{CACHE_VERSION}:{digest}:{content_hash}:{render_backend}:{render_profile}"
+
+
+def lookup(content_hash: str, render_backend: str, render_profile: str = 'default', digest: str = None) -> dict:
+    """
+    Returns the stored result of an identical completed job, or None.
+
+    Workers pass the digest of their own settings; without one (in the API) the
+    digest last published by a worker is used, and nothing is found before one
+    has been published. A hit extends the entry's TTL, so rarely requested
+    results expire first. Entries whose output object no longer exists in S3
+    are dropped.
+    """
+    if not RESULT_CACHE_TTL or not content_hash:
+        return None
+    digest = digest or published_settings()
+    if digest is None:
+        return None
+    key = cache_key(content_hash, render_backend, render_profile, digest)
+    try:
+        cached = get_client(RESULT_CACHE_URL).get(key)
+        if cached is None:
+            return None
+        result = json.loads(cached)
+        if not s3_storage.file_exists(result['output_s3_key']):
+            get_client(RESULT_CACHE_URL).delete(key)
+            return None
+        get_client(RESULT_CACHE_URL).expire(key, RESULT_CACHE_TTL)
+        return result
+    except redis.RedisError as e:
+        print(f"Error reading result cache: {e}")
+        return None
+
+
+def store(content_hash: str, render_backend: str, result: dict, render_profile: str, digest: str) -> bool:
+    """
+    Records a completed job's result under its input hash, parameters and worker settings digest.
+
+    The digest is published again with it, in case Redis lost the one set when the worker started.
+    """
+    if not RESULT_CACHE_TTL or not content_hash:
+        return False
+    try:
+        pipeline = get_client(RESULT_CACHE_URL).pipeline()
+        pipeline.set(cache_key(content_hash, render_backend, render_profile, digest), json.dumps(result),
+                     ex=RESULT_CACHE_TTL)
+        pipeline.set(SETTINGS_KEY, digest)
+        pipeline.execute()
+        return True
+    except redis.RedisError as e:
+        print(f"Error writing result cache: {e}")
+        return False
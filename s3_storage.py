@@ -1,17 +1,68 @@
 import os
+import time
+import asyncio
+import threading
+import functools
 import boto3
-from botocore.exceptions import ClientError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from boto3.exceptions import S3TransferFailedError, S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 
-# Initialize S3 client
+BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'c1-scott-scratchdisk')
+S3_PREFIX = os.getenv('S3_PREFIX', 'Billboard/Reframe/')
+
+# Multipart upload part size (S3 requires at least 5 MB for all but the last part)
+S3_PART_SIZE = max(5, int(os.getenv('S3_PART_SIZE_MB', '16'))) * 1024 * 1024
+
+# Parts of one streamed multipart upload sent concurrently
+S3_UPLOAD_CONCURRENCY = int(os.getenv('S3_UPLOAD_CONCURRENCY', '4'))
+
+# Parts of one file upload or download transferred concurrently
+S3_TRANSFER_CONCURRENCY = int(os.getenv('S3_TRANSFER_CONCURRENCY', '10'))
+
+# Pooled HTTP connections shared by every thread using the client
+S3_MAX_POOL_CONNECTIONS = max(int(os.getenv('S3_MAX_POOL_CONNECTIONS', '32')),
+                              S3_TRANSFER_CONCURRENCY, S3_UPLOAD_CONCURRENCY)
+
+# Attempts per request, with backoff, before an S3 call fails
+S3_MAX_ATTEMPTS = int(os.getenv('S3_MAX_ATTEMPTS', '5'))
+
+# Errors an S3 call can end with once botocore's retries are exhausted
+S3_ERRORS = (ClientError, BotoCoreError, S3UploadFailedError, S3TransferFailedError)
+
+# Initialize S3 client; it is thread-safe and shares one connection pool
 s3_client = boto3.client(
     's3',
     aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
     aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_REGION', 'us-east-1')
+    region_name=os.getenv('AWS_REGION', 'us-east-1'),
+    # Optional S3-compatible endpoint, e.g. a local MinIO for development
+    endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+    config=Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        retries={'mode': 'standard', 'max_attempts': S3_MAX_ATTEMPTS},
+        connect_timeout=10,
+        read_timeout=60
+    )
 )
 
-BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'c1-scott-scratchdisk')
-S3_PREFIX = os.getenv('S3_PREFIX', 'Billboard/Reframe/')
+# Multipart settings for file transfers; files below one part go in a single request
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_PART_SIZE,
+    multipart_chunksize=S3_PART_SIZE,
+    max_concurrency=S3_TRANSFER_CONCURRENCY,
+    use_threads=True
+)
+
+# Metrics of the most recent file transfers, oldest first
+recent_transfers = deque(maxlen=256)
+
+# Threads that run blocking S3 calls for async callers
+_async_executor = ThreadPoolExecutor(max_workers=S3_MAX_POOL_CONNECTIONS, thread_name_prefix='s3')
 
 
 def _full_key(s3_key: str) -> str:
@@ -19,24 +70,102 @@ def _full_key(s3_key: str) -> str:
     return f"{S3_PREFIX}{s3_key}"
 
 
-def upload_file(local_path: str, s3_key: str) -> bool:
-    """Upload a file to S3."""
+def _transfer(operation: str, s3_key: str, transfer, metrics: dict = None) -> bool:
+    """
+    Runs a managed transfer and records its metrics.
+
+    `transfer` is called with a progress callback. The recorded metrics are
+    bytes, seconds, latency (seconds until the first bytes moved) and MB/s;
+    they are appended to recent_transfers and copied into `metrics` if given.
+    """
+    lock = threading.Lock()
+    state = {'bytes': 0, 'first': None}
+
+    def callback(amount):
+        with lock:
+            if state['first'] is None:
+                state['first'] = time.monotonic()
+            state['bytes'] += amount
+
+    start = time.monotonic()
+    ok = True
     try:
-        s3_client.upload_file(local_path, BUCKET_NAME, _full_key(s3_key))
-        return True
-    except ClientError as e:
-        print(f"Error uploading to S3: {e}")
-        return False
+        transfer(callback)
+    except S3_ERRORS as e:
+        print(f"Error {operation}ing {s3_key} with S3: {e}")
+        ok = False
+    seconds = time.monotonic() - start
+
+    record = {
+        'operation': operation,
+        'key': s3_key,
+        'ok': ok,
+        'bytes': state['bytes'],
+        'seconds': round(seconds, 3),
+        'latency': round(state['first'] - start, 3) if state['first'] is not None else None,
+        'mb_per_s': round(state['bytes'] / (1024 * 1024) / seconds, 1) if seconds > 0 else None
+    }
+    recent_transfers.append(record)
+    if metrics is not None:
+        metrics.update(record)
+    return ok
+
+
+def upload_file(local_path: str, s3_key: str, tags: dict = None, metrics: dict = None) -> bool:
+    """Upload a file to S3, optionally with object tags, as a parallel multipart upload."""
+    extra_args = {'Tagging': urlencode(tags)} if tags else None
+    return _transfer('upload', s3_key, lambda callback: s3_client.upload_file(
+        local_path, BUCKET_NAME, _full_key(s3_key), ExtraArgs=extra_args, Callback=callback, Config=TRANSFER_CONFIG
+    ), metrics)
+
+
+def download_file(s3_key: str, local_path: str, metrics: dict = None) -> bool:
+    """Download a file from S3 with parallel ranged GETs."""
+    return _transfer('download', s3_key, lambda callback: s3_client.download_file(
+        BUCKET_NAME, _full_key(s3_key), local_path, Callback=callback, Config=TRANSFER_CONFIG
+    ), metrics)
+
+
+def transfer_stats() -> dict:
+    """Summarizes recent_transfers per operation: count, failures, bytes, MB/s and median latency."""
+    stats = {}
+    for operation in ('upload', 'download'):
+        records = [record for record in recent_transfers if record['operation'] == operation]
+        if not records:
+            continue
+        seconds = sum(record['seconds'] for record in records)
+        total_bytes = sum(record['bytes'] for record in records)
+        latencies = sorted(record['latency'] for record in records if record['latency'] is not None)
+        stats[operation] = {
+            'count': len(records),
+            'failed': sum(1 for record in records if not record['ok']),
+            'bytes': total_bytes,
+            'mb_per_s': round(total_bytes / (1024 * 1024) / seconds, 1) if seconds > 0 else None,
+            'median_latency': latencies[len(latencies) // 2] if latencies else None
+        }
+    return stats
 
 
-def download_file(s3_key: str, local_path: str) -> bool:
-    """Download a file from S3."""
+async def run_async(func, *args, **kwargs):
+    """
+    Awaits a blocking s3_storage call without blocking the event loop.
+
+    The call runs on a thread pool sized to the client's connection pool, e.g.
+    `exists = await run_async(file_exists, key)`.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_async_executor, functools.partial(func, *args, **kwargs))
+
+
+def read_range(s3_key: str, start: int, length: int) -> bytes:
+    """Read `length` bytes of a file in S3 from offset `start`, or None on error."""
     try:
-        s3_client.download_file(BUCKET_NAME, _full_key(s3_key), local_path)
-        return True
-    except ClientError as e:
-        print(f"Error downloading from S3: {e}")
-        return False
+        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=_full_key(s3_key),
+                                        Range=f"bytes={start}-{start + length - 1}")
+        return response['Body'].read()
+    except S3_ERRORS as e:
+        print(f"Error reading from S3: {e}")
+        return None
 
 
 def delete_file(s3_key: str) -> bool:
@@ -44,20 +173,79 @@ def delete_file(s3_key: str) -> bool:
     try:
         s3_client.delete_object(Bucket=BUCKET_NAME, Key=_full_key(s3_key))
         return True
-    except ClientError as e:
+    except S3_ERRORS as e:
         print(f"Error deleting from S3: {e}")
         return False
 
 
+def delete_files(s3_keys: list) -> bool:
+    """Delete several files from S3 with batched requests of up to 1000 keys."""
+    ok = True
+    for start in range(0, len(s3_keys), 1000):
+        batch = s3_keys[start:start + 1000]
+        try:
+            response = s3_client.delete_objects(
+                Bucket=BUCKET_NAME,
+                Delete={'Objects': [{'Key': _full_key(key)} for key in batch], 'Quiet': True}
+            )
+        except S3_ERRORS as e:
+            print(f"Error deleting from S3: {e}")
+            ok = False
+            continue
+        for error in response.get('Errors', []):
+            print(f"Error deleting {error['Key']} from S3: {error['Message']}")
+            ok = False
+    return ok
+
+
+def copy_file(source_key: str, s3_key: str) -> bool:
+    """
+    Copy a file within the bucket, server-side, keeping its tags.
+
+    Objects up to 5 GB are copied with a single CopyObject request; larger ones
+    fall back to a managed multipart copy.
+    """
+    copy_source = {'Bucket': BUCKET_NAME, 'Key': _full_key(source_key)}
+    try:
+        s3_client.copy_object(CopySource=copy_source, Bucket=BUCKET_NAME, Key=_full_key(s3_key))
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidRequest':
+            print(f"Error copying in S3: {e}")
+            return False
+    except S3_ERRORS as e:
+        print(f"Error copying in S3: {e}")
+        return False
+
+    # Too large for CopyObject; multipart copies do not carry tags over
+    try:
+        tags = get_tags(source_key)
+        extra_args = {'Tagging': urlencode(tags)} if tags else None
+        s3_client.copy(copy_source, BUCKET_NAME, _full_key(s3_key), ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
+        return True
+    except S3_ERRORS as e:
+        print(f"Error copying in S3: {e}")
+        return False
+
+
 def file_exists(s3_key: str) -> bool:
     """Check if a file exists in S3."""
     try:
         s3_client.head_object(Bucket=BUCKET_NAME, Key=_full_key(s3_key))
         return True
-    except ClientError:
+    except S3_ERRORS:
         return False
 
 
+def get_tags(s3_key: str) -> dict:
+    """Return the tags of a file in S3, or None if it does not exist."""
+    try:
+        response = s3_client.get_object_tagging(Bucket=BUCKET_NAME, Key=_full_key(s3_key))
+        return {tag['Key']: tag['Value'] for tag in response['TagSet']}
+    except S3_ERRORS:
+        return None
+
+
 def generate_presigned_url(s3_key: str, expiration: int = 3600) -> str:
     """Generate a presigned URL for downloading a file."""
     try:
@@ -67,6 +255,87 @@ def generate_presigned_url(s3_key: str, expiration: int = 3600) -> str:
             ExpiresIn=expiration
         )
         return url
-    except ClientError as e:
+    except S3_ERRORS as e:
         print(f"Error generating presigned URL: {e}")
         return None
+
+
+class MultipartUpload:
+    """
+    An S3 multipart upload whose parts are sent one call at a time.
+
+    Parts may be uploaded from several threads at once; the caller collects the
+    returned part records and passes them to complete() in any order.
+    """
+
+    def __init__(self, s3_key: str):
+        self.s3_key = s3_key
+        response = s3_client.create_multipart_upload(Bucket=BUCKET_NAME, Key=_full_key(s3_key))
+        self.upload_id = response['UploadId']
+
+    def upload_part(self, part_number: int, data: bytes) -> dict:
+        """Uploads one part (numbered from 1) and returns its part record."""
+        response = s3_client.upload_part(
+            Bucket=BUCKET_NAME, Key=_full_key(self.s3_key), UploadId=self.upload_id,
+            PartNumber=part_number, Body=data
+        )
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def complete(self, parts: list, tags: dict = None):
+        """Assembles the uploaded parts into the object, then applies any tags."""
+        s3_client.complete_multipart_upload(
+            Bucket=BUCKET_NAME, Key=_full_key(self.s3_key), UploadId=self.upload_id,
+            MultipartUpload={'Parts': sorted(parts, key=lambda part: part['PartNumber'])}
+        )
+        if tags:
+            s3_client.put_object_tagging(
+                Bucket=BUCKET_NAME, Key=_full_key(self.s3_key),
+                Tagging={'TagSet': [{'Key': key, 'Value': value} for key, value in tags.items()]}
+            )
+
+    def abort(self):
+        """Discards the upload and every part sent so far."""
+        try:
+            s3_client.abort_multipart_upload(Bucket=BUCKET_NAME, Key=_full_key(self.s3_key), UploadId=self.upload_id)
+        except S3_ERRORS as e:
+            print(f"Error aborting S3 upload: {e}")
+
+
+def upload_chunks(chunks, s3_key: str, part_size: int = S3_PART_SIZE,
+                  concurrency: int = S3_UPLOAD_CONCURRENCY):
+    """
+    Uploads an iterable of byte chunks to S3 as a multipart upload.
+
+    Chunks are regrouped into parts of part_size bytes, with up to `concurrency`
+    parts uploading at once, so memory stays bounded whatever the total size.
+    The upload is aborted if the iterable or any part fails.
+
+    Returns:
+        (MultipartUpload, part records) ready for MultipartUpload.complete()
+    """
+    upload = MultipartUpload(s3_key)
+    parts = []
+    in_flight = deque()
+    buffer = bytearray()
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            def send(data):
+                if len(in_flight) >= concurrency:
+                    parts.append(in_flight.popleft().result())
+                in_flight.append(executor.submit(upload.upload_part, len(parts) + len(in_flight) + 1, data))
+
+            for chunk in chunks:
+                buffer.extend(chunk)
+                while len(buffer) >= part_size:
+                    send(bytes(buffer[:part_size]))
+                    del buffer[:part_size]
+            if buffer or not (parts or in_flight):
+                send(bytes(buffer))
+            while in_flight:
+                parts.append(in_flight.popleft().result())
+    except BaseException:
+        upload.abort()
+        raise
+
+    return upload, parts
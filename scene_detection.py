@@ -0,0 +1,182 @@
+import os
+import re
+import subprocess
+from collections import deque
+import cv2
+import numpy as np
+from scenedetect import VideoManager, SceneManager
+from scenedetect.detectors import ContentDetector
+from ffmpeg_render import drain_stderr
+from options import SCENE_DETECTORS
+
+# Scene detector run over the whole input before analysis: 'content' is
+# PySceneDetect's ContentDetector, 'ffmpeg' the scene scores of ffmpeg's select
+# filter, 'histogram' color histogram differences computed in NumPy
+SCENE_DETECTOR = os.getenv('SCENE_DETECTOR', 'content')
+
+# Cuts closer than this to the previous one are dropped, as ContentDetector's min_scene_len does
+MIN_SCENE_FRAMES = 15
+
+# ffmpeg scene score (0-1) above which a frame starts a new scene, and the width
+# frames are scaled to before scoring
+FFMPEG_SCENE_THRESHOLD = 0.3
+FFMPEG_SCENE_WIDTH = 320
+
+# Histogram detector: frames are decoded at HISTOGRAM_SIZE, every HISTOGRAM_FRAME_SKIP-th
+# one is compared with the previous sample, and a cut is reported when the mean
+# histogram distance of the color channels (0-1) exceeds HISTOGRAM_THRESHOLD
+HISTOGRAM_SIZE = (64, 36)
+HISTOGRAM_BINS = 16
+HISTOGRAM_FRAME_SKIP = 2
+HISTOGRAM_THRESHOLD = 0.35
+HISTOGRAM_BATCH_FRAMES = 256
+
+PTS_TIME = re.compile(r'pts_time:\s*([0-9.]+)')
+
+
+def video_info(video_path):
+    """Returns (fps, frame count) from the container."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return fps, total_frames
+
+
+def scenes_from_cuts(cuts, total_frames, min_scene_frames=MIN_SCENE_FRAMES):
+    """
+    Turns cut frame numbers into (start_frame, end_frame) scenes, end exclusive.
+
+    Like PySceneDetect's scene list, a video without cuts has no scenes.
+    """
+    kept = []
+    for cut in sorted(cuts):
+        if min_scene_frames <= cut <= total_frames - 1 and cut - (kept[-1] if kept else 0) >= min_scene_frames:
+            kept.append(cut)
+    if not kept:
+        return []
+    bounds = [0, *kept, total_frames]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def detect_content(video_path):
+    """Scenes found by PySceneDetect's ContentDetector on its default downscaled frames."""
+    video_manager = VideoManager([video_path])
+    scene_manager = SceneManager()
+    scene_manager.add_detector(ContentDetector())
+    video_manager.set_downscale_factor()
+    video_manager.start()
+    scene_manager.detect_scenes(frame_source=video_manager)
+    scene_list = scene_manager.get_scene_list()
+    fps = video_manager.get_framerate()
+    video_manager.release()
+    return [(start.get_frames(), end.get_frames()) for start, end in scene_list], fps
+
+
+def detect_ffmpeg(video_path, threshold=FFMPEG_SCENE_THRESHOLD, width=FFMPEG_SCENE_WIDTH):
+    """
+    Scenes cut where ffmpeg's scene score exceeds `threshold`.
+
+    ffmpeg decodes and scores the frames itself; showinfo logs the timestamp of
+    every frame select lets through, which is converted back to a frame number.
+    """
+    fps, total_frames = video_info(video_path)
+    command = [
+        'ffmpeg', '-hide_banner', '-nostats', '-nostdin', '-i', video_path, '-map', '0:v:0', '-an', '-sn', '-dn',
+        '-vf', f"scale={width}:-2,select='gt(scene,{threshold})',showinfo", '-f', 'null', '-'
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    cuts = []
+    log_tail = deque(maxlen=20)
+    for line in process.stderr:
+        line = line.decode(errors='replace')
+        if 'Parsed_showinfo' in line:
+            match = PTS_TIME.search(line)
+            if match:
+                cuts.append(round(float(match.group(1)) * fps))
+        else:
+            log_tail.append(line)
+    if process.wait() != 0:
+        raise RuntimeError(f"FFmpeg scene detection failed: {''.join(log_tail)}")
+    return scenes_from_cuts(cuts, total_frames), fps
+
+
+def channel_histograms(frames, bins=HISTOGRAM_BINS):
+    """Normalized per-channel histograms of a batch of BGR frames, shape (frames, 3 * bins)."""
+    count, height, width, channels = frames.shape
+    shift = 8 - int(np.log2(bins))
+    indices = (frames >> shift).astype(np.intp) + np.arange(channels) * bins
+    indices += (np.arange(count) * channels * bins)[:, None, None, None]
+    histograms = np.bincount(indices.ravel(), minlength=count * channels * bins)
+    return histograms.reshape(count, channels * bins) / (height * width)
+
+
+def detect_histogram(video_path, threshold=HISTOGRAM_THRESHOLD, frame_skip=HISTOGRAM_FRAME_SKIP,
+                     size=HISTOGRAM_SIZE, batch_frames=HISTOGRAM_BATCH_FRAMES):
+    """
+    Scenes cut where the color histograms of consecutive sampled frames diverge.
+
+    ffmpeg decodes the video, drops all but every `frame_skip`-th frame before
+    scaling it to `size`, and pipes the tiny frames; histograms and distances
+    are computed per batch in NumPy. A cut lands on the first sample after it,
+    up to frame_skip - 1 frames late.
+    """
+    fps, total_frames = video_info(video_path)
+    width, height = size
+    frame_bytes = width * height * 3
+    command = [
+        'ffmpeg', '-v', 'error', '-nostdin', '-i', video_path, '-map', '0:v:0', '-an', '-sn', '-dn',
+        '-vf', f"select='not(mod(n\\,{frame_skip}))',scale={width}:{height}:flags=area",
+        '-fps_mode', 'passthrough', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-'
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    read_stderr = drain_stderr(process)
+
+    cuts = []
+    previous = None
+    sample = 0
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes * batch_frames)
+            count = len(data) // frame_bytes
+            if not count:
+                break
+            frames = np.frombuffer(data, dtype=np.uint8, count=count * frame_bytes).reshape(count, height, width, 3)
+            histograms = channel_histograms(frames)
+            if previous is not None:
+                histograms = np.vstack((previous, histograms))
+            # Half the L1 distance per channel is the share of pixels that changed bins
+            distances = np.abs(np.diff(histograms, axis=0)).sum(axis=1) / 6
+            first = sample if previous is not None else sample + 1
+            cuts.extend((first + np.flatnonzero(distances > threshold)) * frame_skip)
+            previous = histograms[-1:]
+            sample += count
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        process.wait()
+        stderr_output = read_stderr()
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg decoding failed: {stderr_output}")
+
+    return scenes_from_cuts([int(cut) for cut in cuts], total_frames), fps
+
+
+def detect_scenes(video_path, backend=SCENE_DETECTOR):
+    """
+    Detects scenes with a backend from options.SCENE_DETECTORS.
+
+    Returns:
+        ([(start_frame, end_frame), ...], fps), end frames exclusive
+    """
+    if backend == 'content':
+        return detect_content(video_path)
+    if backend == 'ffmpeg':
+        return detect_ffmpeg(video_path)
+    if backend == 'histogram':
+        return detect_histogram(video_path)
+    raise ValueError(f"Unknown scene detector: {backend} (expected one of {', '.join(SCENE_DETECTORS)})")
@@ -1,10 +1,23 @@
 import os
+import gc
+import time
+import shutil
 import tempfile
 import requests
 from pathlib import Path
-from celery import Celery
-from processor import process_video
+from celery import Celery, chord
+from celery.concurrency import get_implementation
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.signals import worker_init, worker_process_init
+from concurrent.futures import ThreadPoolExecutor
+from ffmpeg_render import concat_chunks
 import s3_storage
+import result_cache
+import progress
+import job_store
+
+# processor (OpenCV, PySceneDetect and, on first use, torch) is imported inside the
+# tasks that need it, so the API can import this module for the task signatures alone.
 
 # Configure Celery
 celery_app = Celery(
@@ -23,28 +36,277 @@ celery_app.conf.update(
     result_extended=True,
 )
 
-# Storage for job progress
-job_progress = {}
+# Decode each input once for scene detection, analysis and rendering
+SINGLE_PASS_DECODE = os.getenv('SINGLE_PASS_DECODE', 'false').lower() == 'true'
+
+# Frame-range chunks rendered in parallel per job (1 = serial, 0 = one per core)
+RENDER_CHUNKS = int(os.getenv('RENDER_CHUNKS', '1'))
+
+# Raw frame format of the python renderer: bgr24 (OpenCV decode) or yuv420p
+# (ffmpeg decode, planes cropped and scaled natively, half the pipe bandwidth)
+RENDER_PIXEL_FORMAT = os.getenv('RENDER_PIXEL_FORMAT', 'bgr24')
+
+# Frame-range chunks a distributed job is split into, each rendered by its own task
+DISTRIBUTED_CHUNKS = int(os.getenv('DISTRIBUTED_CHUNKS', '8'))
+
+# Seconds without data before a URL input download is abandoned
+URL_READ_TIMEOUT = int(os.getenv('URL_READ_TIMEOUT', '60'))
+
+# How workers read S3 inputs: 'download' fetches the whole file before processing;
+# 'stream' decodes it from a presigned URL so the transfer overlaps the processing
+INPUT_MODE = os.getenv('INPUT_MODE', 'download')
+
+# Seconds a streamed input URL stays valid; a job must finish decoding within it
+INPUT_URL_EXPIRATION = 6 * 3600
+
+# Attempts per chunk before a distributed job fails
+CHUNK_MAX_RETRIES = int(os.getenv('CHUNK_MAX_RETRIES', '3'))
+
+# Load and warm up the detection models in the worker's main process, before the
+# pool forks, so prefork children share one copy of the weights
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'true').lower() == 'true'
+
+# OpenCV/torch threads per pool process (0 = cores divided by worker concurrency)
+MODEL_THREADS = int(os.getenv('MODEL_THREADS', '0'))
 
 # Temp directory for processing
 TEMP_DIR = Path(tempfile.gettempdir()) / "autocrop_worker"
 TEMP_DIR.mkdir(exist_ok=True)
 
 
-def update_progress(job_id):
-    """Returns a progress callback for a specific job."""
-    def callback(step, progress, message):
-        job_progress[job_id] = {
-            'step': step,
-            'progress': progress,
-            'message': message,
-            'total_steps': 5
-        }
-    return callback
+# Threads each pool process uses, decided when the worker starts
+worker_threads = {'count': None}
+
+# Result cache digest of this worker's output settings (see settings_digest)
+worker_settings = {'digest': None}
+
+
+@worker_init.connect
+def preload_models(sender=None, **kwargs):
+    """
+    Prepares the worker's main process before its pool starts.
+
+    Prefork children inherit the warmed-up models through copy-on-write. The
+    parent runs torch single-threaded until then, so no thread pool exists at
+    the fork, and freezes the garbage collector so it never touches (and
+    un-shares) the inherited pages.
+    """
+    from processor import set_thread_count, warm_up_models, gpu_available, available_cores
+
+    concurrency = getattr(sender, 'concurrency', None) or 1
+    worker_threads['count'] = MODEL_THREADS or max(1, available_cores() // concurrency)
+    forking = issubclass(get_implementation(getattr(sender, 'pool_cls', 'prefork')), PreforkPool)
+    set_thread_count(1 if forking else worker_threads['count'])
+
+    if PRELOAD_MODELS and forking and gpu_available():
+        print("CUDA device found; each pool process loads its own models, as CUDA state does not survive a fork")
+    elif PRELOAD_MODELS:
+        seconds = warm_up_models()
+        print(f"Models loaded and warmed up in {seconds:.2f}s "
+              f"({concurrency} processes x {worker_threads['count']} threads)")
+    # Lets the API find results rendered under this worker's settings
+    result_cache.publish_settings(settings_digest())
+    if forking:
+        gc.freeze()
+
+
+@worker_process_init.connect
+def configure_pool_process(**kwargs):
+    """Gives each pool process its share of the cores for OpenCV and torch."""
+    if worker_threads['count']:
+        from processor import set_thread_count
+        set_thread_count(worker_threads['count'])
+
+
+def fetch_input(input_s3_key: str, local_input: Path, source_url: str = None, metrics: dict = None) -> str:
+    """
+    Puts a job's input on local disk.
+
+    Inputs already in S3 are downloaded, recording the transfer in `metrics`.
+    URL inputs are fetched once and streamed into both the local file and S3
+    (under input_s3_key, for retries and re-renders), hashing them on the way.
+
+    Returns:
+        SHA-256 of a URL input, or None for S3 inputs
+    """
+    if source_url is None:
+        if not s3_storage.download_file(input_s3_key, str(local_input), metrics):
+            raise Exception(f"Failed to download input from S3: {input_s3_key}")
+        return None
+
+    hasher = result_cache.new_hasher()
+    try:
+        response = requests.get(source_url, stream=True, timeout=(10, URL_READ_TIMEOUT))
+        response.raise_for_status()
+        with response, open(local_input, 'wb') as f:
+            def tee(chunks):
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    yield chunk
+
+            upload, parts = s3_storage.upload_chunks(tee(response.iter_content(chunk_size=1024 * 1024)), input_s3_key)
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Failed to download video: {str(e)}")
+
+    content_hash = hasher.hexdigest()
+    upload.complete(parts, {'sha256': content_hash})
+    return content_hash
+
+
+def index_before_media(input_s3_key: str, max_boxes: int = 16) -> bool:
+    """
+    Checks whether an MP4/MOV input in S3 has its moov index ahead of the media data.
+
+    Walks the top-level boxes with small ranged reads. Files written without
+    faststart keep the index at the end, and a decoder reading them over HTTP
+    has to fetch the tail before the first frame.
+    """
+    offset = 0
+    for _ in range(max_boxes):
+        header = s3_storage.read_range(input_s3_key, offset, 16)
+        if not header or len(header) < 8:
+            return False
+        size = int.from_bytes(header[:4], 'big')
+        box_type = header[4:8]
+        if box_type == b'moov':
+            return True
+        if box_type == b'mdat':
+            return False
+        if size == 1 and len(header) == 16:
+            size = int.from_bytes(header[8:16], 'big')
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+
+def input_stream_url(input_s3_key: str) -> str:
+    """
+    Returns a presigned URL to decode an S3 input from, or None if it should be downloaded first.
+
+    Only INPUT_MODE=stream streams inputs, and MP4/MOV files without faststart
+    keep the full-download path.
+    """
+    if INPUT_MODE != 'stream':
+        return None
+    if Path(input_s3_key).suffix.lower() in ('.mp4', '.mov') and not index_before_media(input_s3_key):
+        return None
+    return s3_storage.generate_presigned_url(input_s3_key, expiration=INPUT_URL_EXPIRATION)
+
+
+def process_streamed(input_url: str, input_s3_key: str, local_input: Path, output_path: str, plan: dict = None,
+                     download_metrics: dict = None, **options) -> dict:
+    """
+    Runs process_video on an S3 input without waiting for it to download.
+
+    When the job decodes its input only once (a re-render, or a single-pass
+    render), it reads the presigned URL directly. Otherwise the input is
+    downloaded in the background while scene detection and analysis decode the
+    URL, and the render reads the downloaded copy.
+    """
+    from processor import process_video, plan_video, is_single_pass
+
+    if plan is not None or is_single_pass(options.get('single_pass'), options.get('render_backend'),
+                                          options.get('chunks')):
+        return process_video(input_url, output_path, plan=plan, **options)
+
+    timings = {}
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        download = executor.submit(s3_storage.download_file, input_s3_key, str(local_input), download_metrics)
+        plan_start = time.time()
+        plan = plan_video(input_url, options.get('progress_callback'), timings)
+        planning_time = time.time() - plan_start
+        if not download.result():
+            raise Exception(f"Failed to download input from S3: {input_s3_key}")
+
+    result = process_video(str(local_input), output_path, plan=plan, **options)
+    result['processing_time'] += planning_time
+    result['timings'] = {**{stage: round(seconds, 3) for stage, seconds in timings.items()}, **result['timings']}
+    return result
+
+
+def report_step(task, step: int, message: str):
+    """Records the start of a coarse step as task state and as published progress."""
+    meta = {'step': step, 'progress': 0, 'message': message, 'total_steps': 4}
+    task.update_state(state='PROCESSING', meta=meta)
+    progress.publish(task.request.id, meta)
+
+
+def send_webhook(webhook_url, payload, result=None):
+    """POSTs a job payload to a webhook, recording the outcome in `result` if given."""
+    try:
+        response = requests.post(webhook_url, json=payload, timeout=30)
+        if result is not None:
+            result['webhook_sent'] = True
+            result['webhook_status'] = response.status_code
+    except Exception as e:
+        if result is not None:
+            result['webhook_sent'] = False
+            result['webhook_error'] = str(e)
+
+
+def plan_sidecar_key(output_s3_key: str) -> str:
+    """Returns the S3 key of the scene plan stored next to an output."""
+    return f"{os.path.splitext(output_s3_key)[0]}.plan.json"
+
+
+def download_plan(plan_s3_key: str, local_path: Path) -> dict:
+    """Downloads and loads a scene plan sidecar."""
+    from processor import load_plan
+
+    if not s3_storage.download_file(plan_s3_key, str(local_path)):
+        raise Exception(f"Failed to download plan from S3: {plan_s3_key}")
+    return load_plan(str(local_path))
+
+
+def output_settings() -> dict:
+    """This worker's settings that change a job's output, as they take effect."""
+    from processor import (ANALYSIS_SIZE, DETECTOR_BACKEND, DYNAMIC_TRACKING, FACE_DETECTOR, SCENE_DETECTOR,
+                           SINGLE_PASS_BUFFER_BYTES, SINGLE_PASS_LOOKAHEAD)
+    from detectors import FACE_MODEL_PATH, ONNX_MODEL_PATH, YOLO_WEIGHTS, face_detector_backend
+
+    face_detector = face_detector_backend(FACE_DETECTOR)
+    return {
+        'single_pass_decode': SINGLE_PASS_DECODE,
+        'single_pass_lookahead': [SINGLE_PASS_LOOKAHEAD, SINGLE_PASS_BUFFER_BYTES] if SINGLE_PASS_DECODE else None,
+        'scene_detector': SCENE_DETECTOR,
+        'detector_backend': DETECTOR_BACKEND,
+        'detector_model': ONNX_MODEL_PATH if DETECTOR_BACKEND == 'onnx' else YOLO_WEIGHTS,
+        'face_detector': face_detector,
+        'face_model': FACE_MODEL_PATH if face_detector == 'yunet' else None,
+        'analysis_size': ANALYSIS_SIZE,
+        'dynamic_tracking': DYNAMIC_TRACKING,
+        'render_pixel_format': RENDER_PIXEL_FORMAT,
+    }
+
+
+def settings_digest() -> str:
+    """Returns the result cache digest of this worker's output settings, computed once."""
+    if worker_settings['digest'] is None:
+        worker_settings['digest'] = result_cache.settings_digest(output_settings())
+    return worker_settings['digest']
+
+
+def cached_result(job_id: str, content_hash: str, render_backend: str, render_profile: str = 'default',
+                  digest: str = None) -> dict:
+    """
+    Returns the result of an identical completed job relabelled for job_id, or None.
+
+    Workers pass their settings_digest(); the API omits it and looks results up
+    under the digest the workers published.
+    """
+    result = result_cache.lookup(content_hash, render_backend, render_profile, digest)
+    if result is not None:
+        result['job_id'] = job_id
+        result['cached'] = True
+    return result
 
 
 @celery_app.task(bind=True, name='process_video_task')
-def process_video_task(self, input_s3_key: str, output_s3_key: str, webhook_url: str = None):
+def process_video_task(self, input_s3_key: str, output_s3_key: str, webhook_url: str = None,
+                       render_backend: str = 'python', content_hash: str = None, plan_s3_key: str = None,
+                       source_url: str = None, render_profile: str = 'default'):
     """
     Celery task to process video in background.
 
@@ -52,79 +314,100 @@ def process_video_task(self, input_s3_key: str, output_s3_key: str, webhook_url:
         input_s3_key: S3 key for input video
         output_s3_key: S3 key for output video
         webhook_url: Optional URL to POST results when complete
+        render_backend: 'python' or 'ffmpeg' frame renderer
+        content_hash: SHA-256 of the input, if the caller already computed it
+        plan_s3_key: Scene plan sidecar of an earlier job; scene detection and
+            analysis are skipped and only the render runs
+        source_url: URL to fetch the input from; it is stored at input_s3_key
+        render_profile: Output height cap and encoder settings, from options.RENDER_PROFILES
 
     Returns:
         dict with processing results
     """
+    from processor import process_video
+
     job_id = self.request.id
 
     # Local paths for processing
     ext = Path(input_s3_key).suffix
     local_input = TEMP_DIR / f"{job_id}_input{ext}"
     local_output = TEMP_DIR / f"{job_id}_output.mp4"
+    local_plan = TEMP_DIR / f"{job_id}_plan.json"
+
+    # S3 transfer metrics of the input download and output upload
+    transfers = {'input': {}, 'output': {}}
 
     try:
-        # Update task state
-        self.update_state(state='PROCESSING', meta={'step': 1, 'message': 'Downloading from S3...'})
+        # Inputs can only be streamed once their hash is known, as hashing reads the whole file
+        input_url = input_stream_url(input_s3_key) if content_hash and not source_url else None
 
-        # Download input from S3
-        if not s3_storage.download_file(input_s3_key, str(local_input)):
-            raise Exception(f"Failed to download input from S3: {input_s3_key}")
+        if input_url:
+            report_step(self, 1, 'Streaming from S3...')
+        else:
+            report_step(self, 1, 'Downloading from URL...' if source_url else 'Downloading from S3...')
 
-        # Process the video
-        result = process_video(
-            str(local_input),
-            str(local_output),
-            progress_callback=update_progress(job_id)
-        )
+            # Download input from S3, or fetch it from its source URL into S3
+            content_hash = fetch_input(input_s3_key, local_input, source_url, transfers['input']) or content_hash
+            if source_url:
+                job_store.update(job_id, content_hash=content_hash)
+            content_hash = content_hash or result_cache.file_hash(str(local_input))
 
-        # Upload output to S3
-        self.update_state(state='PROCESSING', meta={'step': 5, 'message': 'Uploading to S3...'})
-        if not s3_storage.upload_file(str(local_output), output_s3_key):
-            raise Exception(f"Failed to upload output to S3: {output_s3_key}")
+        # Reuse the output of an identical input that has already been processed
+        result = cached_result(job_id, content_hash, render_backend, render_profile, settings_digest())
 
-        # Clean up local files
-        if local_input.exists():
-            local_input.unlink()
-        if local_output.exists():
-            local_output.unlink()
+        if result is None:
+            plan = download_plan(plan_s3_key, local_plan) if plan_s3_key else None
 
-        # Update result with S3 info
-        result['job_id'] = job_id
-        result['status'] = 'completed'
-        result['output_s3_key'] = output_s3_key
+            # Process the video, saving its scene plan for later re-renders
+            options = dict(
+                progress_callback=progress.callback(job_id),
+                single_pass=SINGLE_PASS_DECODE,
+                render_backend=render_backend,
+                chunks=RENDER_CHUNKS,
+                plan_output=str(local_plan),
+                pixel_format=RENDER_PIXEL_FORMAT,
+                render_profile=render_profile
+            )
+            if input_url:
+                result = process_streamed(input_url, input_s3_key, local_input, str(local_output), plan,
+                                          transfers['input'], **options)
+            else:
+                result = process_video(str(local_input), str(local_output), plan=plan, **options)
+
+            # Upload output and plan sidecar to S3
+            report_step(self, 4, 'Uploading to S3...')
+            if not s3_storage.upload_file(str(local_output), output_s3_key, metrics=transfers['output']):
+                raise Exception(f"Failed to upload output to S3: {output_s3_key}")
+            sidecar_key = plan_sidecar_key(output_s3_key)
+            if not s3_storage.upload_file(str(local_plan), sidecar_key):
+                raise Exception(f"Failed to upload plan to S3: {sidecar_key}")
+
+            # Update result with S3 info
+            result['job_id'] = job_id
+            result['status'] = 'completed'
+            result['input_s3_key'] = input_s3_key
+            result['output_s3_key'] = output_s3_key
+            result['plan_s3_key'] = sidecar_key
+            result['transfers'] = {name: metrics for name, metrics in transfers.items() if metrics}
+            result_cache.store(content_hash, render_backend, result, render_profile, settings_digest())
+
+        # Clean up local files
+        for path in (local_input, local_output, local_plan):
+            if path.exists():
+                path.unlink()
 
         # Send webhook if provided
         if webhook_url:
-            try:
-                webhook_payload = {
-                    'job_id': job_id,
-                    'status': 'completed',
-                    'result': result
-                }
-                response = requests.post(
-                    webhook_url,
-                    json=webhook_payload,
-                    timeout=30
-                )
-                result['webhook_sent'] = True
-                result['webhook_status'] = response.status_code
-            except Exception as e:
-                result['webhook_sent'] = False
-                result['webhook_error'] = str(e)
-
-        # Clean up progress
-        if job_id in job_progress:
-            del job_progress[job_id]
+            send_webhook(webhook_url, {'job_id': job_id, 'status': 'completed', 'result': result}, result)
 
+        progress.finish(job_id, 'completed')
         return result
 
     except Exception as e:
         # Clean up local files on error
-        if local_input.exists():
-            local_input.unlink()
-        if local_output.exists():
-            local_output.unlink()
+        for path in (local_input, local_output, local_plan):
+            if path.exists():
+                path.unlink()
 
         error_result = {
             'job_id': job_id,
@@ -134,22 +417,249 @@ def process_video_task(self, input_s3_key: str, output_s3_key: str, webhook_url:
 
         # Send failure webhook if provided
         if webhook_url:
-            try:
-                requests.post(
-                    webhook_url,
-                    json=error_result,
-                    timeout=30
-                )
-            except:
-                pass
-
-        # Clean up progress
-        if job_id in job_progress:
-            del job_progress[job_id]
+            send_webhook(webhook_url, error_result)
 
+        progress.finish(job_id, 'failed')
         raise
 
 
+def chunk_task_id(job_id: str, index: int) -> str:
+    """Returns the deterministic task id of one chunk of a distributed job."""
+    return f"{job_id}-chunk-{index:04d}"
+
+
+def chunk_s3_key(job_id: str, index: int) -> str:
+    """Returns the S3 key a chunk of a distributed job is uploaded to."""
+    return f"chunks/{job_id}/chunk_{index:04d}.mp4"
+
+
+@celery_app.task(bind=True, name='process_video_distributed_task')
+def process_video_distributed_task(self, input_s3_key: str, output_s3_key: str, webhook_url: str = None,
+                                   render_backend: str = 'python', chunks: int = 0, content_hash: str = None,
+                                   plan_s3_key: str = None, source_url: str = None, render_profile: str = 'default'):
+    """
+    Celery task that plans a video and fans its rendering out across workers.
+
+    Scene detection and analysis run here. The frame range is then split at scene
+    cuts into chunks, and this task is replaced by a chord: one render_chunk_task
+    per chunk followed by finalize_distributed_task, which concatenates the chunks
+    and muxes the audio. The chord body keeps this task's id, so the job id still
+    resolves to the final result.
+
+    Args:
+        input_s3_key: S3 key for input video
+        output_s3_key: S3 key for output video
+        webhook_url: Optional URL to POST results when complete
+        render_backend: 'python' or 'ffmpeg' frame renderer
+        chunks: Number of chunks to render (0 = DISTRIBUTED_CHUNKS)
+        content_hash: SHA-256 of the input, if the caller already computed it
+        plan_s3_key: Scene plan sidecar of an earlier job, to skip scene detection
+            and analysis
+        source_url: URL to fetch the input from; it is stored at input_s3_key
+        render_profile: Output height cap and encoder settings, from options.RENDER_PROFILES
+    """
+    from processor import (plan_video, get_frame_count, get_video_resolution, save_plan, partition_frames,
+                           scale_plan, scaled_input_size)
+    from options import RENDER_PROFILES
+
+    job_id = self.request.id
+
+    ext = Path(input_s3_key).suffix
+    local_input = TEMP_DIR / f"{job_id}_input{ext}"
+    local_plan = TEMP_DIR / f"{job_id}_plan.json"
+
+    try:
+        # Streamed inputs are planned straight from S3 and never downloaded here
+        input_url = input_stream_url(input_s3_key) if content_hash and not source_url else None
+
+        if input_url:
+            report_step(self, 1, 'Streaming from S3...')
+        else:
+            report_step(self, 1, 'Downloading from URL...' if source_url else 'Downloading from S3...')
+            content_hash = fetch_input(input_s3_key, local_input, source_url) or content_hash
+            if source_url:
+                job_store.update(job_id, content_hash=content_hash)
+            content_hash = content_hash or result_cache.file_hash(str(local_input))
+        result = cached_result(job_id, content_hash, render_backend, render_profile, settings_digest())
+        if result is not None:
+            if webhook_url:
+                send_webhook(webhook_url, {'job_id': job_id, 'status': 'completed', 'result': result}, result)
+            progress.finish(job_id, 'completed')
+            return result
+
+        timings = {}
+        if plan_s3_key:
+            plan = download_plan(plan_s3_key, local_plan)
+        else:
+            plan = plan_video(input_url or str(local_input), progress.callback(job_id), timings)
+        total_frames = get_frame_count(input_url or str(local_input))
+        source_size = get_video_resolution(input_url or str(local_input))
+
+        save_plan(plan, str(local_plan))
+        sidecar_key = plan_sidecar_key(output_s3_key)
+        if not s3_storage.upload_file(str(local_plan), sidecar_key):
+            raise Exception(f"Failed to upload plan to S3: {sidecar_key}")
+    except Exception as e:
+        if webhook_url:
+            send_webhook(webhook_url, {'job_id': job_id, 'status': 'failed', 'error': str(e)})
+        progress.finish(job_id, 'failed')
+        raise
+    finally:
+        for path in (local_input, local_plan):
+            if path.exists():
+                path.unlink()
+
+    # Chunks render the plan at the profile's frame size; the sidecar keeps its own
+    input_size = scaled_input_size(*source_size, RENDER_PROFILES[render_profile]['max_height'])
+    plan = scale_plan(plan, input_size)
+    frame_ranges = partition_frames(plan['scenes'], total_frames, chunks or DISTRIBUTED_CHUNKS)
+    chunk_frames = [(end if end is not None else total_frames) - start for start, end in frame_ranges]
+
+    progress.start_chunks(job_id, chunk_frames)
+    report_step(self, 3, f"Rendering {len(frame_ranges)} chunks...")
+
+    job_info = {
+        'scenes_detected': len(plan['scenes']),
+        'total_frames': total_frames,
+        'output_resolution': f"{plan['output_size'][0]}x{plan['output_size'][1]}",
+        'input_s3_key': input_s3_key,
+        'plan_s3_key': sidecar_key,
+        'render_profile': render_profile,
+        'timings': {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    }
+    header = [
+        render_chunk_task.si(job_id, input_s3_key, sidecar_key, input_size, frame_range, index, chunk_frames[index],
+                             render_backend, stream_input=bool(input_url), render_profile=render_profile)
+        .set(task_id=chunk_task_id(job_id, index))
+        for index, frame_range in enumerate(frame_ranges)
+    ]
+    body = finalize_distributed_task.s(job_id, input_s3_key, output_s3_key, job_info, webhook_url,
+                                       render_backend, content_hash, render_profile)
+    body = body.on_error(notify_distributed_failure.s(job_id, webhook_url))
+
+    return self.replace(chord(header, body))
+
+
+@celery_app.task(bind=True, name='render_chunk_task', autoretry_for=(Exception,), retry_backoff=True,
+                 max_retries=CHUNK_MAX_RETRIES)
+def render_chunk_task(self, job_id: str, input_s3_key: str, plan_s3_key: str, input_size: list,
+                      frame_range: list, index: int, frame_count: int, render_backend: str = 'python',
+                      stream_input: bool = False, render_profile: str = 'default'):
+    """
+    Renders one video-only frame range of a distributed job and uploads it to S3.
+
+    The chunk downloads the job's scene plan sidecar and scales it to
+    input_size itself, so the plan never travels through the broker.
+    With stream_input, the chunk seeks into the input over a presigned URL and
+    reads only its own frames instead of downloading the whole input.
+    Failures are retried for this chunk alone, with exponential backoff.
+
+    Returns:
+        S3 key of the rendered chunk
+    """
+    from processor import render_frame_range, scale_plan
+
+    ext = Path(input_s3_key).suffix
+    local_input = TEMP_DIR / f"{job_id}_chunk_{index:04d}_input{ext}"
+    local_output = TEMP_DIR / f"{job_id}_chunk_{index:04d}.mp4"
+    local_plan = TEMP_DIR / f"{job_id}_chunk_{index:04d}_plan.json"
+
+    report = progress.chunk_callback(job_id, index)
+
+    try:
+        plan = scale_plan(download_plan(plan_s3_key, local_plan), input_size)
+        if stream_input:
+            # A fresh URL per attempt, so retries never run into an expired one
+            source = s3_storage.generate_presigned_url(input_s3_key, expiration=INPUT_URL_EXPIRATION)
+            if not source:
+                raise Exception(f"Failed to generate input URL: {input_s3_key}")
+        else:
+            if not s3_storage.download_file(input_s3_key, str(local_input)):
+                raise Exception(f"Failed to download input from S3: {input_s3_key}")
+            source = str(local_input)
+
+        render_frame_range(source, str(local_output), plan['scenes'], plan['fps'],
+                           tuple(plan['input_size']), tuple(plan['output_size']), tuple(frame_range),
+                           frame_count, render_backend, report, pixel_format=RENDER_PIXEL_FORMAT,
+                           render_profile=render_profile)
+
+        output_key = chunk_s3_key(job_id, index)
+        if not s3_storage.upload_file(str(local_output), output_key):
+            raise Exception(f"Failed to upload chunk to S3: {output_key}")
+        report(3, 100, 'Chunk rendered')
+        return output_key
+    finally:
+        for path in (local_input, local_output, local_plan):
+            if path.exists():
+                path.unlink()
+
+
+@celery_app.task(bind=True, name='finalize_distributed_task')
+def finalize_distributed_task(self, chunk_keys: list, job_id: str, input_s3_key: str, output_s3_key: str,
+                              job_info: dict, webhook_url: str = None, render_backend: str = 'python',
+                              content_hash: str = None, render_profile: str = 'default'):
+    """
+    Concatenates the rendered chunks of a distributed job and muxes the source audio.
+
+    Runs as the chord body once every chunk has rendered, under the job's own id.
+
+    Returns:
+        dict with processing results, as returned by process_video_task
+    """
+    start_time = time.time()
+    chunk_dir = TEMP_DIR / f"{job_id}_chunks"
+    chunk_dir.mkdir(exist_ok=True)
+    local_output = TEMP_DIR / f"{job_id}_output.mp4"
+
+    try:
+        report_step(self, 4, 'Joining chunks...')
+
+        chunk_paths = []
+        for key in chunk_keys:
+            chunk_path = chunk_dir / Path(key).name
+            if not s3_storage.download_file(key, str(chunk_path)):
+                raise Exception(f"Failed to download chunk from S3: {key}")
+            chunk_paths.append(str(chunk_path))
+
+        # ffmpeg reads the audio straight from S3 rather than downloading the whole input again
+        audio_url = s3_storage.generate_presigned_url(input_s3_key)
+        if not audio_url:
+            raise Exception(f"Failed to generate input URL: {input_s3_key}")
+        concat_chunks(chunk_paths, str(local_output), audio_url)
+
+        report_step(self, 4, 'Uploading to S3...')
+        if not s3_storage.upload_file(str(local_output), output_s3_key):
+            raise Exception(f"Failed to upload output to S3: {output_s3_key}")
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        if local_output.exists():
+            local_output.unlink()
+
+    s3_storage.delete_files(chunk_keys)
+
+    result = dict(job_info)
+    result['job_id'] = job_id
+    result['status'] = 'completed'
+    result['output_s3_key'] = output_s3_key
+    result['chunks'] = len(chunk_keys)
+    result['timings']['concat'] = round(time.time() - start_time, 3)
+    result_cache.store(content_hash, render_backend, result, render_profile, settings_digest())
+
+    if webhook_url:
+        send_webhook(webhook_url, {'job_id': job_id, 'status': 'completed', 'result': result}, result)
+
+    progress.finish(job_id, 'completed')
+    return result
+
+
+@celery_app.task(name='notify_distributed_failure')
+def notify_distributed_failure(request, exc, traceback, job_id: str, webhook_url: str = None):
+    """Chord error callback that ends a failed distributed job and sends its failure webhook."""
+    if webhook_url:
+        send_webhook(webhook_url, {'job_id': job_id, 'status': 'failed', 'error': str(exc)})
+    progress.finish(job_id, 'failed')
+
+
 def get_job_progress(job_id: str) -> dict:
-    """Get the current progress of a job."""
-    return job_progress.get(job_id, {})
+    """Get the current progress of a job, as last published by its worker."""
+    return progress.get(job_id)
@@ -0,0 +1,163 @@
+import asyncio
+from collections import deque
+import s3_storage
+import result_cache
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Limits on the form fields other than the file, which are held in memory (as
+# Starlette's form parser caps them)
+FIELD_MAX_BYTES = 1024 * 1024
+MAX_FIELDS = 1000
+
+
+async def receive_upload(request, s3_key_for, file_field: str = 'file',
+                         part_size: int = s3_storage.S3_PART_SIZE,
+                         concurrency: int = s3_storage.S3_UPLOAD_CONCURRENCY) -> dict:
+    """
+    Streams the file field of a multipart/form-data request into an S3 multipart upload.
+
+    The body is parsed as it arrives and cut into parts of part_size bytes. Up to
+    `concurrency` parts are uploaded at once on the S3 thread pool, so at most about
+    (concurrency + 1) * part_size bytes of the file are held in memory and nothing
+    is written to local disk. The content hash is computed on the way through.
+
+    The upload is left open so the caller can complete or abort it once it knows
+    the hash; it is aborted here if the request fails part-way.
+
+    Other form fields are kept in memory, up to FIELD_MAX_BYTES each and
+    MAX_FIELDS in all; exceeding either, or sending a second file in
+    file_field, raises ValueError.
+
+    Args:
+        request: Starlette request with a multipart/form-data body
+        s3_key_for: function(filename) returning the S3 key for the upload; it may
+            raise ValueError to reject the file before anything is uploaded
+        file_field: name of the form field carrying the file
+
+    Returns:
+        dict with the open upload, its part records, key, filename, size,
+        content_hash and the other form fields
+    """
+    content_type, params = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in params:
+        raise ValueError("Expected a multipart/form-data request body")
+
+    hasher = result_cache.new_hasher()
+    buffer = bytearray()
+    fields = {}
+    part = {'headers': {}, 'field': b'', 'value': b'', 'name': None, 'filename': None, 'skip': False,
+            'data': bytearray()}
+    upload = {'key': None, 'filename': None, 'size': 0}
+
+    def on_part_begin():
+        part.update(headers={}, field=b'', value=b'', name=None, filename=None, skip=False, data=bytearray())
+
+    def on_header_field(data, start, end):
+        part['field'] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part['value'] += data[start:end]
+
+    def on_header_end():
+        part['headers'][part['field'].lower()] = part['value']
+        part['field'] = b''
+        part['value'] = b''
+
+    def on_headers_finished():
+        _, options = parse_options_header(part['headers'].get(b'content-disposition', b''))
+        part['name'] = options.get(b'name', b'').decode()
+        if part['name'] == file_field and b'filename' in options:
+            if upload['filename'] is not None:
+                raise ValueError(f"Only one file may be sent in field: {file_field}")
+            part['filename'] = options[b'filename'].decode()
+            upload['filename'] = part['filename']
+            # Resolved up front so an unacceptable filename fails before any data is sent
+            upload['key'] = s3_key_for(part['filename'])
+        elif b'filename' in options:
+            # Files in other fields are not buffered
+            part['skip'] = True
+        elif len(fields) >= MAX_FIELDS:
+            raise ValueError(f"Too many form fields (at most {MAX_FIELDS})")
+
+    def on_part_data(data, start, end):
+        if part['skip']:
+            return
+        if part['filename'] is not None:
+            chunk = data[start:end]
+            hasher.update(chunk)
+            buffer.extend(chunk)
+            upload['size'] += end - start
+        else:
+            if len(part['data']) + end - start > FIELD_MAX_BYTES:
+                raise ValueError(f"Form field {part['name']} exceeds {FIELD_MAX_BYTES} bytes")
+            part['data'].extend(data[start:end])
+
+    def on_part_end():
+        if part['filename'] is None and not part['skip'] and part['name']:
+            fields[part['name']] = part['data'].decode()
+
+    parser = MultipartParser(params[b'boundary'], {
+        'on_part_begin': on_part_begin,
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': on_part_end,
+    })
+
+    multipart_upload = None
+    in_flight = deque()
+    parts = []
+
+    async def send_part(data):
+        nonlocal multipart_upload
+        if multipart_upload is None:
+            multipart_upload = await s3_storage.run_async(s3_storage.MultipartUpload, upload['key'])
+        if len(in_flight) >= concurrency:
+            parts.append(await in_flight.popleft())
+        part_number = len(parts) + len(in_flight) + 1
+        in_flight.append(asyncio.ensure_future(s3_storage.run_async(multipart_upload.upload_part, part_number, data)))
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            while len(buffer) >= part_size:
+                data = bytes(buffer[:part_size])
+                del buffer[:part_size]
+                await send_part(data)
+        parser.finalize()
+
+        if upload['filename'] is None:
+            raise ValueError(f"Missing file field: {file_field}")
+        if upload['size'] == 0:
+            raise ValueError("Uploaded file is empty")
+        if buffer or multipart_upload is None:
+            await send_part(bytes(buffer))
+            buffer.clear()
+        while in_flight:
+            parts.append(await in_flight.popleft())
+    except BaseException:
+        # Let running part uploads finish before discarding the upload
+        for future in in_flight:
+            try:
+                await future
+            except Exception:
+                pass
+        if multipart_upload is not None:
+            await s3_storage.run_async(multipart_upload.abort)
+        raise
+
+    return {
+        'upload': multipart_upload,
+        'parts': parts,
+        'key': upload['key'],
+        'filename': upload['filename'],
+        'size': upload['size'],
+        'content_hash': hasher.hexdigest(),
+        'fields': fields
+    }